@@ -58,102 +58,33 @@ source .venv/bin/activate
 # Install dependencies
 pip3 install -r requirements.txt
 
-# Get every subdirectory of ./data
-for dir in ../../data/*/; do
-  if [ -d "$dir" ]; then
-    folder_name=$(basename "$dir")
-    realdir=$(realpath "$dir")
-    echo "Data point: $folder_name"
-    echo "Processing data directory: $realdir"
-    echo "base model: $realdir/base.xml"
-    echo "evolution a: $realdir/evolution_a.xml"
-    echo "evolution b: $realdir/evolution_b.xml"
-    echo move base.xml evolution_a.xml evolution_b.xml to gen/
-
-    echo "Creating gen/${folder_name}..."
-    mkdir -p ../../gen/"$folder_name"
-    realdist=$(realpath ../../gen/"$folder_name")
-
-    echo "Cleaning up gen/${folder_name}..."
-    rm -f "$realdist"/*
-
-    echo "Copying source files to gen/${folder_name}..."
-    cp "$realdir"/base.xml "$realdist"/base.xml
-    cp "$realdir"/evolution_a.xml "$realdist"/evolution_a.xml
-    cp "$realdir"/evolution_b.xml "$realdist"/evolution_b.xml
-
-    cp "../../meta/XSL/graph.xsd" "$realdist"/graph.xsd
-    cp "../../meta/XSL/operations.xsd" "$realdist"/operations.xsd
-
-    echo "Updating base.xml to use local graph.xsd..."
-    sed -i '' 's|\.\./\.\./meta/XSL/graph.xsd|graph.xsd|g' "$realdist"/base.xml
-
-    echo "Updating evolution.xml to use local operations.xsd..."
-    sed -i '' 's|\.\./\.\./meta/XSL/operations.xsd|operations.xsd|g' "$realdist"/evolution_a.xml
-    sed -i '' 's|\.\./\.\./meta/XSL/operations.xsd|operations.xsd|g' "$realdist"/evolution_b.xml
-
-    echo "Generating evolutions for $folder_name..."
-
-    echo "---"
-    echo "Run evolve.py for evolution_a.xml..."
-    output=$(python3 evolve.py "$realdir"/base.xml "$realdist"/graph.xsd "$realdist"/evolution_a.xml "$realdist"/operations.xsd "$realdist"/graph_a.xml ../../meta/XSL/graph_template.xml)
-    echo "$output"
-
-    echo "---"
-    echo "Run evolve.py for evolution_b.xml..."
-    output=$(python3 evolve.py "$realdir"/base.xml "$realdist"/graph.xsd "$realdist"/evolution_b.xml "$realdist"/operations.xsd "$realdist"/graph_b.xml ../../meta/XSL/graph_template.xml)
-    echo "$output"
-
-    echo "---"
-    echo "Done."
-  fi
-done
-
-# Deactivate the virtual environment
-deactivate
-
-echo "---"
-echo "Generation of graph PlantUMl diagrams:"
-
-cd .. 
-cd ./graph_to_puml
-
-# Check if .venv exists and create it if not
-if [ ! -d ".venv" ]; then
-  echo "Python virtual environment not found. Automatically create .venv!"
-  python3 -m venv .venv
+# ./generate.sh --watch keeps running and regenerates the outputs of every data point whose models change
+if [ "$1" == "--watch" ]; then
+  echo "Watching data/ for changes, stop with Ctrl+C..."
+  python3 watch.py ../../data ../../gen ../../meta/XSL --plantuml ../libs/plantuml-lgpl-1.2024.8.jar
+  status=$?
+  deactivate
+  exit $status
 fi
 
-# Activate the virtual environment
-source .venv/bin/activate
-
-# Install dependencies
-pip3 install -r requirements.txt
-
-# Get every subdirectory of ./data
-for gen in ../../gen/*/; do
-  if [ -d "$gen" ]; then
-    folder_name=$(basename "$gen")
-    realdir=$(realpath "$gen")
+# Number of parallel worker processes (override with GENERATE_WORKERS)
+workers=${GENERATE_WORKERS:-$(getconf _NPROCESSORS_ONLN)}
 
-    echo "Data point: $folder_name"
-    echo "Processing generated graphs in directory: $realdir"
-    echo "base model: $realdir/base.xml"
-    echo "evolution a: $realdir/graph_a.xml"
-    echo "evolution b: $realdir/graph_b.xml"
+# Evolve all data points, generate their PlantUML diagrams and render them into PNGs.
+# Data points are independent and processed in parallel, each one logs into gen/<id>/generate.log.
+# All diagrams are rendered by one PlantUML process running alongside the evolution.
+echo "Evolving all data points into gen/ with $workers workers..."
+python3 batch.py ../../data ../../gen ../../meta/XSL --workers "$workers" --plantuml ../libs/plantuml-lgpl-1.2024.8.jar
+status=$?
 
-    echo "Generating PlantUML diagrams for $folder_name..."
-
-    python convert.py "$realdir"/base.xml "$realdir"/graph.xsd "$realdir/"base.puml
-    python convert.py "$realdir"/graph_a.xml "$realdir"/graph.xsd "$realdir/"graph_a.puml
-    python convert.py "$realdir"/graph_b.xml "$realdir"/graph.xsd "$realdir/"graph_b.puml
-
-    echo "Done."
-    echo "Rendering PlantUML diagrams into PNGs for $folder_name..."
+# Deactivate the virtual environment
+deactivate
 
-    java -jar ../libs/plantuml-lgpl-1.2024.8.jar -o "$realdir" "$realdir"/*.puml
-  fi
-done
+if [ $status -ne 0 ]; then
+  echo "---"
+  echo "Generation failed for at least one data point."
+  exit $status
+fi
 
 echo "---"
 echo "Done: Completed all tasks."
\ No newline at end of file
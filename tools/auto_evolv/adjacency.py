@@ -0,0 +1,154 @@
+'''
+Copyright (C) 2024 Karl Kegel
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+'''
+
+from lxml import etree
+import logging
+
+try:
+    import numpy
+except ImportError:
+    # optional, only the array export and analytics.py need NumPy (see requirements-analytics.txt)
+    numpy = None
+
+logger = logging.getLogger(__name__)
+
+NAMESPACE = "{http://mergebench.org/ns}"
+
+def require_numpy():
+    if numpy is None:
+        raise Exception("NumPy is required for adjacency arrays and analytics.py, install it with: "
+                        "pip3 install -r tools/auto_evolv/requirements-analytics.txt")
+
+class Adjacency:
+    '''
+    Array-backed (CSR) adjacency of a graph model. Nodes and groups get the integer ids 0..element_count - 1,
+    the nodes first (in document order), then the groups. node_groups holds the id of the group of every node.
+    The edges leaving element i are the entries offsets[i]:offsets[i + 1] of targets (the ids of their ends),
+    labels (indexes into semantics) and edge_indexes (their position among the edges of the document).
+    Edges referencing a name that is no node or group are not part of the arrays, see dangling_edges.
+    '''
+
+    def __init__(self, names: list[str], node_count: int, node_groups, offsets, targets, labels, edge_indexes,
+                 semantics: list[str], dangling_edges: list[tuple[str, str, str]]):
+        self.names: list[str] = names
+        self.node_count: int = node_count
+        self.node_groups: numpy.ndarray = node_groups
+        self.offsets: numpy.ndarray = offsets
+        self.targets: numpy.ndarray = targets
+        self.labels: numpy.ndarray = labels
+        self.edge_indexes: numpy.ndarray = edge_indexes
+        self.semantics: list[str] = semantics
+        self.dangling_edges: list[tuple[str, str, str]] = dangling_edges
+        self.ids: dict[str, int] = None
+
+    @property
+    def element_count(self) -> int:
+        return len(self.names)
+
+    @property
+    def group_count(self) -> int:
+        return len(self.names) - self.node_count
+
+    @property
+    def edge_count(self) -> int:
+        return len(self.targets)
+
+    def id(self, name: str) -> int:
+        '''
+        Returns the id of the node or group called name or None.
+        '''
+        if self.ids is None:
+            self.ids = {name: index for index, name in enumerate(self.names)}
+        return self.ids.get(name)
+
+    def is_group(self, element: int) -> bool:
+        return element >= self.node_count
+
+    def __str__(self):
+        return "%d nodes, %d groups, %d directed edges (%d dangling), %d semantics" % (
+            self.node_count, self.group_count, self.edge_count, len(self.dangling_edges), len(self.semantics))
+
+def build_adjacency(names: list[str], node_count: int, node_groups: list[int], edges) -> Adjacency:
+    '''
+    Builds the Adjacency of the elements in names (nodes first, node_groups holding the group id of every node)
+    and of the (start, end, semantics) edges in document order.
+    '''
+    require_numpy()
+    ids = {}
+    for index, name in enumerate(names):
+        # a name used twice refers to its first element
+        ids.setdefault(name, index)
+    semantics_ids: dict[str, int] = {}
+    sources = []
+    targets = []
+    labels = []
+    edge_indexes = []
+    dangling_edges = []
+    for index, (start, end, semantics) in enumerate(edges):
+        source = ids.get(start)
+        target = ids.get(end)
+        if source is None or target is None:
+            dangling_edges.append((start, end, semantics))
+            continue
+        label = semantics_ids.get(semantics)
+        if label is None:
+            label = semantics_ids[semantics] = len(semantics_ids)
+        sources.append(source)
+        targets.append(target)
+        labels.append(label)
+        edge_indexes.append(index)
+
+    # a stable sort by source keeps the edges of every element in document order
+    sources = numpy.array(sources, dtype=numpy.int32)
+    order = numpy.argsort(sources, kind="stable")
+    offsets = numpy.zeros(len(names) + 1, dtype=numpy.int64)
+    numpy.cumsum(numpy.bincount(sources, minlength=len(names)), out=offsets[1:])
+    return Adjacency(names, node_count, numpy.array(node_groups, dtype=numpy.int32), offsets,
+                     numpy.array(targets, dtype=numpy.int32)[order], numpy.array(labels, dtype=numpy.int32)[order],
+                     numpy.array(edge_indexes, dtype=numpy.int64)[order], list(semantics_ids), dangling_edges)
+
+def load_adjacency(file_path: str) -> Adjacency:
+    '''
+    Streams the graph model in file_path into an Adjacency without building a Graph. Unlike load_graph,
+    a model with edges between elements that do not exist is loaded, they are reported as dangling edges.
+    '''
+    require_numpy()
+    node_names = []
+    node_groups = []
+    group_names = []
+    edges = []
+    context = etree.iterparse(file_path, events=("start", "end"),
+                              tag=(NAMESPACE + "Group", NAMESPACE + "Node", NAMESPACE + "DirectedEdge"))
+    for action, elem in context:
+        if action == "end":
+            # the consumed elements are discarded, see build_graph
+            elem.clear()
+            while elem.getprevious() is not None:
+                del elem.getparent()[0]
+            continue
+        tag = elem.tag[len(NAMESPACE):]
+        if tag == "Group":
+            group_names.append(elem.get("name"))
+        elif tag == "Node":
+            node_names.append(elem.get("name"))
+            node_groups.append(len(group_names) - 1)
+        else:
+            edges.append((elem.get("start"), elem.get("end"), elem.get("semantics")))
+    node_count = len(node_names)
+    adjacency = build_adjacency(node_names + group_names, node_count, [node_count + group for group in node_groups], edges)
+    logger.info("Loaded adjacency: %s", adjacency)
+    return adjacency
@@ -0,0 +1,161 @@
+'''
+Copyright (C) 2024 Karl Kegel
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+'''
+
+import argparse
+import json
+import logging
+import os
+import sys
+
+from adjacency import Adjacency, load_adjacency, require_numpy
+from evolve import map_data_points, configure_logging, LOG_LEVELS
+
+# fails with the installation instructions instead of an ImportError if NumPy is missing
+require_numpy()
+import numpy
+
+logger = logging.getLogger(__name__)
+
+# the graphs analyzed per data point by the batch command
+DATA_POINT_GRAPHS = ["base.xml", "graph_a.xml", "graph_b.xml"]
+ANALYTICS_FILE_NAME = "analytics.json"
+
+def out_degrees(adjacency: Adjacency) -> numpy.ndarray:
+    return numpy.diff(adjacency.offsets)
+
+def in_degrees(adjacency: Adjacency) -> numpy.ndarray:
+    return numpy.bincount(adjacency.targets, minlength=adjacency.element_count)
+
+def semantics_counts(adjacency: Adjacency) -> dict[str, int]:
+    counts = numpy.bincount(adjacency.labels, minlength=len(adjacency.semantics))
+    return {semantics: int(count) for semantics, count in zip(adjacency.semantics, counts)}
+
+def successors(adjacency: Adjacency, elements: numpy.ndarray) -> numpy.ndarray:
+    '''
+    The ends of all edges leaving the elements, gathered from the CSR arrays in one step.
+    '''
+    starts = adjacency.offsets[elements]
+    counts = adjacency.offsets[elements + 1] - starts
+    total = int(counts.sum())
+    if total == 0:
+        return numpy.empty(0, dtype=adjacency.targets.dtype)
+    # position of every gathered edge: the start of its element's range plus its index within the range
+    shifts = numpy.repeat(starts - (numpy.cumsum(counts) - counts), counts)
+    return adjacency.targets[shifts + numpy.arange(total)]
+
+def reachable(adjacency: Adjacency, sources) -> numpy.ndarray:
+    '''
+    Marks the elements reachable from the source elements (including the sources) over directed edges,
+    one breadth-first level per step.
+    '''
+    visited = numpy.zeros(adjacency.element_count, dtype=bool)
+    frontier = numpy.unique(numpy.asarray(sources, dtype=numpy.int64))
+    visited[frontier] = True
+    while frontier.size:
+        frontier = successors(adjacency, frontier)
+        frontier = numpy.unique(frontier[~visited[frontier]])
+        visited[frontier] = True
+    return visited
+
+def degree_statistics(adjacency: Adjacency, degrees: numpy.ndarray) -> dict:
+    if degrees.size == 0:
+        return {"max": 0, "max_element": None, "mean": 0.0}
+    element = int(numpy.argmax(degrees))
+    return {"max": int(degrees[element]), "max_element": adjacency.names[element], "mean": float(degrees.mean())}
+
+def analyze(adjacency: Adjacency) -> dict:
+    '''
+    Degree, reachability, semantics and dangling reference statistics of one graph.
+    Roots are the elements without incoming edges, elements that are not reachable from any root
+    are only reachable from cycles.
+    '''
+    out_degree = out_degrees(adjacency)
+    in_degree = in_degrees(adjacency)
+    roots = numpy.flatnonzero(in_degree == 0)
+    return {
+        "nodes": adjacency.node_count,
+        "groups": adjacency.group_count,
+        "directed_edges": adjacency.edge_count,
+        "out_degree": degree_statistics(adjacency, out_degree),
+        "in_degree": degree_statistics(adjacency, in_degree),
+        "roots": int(roots.size),
+        "isolated": int(numpy.count_nonzero((in_degree == 0) & (out_degree == 0))),
+        "reachable_from_roots": int(numpy.count_nonzero(reachable(adjacency, roots))),
+        "semantics": semantics_counts(adjacency),
+        "dangling_edges": [list(edge) for edge in adjacency.dangling_edges],
+    }
+
+def analyze_data_point(gen_dir: str) -> dict[str, dict]:
+    '''
+    Analyzes the graphs of one data point in gen/ (see DATA_POINT_GRAPHS) and writes them to gen/<id>/analytics.json.
+    '''
+    reports = {name: analyze(load_adjacency(os.path.join(gen_dir, name))) for name in DATA_POINT_GRAPHS}
+    with open(os.path.join(gen_dir, ANALYTICS_FILE_NAME), "w") as output_file:
+        json.dump(reports, output_file, indent=1)
+    return reports
+
+def _analyze_data_point_in_worker(gen_dir: str) -> tuple[str, str]:
+    try:
+        reports = analyze_data_point(gen_dir)
+    except Exception as e:
+        return None, "%s: %s" % (type(e).__name__, str(e))
+    return ", ".join("%s: %d edges, %d dangling" % (name, report["directed_edges"], len(report["dangling_edges"]))
+                     for name, report in reports.items()), None
+
+def analyze_all(gen_root: str, workers: int = 1) -> int:
+    '''
+    Analyzes every data point in gen_root that has all graphs of DATA_POINT_GRAPHS, returns the number of failures.
+    '''
+    gen_dirs = sorted(entry.path for entry in os.scandir(gen_root) if entry.is_dir()
+                      and all(os.path.isfile(os.path.join(entry.path, name)) for name in DATA_POINT_GRAPHS))
+    failed = map_data_points(_analyze_data_point_in_worker, gen_dirs, workers)
+    logger.info("%d data points analyzed, %d failed", len(gen_dirs), failed)
+    return failed
+
+def main():
+    parser = argparse.ArgumentParser(description="Degree, reachability and semantics statistics of graph models (needs NumPy).")
+    parser.add_argument("--log-level", choices=LOG_LEVELS.keys(), default="info", help="(default: info)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    graph_parser = commands.add_parser("graph", help="analyze one graph model")
+    graph_parser.add_argument("graph_xml", help="the graph model")
+    graph_parser.add_argument("--reachable-from", metavar="NAME", default=None, help="list the elements reachable from this node or group")
+
+    batch_parser = commands.add_parser("batch", help="analyze base, graph_a and graph_b of every data point in gen/ into gen/<id>/analytics.json")
+    batch_parser.add_argument("gen_root", help="the gen/ directory")
+    batch_parser.add_argument("-j", "--workers", type=int, default=os.cpu_count(), help="number of worker processes (default: number of CPUs)")
+
+    args = parser.parse_args()
+    configure_logging(args.log_level)
+
+    if args.command == "batch":
+        return 1 if analyze_all(args.gen_root, args.workers) else 0
+
+    adjacency = load_adjacency(args.graph_xml)
+    if args.reachable_from is None:
+        print(json.dumps(analyze(adjacency), indent=1))
+        return 0
+    source = adjacency.id(args.reachable_from)
+    if source is None:
+        logger.error("No node or group called %s", args.reachable_from)
+        return 1
+    for element in numpy.flatnonzero(reachable(adjacency, [source])):
+        print(adjacency.names[element])
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
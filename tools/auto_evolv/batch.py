@@ -0,0 +1,423 @@
+'''
+Copyright (C) 2024 Karl Kegel
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+'''
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import logging
+import os
+import shutil
+import sys
+
+import adjacency
+import compaction
+import evolve
+import model_cache
+import profiling
+import validation
+from evolve import (Graph, OperationPlan, xml_from_file, load_validated_graph, compile_operations, apply_operations, serialize_graph,
+                    configure_logging, LOG_LEVELS)
+from compaction import compact_operations
+from model_cache import ModelCache
+from profiling import EvolutionProfile, PROFILE_FORMATS, profile_path
+from validation import Schemas, DEFAULT_VALIDATION_CACHE_DIR, add_validation_arguments, hash_files, init_worker, worker_schemas
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "graph_to_puml"))
+import convert
+import render
+from convert import split_puml_to_files, SPLIT_MODES
+from render import PlantUMLRenderer
+
+EVOLUTIONS = ["a", "b"]
+
+# build targets of a data point: the models in data/<id>/ they are generated from,
+# the files they produce in gen/<id>/ and the name of their PlantUML diagram
+TARGET_SOURCES = {
+    "base": ["base.xml"],
+    "a": ["base.xml", "evolution_a.xml"],
+    "b": ["base.xml", "evolution_b.xml"],
+}
+TARGET_OUTPUTS = {
+    "base": ["base.xml", "graph.xsd", "operations.xsd", "base.puml"],
+    "a": ["evolution_a.xml", "graph_a.xml", "graph_a.puml"],
+    "b": ["evolution_b.xml", "graph_b.xml", "graph_b.puml"],
+}
+TARGET_DIAGRAMS = {
+    "base": "base",
+    "a": "graph_a",
+    "b": "graph_b",
+}
+
+# the tool version is the content of the tool sources (this module and every tool module it uses),
+# editing them invalidates all outputs
+TOOL_SOURCES = [os.path.abspath(module.__file__) for module in
+                (sys.modules[__name__], evolve, adjacency, compaction, model_cache, profiling, validation, convert, render)]
+
+LOG_FILE_NAME = "generate.log"
+BUILD_CACHE_FILE_NAME = ".build_cache.json"
+
+logger = logging.getLogger(__name__)
+
+# schemaLocation paths used in data/ and their replacement in gen/
+SCHEMA_LOCATIONS = {
+    "../../meta/XSL/graph.xsd": "graph.xsd",
+    "../../meta/XSL/operations.xsd": "operations.xsd",
+}
+
+class DataPointResult:
+    def __init__(self, name: str):
+        self.name: str = name
+        self.valid_base: bool = None
+        self.valid_evolutions: dict[str, bool] = {}
+        self.rebuilt_targets: list[str] = []
+        # the PlantUML files written for the rebuilt targets, rendered by the caller
+        self.diagrams: list[str] = []
+        self.error: str = None
+        self.log: str = ""
+
+    def is_ok(self) -> bool:
+        return self.error is None
+
+    def __str__(self):
+        res = self.name + ": " + ("OK" if self.is_ok() else "FAILED")
+        if self.is_ok() and not self.rebuilt_targets:
+            return res + " (up to date)"
+        res += " (rebuilt: " + ", ".join(self.rebuilt_targets)
+        if self.valid_base is not None:
+            res += ", valid base: " + str(self.valid_base)
+        for evolution in EVOLUTIONS:
+            if evolution in self.valid_evolutions:
+                res += ", valid evolution_" + evolution + ": " + str(self.valid_evolutions[evolution])
+        res += ")"
+        if self.error is not None:
+            res += " " + self.error
+        return res
+
+class BuildCache:
+    '''
+    Per data point record of the input hash each build target was last generated from,
+    stored as JSON in gen/<id>/.build_cache.json.
+    '''
+
+    def __init__(self, gen_dir: str):
+        self.path: str = os.path.join(gen_dir, BUILD_CACHE_FILE_NAME)
+        self.targets: dict[str, str] = {}
+        try:
+            with open(self.path, "r") as cache_file:
+                self.targets = json.load(cache_file)["targets"]
+        except (OSError, ValueError, KeyError):
+            self.targets = {}
+
+    def is_fresh(self, target: str, key: str, output_paths: list[str]) -> bool:
+        if self.targets.get(target) != key:
+            return False
+        return all(os.path.isfile(path) for path in output_paths)
+
+    def update(self, target: str, key: str):
+        self.targets[target] = key
+
+    def discard(self, target: str):
+        self.targets.pop(target, None)
+
+    def save(self):
+        with open(self.path, "w") as cache_file:
+            json.dump({"targets": self.targets}, cache_file, indent=1, sort_keys=True)
+
+# the tool sources are hashed once per process
+_tool_fingerprint: str = None
+
+def tool_fingerprint() -> str:
+    global _tool_fingerprint
+    if _tool_fingerprint is None:
+        _tool_fingerprint = hash_files(TOOL_SOURCES)
+    return _tool_fingerprint
+
+def target_key(data_point_dir: str, target: str, schemas: Schemas, options: str = "") -> str:
+    sha = hashlib.sha256(schemas.fingerprint.encode())
+    sha.update(tool_fingerprint().encode())
+    sha.update(options.encode())
+    # the validator hashes every unchanged model once per process, for all targets and for validation
+    for name in TARGET_SOURCES[target]:
+        sha.update(schemas.validator.document_hash(os.path.join(data_point_dir, name)).encode())
+    return sha.hexdigest()
+
+def target_outputs(gen_dir: str, target: str, plantuml_jar: str = None) -> list[str]:
+    names = list(TARGET_OUTPUTS[target])
+    if plantuml_jar is not None:
+        names.append(TARGET_DIAGRAMS[target] + ".png")
+    return [os.path.join(gen_dir, name) for name in names]
+
+def list_data_points(data_root: str) -> list[str]:
+    return sorted(entry.name for entry in os.scandir(data_root) if entry.is_dir())
+
+def copy_with_local_schema(source_path: str, target_path: str):
+    with open(source_path, "r", encoding="utf-8") as source_file:
+        content = source_file.read()
+    for old_location, new_location in SCHEMA_LOCATIONS.items():
+        content = content.replace(old_location, new_location)
+    with open(target_path, "w", encoding="utf-8") as target_file:
+        target_file.write(content)
+
+def clean_gen_dir(gen_dir: str):
+    for entry in os.scandir(gen_dir):
+        if entry.is_file():
+            os.remove(entry.path)
+
+@contextlib.contextmanager
+def capture_log(log: io.StringIO):
+    '''
+    Routes all log records emitted within the context into log instead of the console,
+    so that the logs of data points processed concurrently never interleave.
+    '''
+    root_logger = logging.getLogger()
+    handler = logging.StreamHandler(log)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    console_handlers = root_logger.handlers
+    root_logger.handlers = [handler]
+    try:
+        yield
+    finally:
+        root_logger.handlers = console_handlers
+
+def report_data_point(result: DataPointResult):
+    message = "Data point: " + result.name
+    if result.log:
+        message += "\n" + result.log.rstrip("\n")
+    logger.log(logging.INFO if result.is_ok() else logging.ERROR, "%s", message)
+
+def load_profiled_graph(path: str, schemas: Schemas, profile: EvolutionProfile) -> Graph:
+    with profile.stage("parse_and_validate_graph"):
+        return load_validated_graph(path, schemas.graph_xsd_path, schemas.validator)
+
+def load_profiled_plan(path: str, schemas: Schemas, profile: EvolutionProfile) -> OperationPlan:
+    with profile.stage("parse_operations"):
+        operations_xml = xml_from_file(path)
+    with profile.stage("validate_operations"):
+        if not schemas.validator.validate(path, schemas.operations_xsd_path, operations_xml):
+            raise Exception("Invalid %s" % os.path.basename(path))
+    with profile.stage("compile_operations"):
+        return compile_operations(operations_xml)
+
+def process_data_point(data_point_dir: str, gen_dir: str, schemas: Schemas, plantuml_jar: str = None, force: bool = False,
+                       split_threshold: int = None, split_mode: str = "group", profile_format: str = None,
+                       compact: bool = False, models: ModelCache = None) -> DataPointResult:
+    '''
+    Runs the parse -> evolve -> serialize -> puml pipeline for one data point.
+    Only the build targets whose inputs changed since the last run (or whose outputs are missing)
+    are rebuilt, the data point is skipped entirely if all of them are up to date.
+    Rendering the written diagrams (result.diagrams) is left to the caller, plantuml_jar only
+    tells whether PNGs are expected among the outputs.
+    Diagrams with more than split_threshold nodes and edges are split into parts (see convert.split_puml_to_files).
+    With a profile_format, every rebuilt evolution is profiled into gen/<id>/graph_<evolution>_profile.<format>.
+    With compact, redundant operations are removed from the evolutions before they are applied (see compaction).
+    With models, the base graph and the operation plans are taken from (and added to) this cache if unchanged.
+    Everything logged while processing is captured into the result and into gen/<id>/generate.log.
+    '''
+    result = DataPointResult(os.path.basename(data_point_dir))
+    log = io.StringIO()
+    with capture_log(log):
+        try:
+            os.makedirs(gen_dir, exist_ok=True)
+            cache = BuildCache(gen_dir)
+            options = "" if split_threshold is None else "split:%d:%s" % (split_threshold, split_mode)
+            # the evolved graphs depend on compaction as well
+            keys = {target: target_key(data_point_dir, target, schemas, options + (":compact" if compact and target in EVOLUTIONS else ""))
+                    for target in TARGET_SOURCES}
+            stale = [target for target in TARGET_SOURCES
+                     if force or not cache.is_fresh(target, keys[target], target_outputs(gen_dir, target, plantuml_jar))]
+            result.rebuilt_targets = stale
+            if not stale:
+                return result
+
+            if len(stale) == len(TARGET_SOURCES):
+                clean_gen_dir(gen_dir)
+                cache.targets = {}
+            for target in stale:
+                cache.discard(target)
+            cache.save()
+
+            # the base model is parsed once, every evolution works on its own fork of it
+            result.valid_base = False
+            base_profile = EvolutionProfile()
+            base_path = os.path.join(data_point_dir, "base.xml")
+            if models is not None:
+                base_graph = models.graphs.load(base_path, load_profiled_graph, schemas, base_profile)
+            else:
+                base_graph = load_profiled_graph(base_path, schemas, base_profile)
+            result.valid_base = True
+            graphs = {"base": base_graph}
+            profiles = {}
+
+            if "base" in stale:
+                copy_with_local_schema(os.path.join(data_point_dir, "base.xml"), os.path.join(gen_dir, "base.xml"))
+                shutil.copyfile(schemas.graph_xsd_path, os.path.join(gen_dir, "graph.xsd"))
+                shutil.copyfile(schemas.operations_xsd_path, os.path.join(gen_dir, "operations.xsd"))
+
+            for evolution in EVOLUTIONS:
+                if evolution not in stale:
+                    continue
+                file_name = "evolution_%s.xml" % evolution
+                copy_with_local_schema(os.path.join(data_point_dir, file_name), os.path.join(gen_dir, file_name))
+                # the profile of an evolution includes parsing the shared base once
+                profile = profiles[evolution] = EvolutionProfile()
+                profile.stages.update(base_profile.stages)
+                result.valid_evolutions[evolution] = False
+                if models is not None:
+                    plan = models.plans.load(os.path.join(data_point_dir, file_name), load_profiled_plan, schemas, profile)
+                else:
+                    plan = load_profiled_plan(os.path.join(data_point_dir, file_name), schemas, profile)
+                result.valid_evolutions[evolution] = True
+
+                graph = base_graph.fork()
+                if compact:
+                    with profile.stage("compact_operations"):
+                        plan = compact_operations(plan)
+                with profile.stage("apply_operations"):
+                    apply_operations(plan, graph, profile if profile_format is not None else None)
+                with profile.stage("serialize_graph"):
+                    serialize_graph(graph, os.path.join(gen_dir, "graph_%s.xml" % evolution), schemas.template_path)
+                graphs[evolution] = graph
+
+            # the diagrams are written straight from the in-memory graphs, the models are not read back
+            for target in stale:
+                puml_path = os.path.join(gen_dir, TARGET_DIAGRAMS[target] + ".puml")
+                with (profiles[target].stage("write_puml") if target in profiles else contextlib.nullcontext()):
+                    puml_paths = split_puml_to_files(graphs[target], puml_path, split_threshold, split_mode)
+                result.diagrams += puml_paths
+                # an outdated PNG must not survive if rendering the new diagram fails
+                png_path = os.path.join(gen_dir, TARGET_DIAGRAMS[target] + ".png")
+                if os.path.isfile(png_path):
+                    os.remove(png_path)
+
+            if profile_format is not None:
+                for evolution, profile in profiles.items():
+                    profile.write(profile_path(os.path.join(gen_dir, "graph_%s.xml" % evolution), profile_format), profile_format)
+
+            for target in stale:
+                cache.update(target, keys[target])
+            cache.save()
+        except Exception as e:
+            result.error = "%s: %s" % (type(e).__name__, str(e))
+            logger.error("Failed: %s", result.error)
+    result.log = log.getvalue()
+    if os.path.isdir(gen_dir):
+        with open(os.path.join(gen_dir, LOG_FILE_NAME), "w") as log_file:
+            log_file.write(result.log)
+    return result
+
+def _process_data_point_in_worker(data_point_dir: str, gen_dir: str, plantuml_jar: str, force: bool,
+                                  split_threshold: int, split_mode: str, profile_format: str, compact: bool) -> DataPointResult:
+    return process_data_point(data_point_dir, gen_dir, worker_schemas(), plantuml_jar, force, split_threshold, split_mode, profile_format,
+                              compact)
+
+def report_render_failures(results: list[DataPointResult], failures: list):
+    results_by_name = {result.name: result for result in results}
+    for failure in failures:
+        logger.error("Rendering failed: %s", failure)
+        result = results_by_name[failure.job.key]
+        if result.error is None:
+            result.error = "Rendering failed: " + failure.message
+        with open(os.path.join(os.path.dirname(failure.job.puml_path), LOG_FILE_NAME), "a") as log_file:
+            log_file.write("Rendering failed: %s\n" % failure)
+
+def run_batch(data_root: str, gen_root: str, meta_dir: str, workers: int = 1, plantuml_jar: str = None, force: bool = False,
+              split_threshold: int = None, split_mode: str = "group",
+              validation_cache_dir: str = DEFAULT_VALIDATION_CACHE_DIR, profile_format: str = None,
+              compact: bool = False) -> list[DataPointResult]:
+    '''
+    Runs the pipeline for every data point in data_root and writes the outputs to gen_root.
+    With workers == 1 all data points are processed in this interpreter, otherwise they are
+    spread over a pool of worker processes. The schemas are compiled once per process and models
+    validated unchanged before (see Validator) are not validated again.
+    With a plantuml_jar, the diagrams of every finished data point are handed to a single
+    PlantUML process right away, so rendering runs while the next data points are evolved.
+    '''
+    names = list_data_points(data_root)
+    results = []
+    renderer = PlantUMLRenderer(plantuml_jar) if plantuml_jar is not None else None
+
+    def finish(result: DataPointResult):
+        report_data_point(result)
+        results.append(result)
+        if renderer is not None:
+            for puml_path in result.diagrams:
+                renderer.submit(puml_path, key=result.name)
+
+    try:
+        if workers <= 1:
+            schemas = Schemas(meta_dir, validation_cache_dir)
+            for name in names:
+                finish(process_data_point(os.path.join(data_root, name), os.path.join(gen_root, name), schemas, plantuml_jar, force,
+                                          split_threshold, split_mode, profile_format, compact))
+        else:
+            log_level = logging.getLogger().getEffectiveLevel()
+            with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(meta_dir, validation_cache_dir, log_level)) as executor:
+                futures = [executor.submit(_process_data_point_in_worker, os.path.join(data_root, name), os.path.join(gen_root, name), plantuml_jar, force,
+                                           split_threshold, split_mode, profile_format, compact)
+                           for name in names]
+                for future in as_completed(futures):
+                    finish(future.result())
+    finally:
+        if renderer is not None:
+            report_render_failures(results, renderer.close())
+    results.sort(key=lambda result: result.name)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Evolve all data points into gen/ and generate their PlantUML diagrams.")
+    parser.add_argument("data_root", help="the data/ directory containing one folder per data point")
+    parser.add_argument("gen_root", help="the gen/ output directory")
+    parser.add_argument("meta_dir", help="the directory containing graph.xsd, operations.xsd and graph_template.xml")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count(),
+                        help="number of worker processes, 1 processes all data points in this process (default: number of CPUs)")
+    parser.add_argument("--plantuml", metavar="JAR", default=None,
+                        help="render the generated .puml files into PNGs with this PlantUML jar (one PlantUML process for all data points)")
+    parser.add_argument("--split-threshold", type=int, default=None, metavar="N",
+                        help="split diagrams with more than N nodes and edges into parts and an index diagram of the groups")
+    parser.add_argument("--split-mode", choices=SPLIT_MODES, default="group",
+                        help="split per group or per connected component (default: group)")
+    parser.add_argument("-f", "--force", action="store_true",
+                        help="rebuild all data points, ignoring the build cache")
+    parser.add_argument("--log-level", choices=LOG_LEVELS.keys(), default="info",
+                        help="quiet only reports problems, debug also dumps graphs and operations (default: info)")
+    parser.add_argument("--profile", action="store_true",
+                        help="profile every rebuilt evolution into gen/<id>/graph_<evolution>_profile.<format>, "
+                             "combine with --force to profile all data points")
+    parser.add_argument("--profile-format", choices=PROFILE_FORMATS, default="json", help="format of the profile reports (default: json)")
+    parser.add_argument("--compact", action="store_true",
+                        help="remove redundant operations (e.g. a node added and deleted again) from the evolutions before applying them")
+    add_validation_arguments(parser)
+    args = parser.parse_args()
+    configure_logging(args.log_level)
+
+    results = run_batch(args.data_root, args.gen_root, args.meta_dir, args.workers, args.plantuml, args.force,
+                        args.split_threshold, args.split_mode, None if args.no_validation_cache else args.validation_cache,
+                        args.profile_format if args.profile else None, args.compact)
+
+    logger.info("--------------------")
+    logger.info("Summary")
+    for result in results:
+        logger.log(logging.INFO if result.is_ok() else logging.ERROR, "%s", result)
+    failed = [result for result in results if not result.is_ok()]
+    logger.log(logging.INFO if not failed else logging.ERROR, "%d data points, %d failed", len(results), len(failed))
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,302 @@
+'''
+Copyright (C) 2024 Karl Kegel
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+'''
+
+from array import array
+import argparse
+import filecmp
+import logging
+import mmap
+import os
+import struct
+import sys
+import tempfile
+
+from evolve import Graph, Group, Node, DirectedEdge, load_graph, load_validated_graph, serialize_graph, configure_logging, LOG_LEVELS
+from validation import Validator, add_validation_arguments, validator_from_args
+
+logger = logging.getLogger(__name__)
+
+# Binary graph format (.mbg), all integers are unsigned 32 bit little endian:
+#   header      MAGIC, VERSION, number of strings, groups, nodes, properties, edges
+#   strings     number of strings + 1 offsets into the string data
+#   groups      (name, end of its nodes in the node table) per group, in document order
+#   nodes       (name, end of its properties in the property table) per node, grouped by group
+#   properties  name per property, grouped by node
+#   edges       (start, end, semantics) per edge, in document order
+#   string data the UTF-8 encoded strings, every distinct string once
+# Names are indexes into the string table. The tables start right after each other, so their offsets follow
+# from the header and every table can be used in place from a memory-mapped file.
+MAGIC = b"MBGRAPH\0"
+VERSION = 1
+HEADER = struct.Struct("<8s6I")
+BINARY_GRAPH_SUFFIX = ".mbg"
+
+def write_graph_binary(graph: Graph, output_path: str):
+    '''
+    Writes the graph into output_path in the binary graph format.
+    '''
+    strings: dict[str, int] = {}
+
+    def intern(value: str) -> int:
+        index = strings.get(value)
+        if index is None:
+            index = strings[value] = len(strings)
+        return index
+
+    groups = array("I")
+    nodes = array("I")
+    properties = array("I")
+    edges = array("I")
+    for group in graph.groups:
+        for node in group.nodes:
+            properties.extend(intern(property) for property in node.properties)
+            nodes.append(intern(node.name))
+            nodes.append(len(properties))
+        groups.append(intern(group.name))
+        groups.append(len(nodes) // 2)
+    for edge in graph.directed_edges:
+        edges.append(intern(edge.start))
+        edges.append(intern(edge.end))
+        edges.append(intern(edge.semantics))
+
+    encoded = [value.encode("utf-8") for value in strings]
+    offsets = array("I", [0])
+    position = 0
+    for value in encoded:
+        position += len(value)
+        offsets.append(position)
+
+    tables = [offsets, groups, nodes, properties, edges]
+    if sys.byteorder != "little":
+        for table in tables:
+            table.byteswap()
+    with open(output_path, "wb") as output_file:
+        output_file.write(HEADER.pack(MAGIC, VERSION, len(strings), len(groups) // 2, len(nodes) // 2, len(properties), len(edges) // 3))
+        for table in tables:
+            table.tofile(output_file)
+        for value in encoded:
+            output_file.write(value)
+    logger.info("Wrote binary graph: %d groups, %d nodes, %d directed edges, %d distinct strings",
+                len(groups) // 2, len(nodes) // 2, len(edges) // 3, len(strings))
+
+class BinaryGraph:
+    '''
+    Read-only lazy view of a binary graph file. The file is memory-mapped and its tables are used in place:
+    opening it costs O(1), strings are only decoded and Python objects only created for the elements
+    that are actually accessed. Name lookups build their index on first use. to_graph() materializes a Graph.
+    '''
+
+    def __init__(self, path: str):
+        self.path: str = path
+        with open(path, "rb") as input_file:
+            # an empty file cannot be mapped, and a file without a complete header is no binary graph either
+            if os.fstat(input_file.fileno()).st_size < HEADER.size:
+                raise Exception("Not a binary graph (version %d): %s" % (VERSION, path))
+            self.map = mmap.mmap(input_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.string_count, self.group_count, self.node_count, self.property_count, self.edge_count = \
+            HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or version != VERSION:
+            self.map.close()
+            raise Exception("Not a binary graph (version %d): %s" % (VERSION, path))
+        # checked before any view into the map exists, which would keep it from being closed
+        table_length = self.string_count + 1 + 2 * self.group_count + 2 * self.node_count + self.property_count + 3 * self.edge_count
+        if HEADER.size + 4 * table_length > len(self.map):
+            self.map.close()
+            raise Exception("Truncated binary graph: %s" % path)
+        position = HEADER.size
+        self.string_offsets, position = self.table(position, self.string_count + 1)
+        self.group_table, position = self.table(position, 2 * self.group_count)
+        self.node_table, position = self.table(position, 2 * self.node_count)
+        self.property_table, position = self.table(position, self.property_count)
+        self.edge_table, position = self.table(position, 3 * self.edge_count)
+        self.string_data: int = position
+        if self.string_data + self.string_offsets[-1] > len(self.map):
+            self.close()
+            raise Exception("Truncated binary graph: %s" % path)
+        self.strings: dict[int, str] = {}
+        self.string_index: dict[str, int] = None
+        self.group_index: dict[int, int] = None
+        self.node_index: dict[int, int] = None
+
+    def table(self, position: int, length: int) -> tuple:
+        end = position + 4 * length
+        if sys.byteorder == "little":
+            return memoryview(self.map)[position:end].cast("I"), end
+        values = array("I", self.map[position:end])
+        values.byteswap()
+        return values, end
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        # the views into the map have to be released before it can be closed
+        for table in (self.string_offsets, self.group_table, self.node_table, self.property_table, self.edge_table):
+            if isinstance(table, memoryview):
+                table.release()
+        self.map.close()
+
+    def string(self, index: int) -> str:
+        value = self.strings.get(index)
+        if value is None:
+            start = self.string_data + self.string_offsets[index]
+            end = self.string_data + self.string_offsets[index + 1]
+            value = self.strings[index] = self.map[start:end].decode("utf-8")
+        return value
+
+    def group_name(self, group: int) -> str:
+        return self.string(self.group_table[2 * group])
+
+    def group_nodes(self, group: int) -> range:
+        start = self.group_table[2 * group - 1] if group > 0 else 0
+        return range(start, self.group_table[2 * group + 1])
+
+    def node_name(self, node: int) -> str:
+        return self.string(self.node_table[2 * node])
+
+    def node_properties(self, node: int) -> list[str]:
+        start = self.node_table[2 * node - 1] if node > 0 else 0
+        return [self.string(index) for index in self.property_table[start:self.node_table[2 * node + 1]]]
+
+    def edge(self, edge: int) -> tuple[str, str, str]:
+        return self.string(self.edge_table[3 * edge]), self.string(self.edge_table[3 * edge + 1]), self.string(self.edge_table[3 * edge + 2])
+
+    def find_string(self, value: str) -> int:
+        if self.string_index is None:
+            self.string_index = {self.string(index): index for index in range(self.string_count)}
+        return self.string_index.get(value)
+
+    def find_group(self, name: str) -> int:
+        '''
+        Returns the index of the group called name or None.
+        '''
+        if self.group_index is None:
+            self.group_index = {self.group_table[2 * group]: group for group in range(self.group_count)}
+        return self.group_index.get(self.find_string(name))
+
+    def find_node(self, name: str) -> int:
+        '''
+        Returns the index of the node called name or None.
+        '''
+        if self.node_index is None:
+            self.node_index = {self.node_table[2 * node]: node for node in range(self.node_count)}
+        return self.node_index.get(self.find_string(name))
+
+    def to_graph(self) -> Graph:
+        # a Graph needs (nearly) every string, decoding them all at once is cheaper than one by one
+        offsets = self.string_offsets
+        data = self.map[self.string_data:]
+        strings = [sys.intern(data[offsets[index]:offsets[index + 1]].decode("utf-8")) for index in range(self.string_count)]
+        graph = Graph()
+        node_table = self.node_table
+        property_table = self.property_table
+        node = 0
+        property_start = 0
+        for group in range(self.group_count):
+            group_name = strings[self.group_table[2 * group]]
+            if not graph.add_group(Group(group_name)):
+                raise Exception("Invalid binary graph %s: duplicate name %s" % (self.path, group_name))
+            for node in range(node, self.group_table[2 * group + 1]):
+                new_node = Node(strings[node_table[2 * node]])
+                property_end = node_table[2 * node + 1]
+                new_node.properties = [strings[index] for index in property_table[property_start:property_end]]
+                property_start = property_end
+                if not graph.add_node(new_node, group_name):
+                    raise Exception("Invalid binary graph %s: duplicate name %s" % (self.path, new_node.name))
+            node = self.group_table[2 * group + 1]
+        edge_table = self.edge_table
+        for edge in range(0, 3 * self.edge_count, 3):
+            new_edge = DirectedEdge(strings[edge_table[edge]], strings[edge_table[edge + 1]], strings[edge_table[edge + 2]])
+            if not graph.add_directed_edge(new_edge):
+                raise Exception("Invalid binary graph %s: invalid edge %s" % (self.path, new_edge))
+        logger.info("Loaded binary graph: %d groups, %d nodes, %d directed edges", self.group_count, self.node_count, self.edge_count)
+        logger.debug("Graph: %s", graph)
+        return graph
+
+def load_graph_binary(path: str) -> Graph:
+    with BinaryGraph(path) as binary_graph:
+        return binary_graph.to_graph()
+
+def load_xml_graph(xml_path: str, xsd_path: str = None, validator: Validator = None) -> Graph:
+    '''
+    load_graph, validating against the schema in xsd_path if it is given (see load_validated_graph).
+    '''
+    if xsd_path is None:
+        return load_graph(xml_path)
+    return load_validated_graph(xml_path, xsd_path, validator if validator is not None else Validator())
+
+def verify_round_trip(xml_path: str, template_path: str, xsd_path: str = None, validator: Validator = None) -> bool:
+    '''
+    Converts the graph in xml_path to the binary format and back and checks that serialize_graph writes
+    the same bytes for the original and for the converted graph.
+    '''
+    graph = load_xml_graph(xml_path, xsd_path, validator)
+    with tempfile.TemporaryDirectory() as work_dir:
+        binary_path = os.path.join(work_dir, "graph" + BINARY_GRAPH_SUFFIX)
+        expected_path = os.path.join(work_dir, "expected.xml")
+        actual_path = os.path.join(work_dir, "actual.xml")
+        write_graph_binary(graph, binary_path)
+        serialize_graph(graph, expected_path, template_path)
+        serialize_graph(load_graph_binary(binary_path), actual_path, template_path)
+        return filecmp.cmp(expected_path, actual_path, shallow=False)
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert graph models between XML and the compact binary graph format.")
+    parser.add_argument("--log-level", choices=LOG_LEVELS.keys(), default="info",
+                        help="quiet only reports problems, debug also dumps the full graphs (default: info)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = commands.add_parser("export", help="convert a graph model from XML into the binary format")
+    export_parser.add_argument("input_xml", help="the graph model")
+    export_parser.add_argument("output_binary", help="the binary graph to write")
+    export_parser.add_argument("--xsd", help="validate the graph model against this graph.xsd")
+
+    import_parser = commands.add_parser("import", help="convert a binary graph into XML")
+    import_parser.add_argument("input_binary", help="the binary graph")
+    import_parser.add_argument("output_xml", help="the graph model to write")
+    import_parser.add_argument("template", help="the graph_template.xml")
+
+    verify_parser = commands.add_parser("verify", help="check that graph models survive the round trip through the binary format unchanged")
+    verify_parser.add_argument("template", help="the graph_template.xml")
+    verify_parser.add_argument("input_xmls", nargs="+", help="the graph models")
+    verify_parser.add_argument("--xsd", help="validate the graph models against this graph.xsd")
+    add_validation_arguments(parser)
+
+    args = parser.parse_args()
+    configure_logging(args.log_level)
+    validator = validator_from_args(args)
+
+    if args.command == "export":
+        write_graph_binary(load_xml_graph(args.input_xml, args.xsd, validator), args.output_binary)
+    elif args.command == "import":
+        serialize_graph(load_graph_binary(args.input_binary), args.output_xml, args.template)
+    else:
+        failed = 0
+        for input_xml in args.input_xmls:
+            if verify_round_trip(input_xml, args.template, args.xsd, validator):
+                logger.info("Round trip OK: %s", input_xml)
+            else:
+                logger.error("Round trip changed the graph: %s", input_xml)
+                failed += 1
+        return 1 if failed else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
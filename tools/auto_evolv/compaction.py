@@ -0,0 +1,624 @@
+'''
+Copyright (C) 2024 Karl Kegel
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+'''
+
+import argparse
+import bisect
+import itertools
+import logging
+import os
+import sys
+
+from evolve import (Graph, CompiledOperation, OperationPlan, compile_operations, apply_operations, load_graph, xml_from_file,
+                    serialize_graph_bytes, configure_logging, LOG_LEVELS)
+
+logger = logging.getLogger(__name__)
+
+EVOLUTIONS = ["a", "b"]
+
+# operations that only change the node they name (in these argument positions) and the edges incident to it
+NODE_LOCAL_OPERATIONS = {
+    "AddProperty": (0,),
+    "DeleteProperty": (0,),
+    "RenameProperty": (0,),
+    "AddDirectedEdge": (0, 1),
+    "DeleteDirectedEdge": (0, 1),
+    "ChangeSemanticsDirectedEdge": (0, 1),
+    "MoveNodeToOtherGroup": (0,),
+}
+
+# the kind every operation leaves the element names among its arguments in, by argument position: "node", "group",
+# "element" (a node or a group) or "unique" (the name is free), None for arguments that are no element names
+NAME_KINDS = {
+    "AddNode": ("node", "group"),
+    "AddGroup": ("group",),
+    "DeleteNode": ("unique", "group"),
+    "DeleteGroup": ("unique",),
+    "RenameNode": ("unique", "node"),
+    "RenameGroup": ("unique", "group"),
+    "JoinGroups": ("unique", "unique", "group"),
+    "AddProperty": ("node", None),
+    "DeleteProperty": ("node", None),
+    "RenameProperty": ("node", None, None),
+    "AddDirectedEdge": ("element", "element", None),
+    "DeleteDirectedEdge": ("element", "element", None),
+    "ChangeSemanticsDirectedEdge": ("element", "element", None, None),
+    "MoveNodeToOtherGroup": ("node", "group", "group"),
+}
+
+# operations that neither change the edges nor the properties of the elements they name
+PROPERTY_OPERATIONS = ("AddProperty", "DeleteProperty", "RenameProperty")
+EDGE_OPERATIONS = ("AddDirectedEdge", "DeleteDirectedEdge", "ChangeSemanticsDirectedEdge")
+
+# the conditions a compacted semantic edit can depend on, checked against the graph before the edit
+CONDITIONS = {
+    "unique": lambda graph, name: graph.is_unique_node_or_group_name(name),
+    "node": lambda graph, name: graph.is_node(name),
+    "group": lambda graph, name: graph.is_group(name),
+    "element": lambda graph, name: graph.is_referenceable_element(name),
+    "edge": lambda graph, start, end, semantics, present: graph.is_double_edge(start, end, semantics) == present,
+    "lacks property": lambda graph, node_name, property_name: graph.is_node(node_name) and not graph.is_property(node_name, property_name),
+}
+
+def name_kind(operation: CompiledOperation, name: str) -> str:
+    '''
+    The kind the operation leaves the element name in if it succeeds (see NAME_KINDS), None if it does not name the element.
+    '''
+    kind = None
+    for argument, argument_kind in zip(operation.arguments, NAME_KINDS[operation.tag]):
+        if argument == name and argument_kind is not None:
+            kind = argument_kind
+    return kind
+
+def edge_state(operation: CompiledOperation, start: str, end: str, semantics: str) -> str:
+    '''
+    Whether the edge exists after the operation if it succeeds ("present" or "absent"), "unknown" if the operation
+    re-points or deletes edges of its names and None if it does not change the edge.
+    '''
+    tag = operation.tag
+    arguments = operation.arguments
+    if tag == "AddDirectedEdge" or tag == "DeleteDirectedEdge":
+        if arguments != (start, end, semantics):
+            return None
+        return "present" if tag == "AddDirectedEdge" else "absent"
+    if tag == "ChangeSemanticsDirectedEdge":
+        if arguments[:2] == (start, end) and arguments[3] == semantics:
+            return "present"
+        if arguments[:2] == (start, end) and arguments[2] == semantics:
+            return "absent"
+        return None
+    if tag in ("AddNode", "AddGroup", "DeleteNode"):
+        # a new element has no edges, deleting a node deletes its edges
+        return "absent" if arguments[0] in (start, end) else None
+    if tag in PROPERTY_OPERATIONS or tag == "MoveNodeToOtherGroup":
+        return None
+    return "unknown"
+
+def property_state(operation: CompiledOperation, node_name: str, property_name: str) -> str:
+    '''
+    Whether the node has the property after the operation if it succeeds ("present" or "absent"), "unknown" if the
+    operation replaces the node and None if it does not change its properties.
+    '''
+    tag = operation.tag
+    arguments = operation.arguments
+    if tag == "AddNode":
+        return "absent" if arguments[0] == node_name else None
+    if tag in PROPERTY_OPERATIONS:
+        if arguments[0] != node_name:
+            return None
+        if tag == "AddProperty" and arguments[1] == property_name or tag == "RenameProperty" and arguments[2] == property_name:
+            return "present"
+        if arguments[1] == property_name:
+            return "absent"
+        return None
+    if tag in EDGE_OPERATIONS or tag == "MoveNodeToOtherGroup":
+        return None
+    return "unknown" if name_kind(operation, node_name) is not None else None
+
+class CompactedEdit:
+    '''
+    The original operations of a semantic edit the compactor changed and the conditions on the graph before the
+    edit under which the compacted operations fail exactly when the original ones do and otherwise produce the
+    same graph.
+    '''
+    __slots__ = ("operations", "conditions")
+
+    def __init__(self, operations: list[CompiledOperation]):
+        self.operations: list[CompiledOperation] = operations
+        self.conditions: set[tuple] = set()
+
+    def conditions_hold(self, graph: Graph) -> bool:
+        return all(CONDITIONS[condition[0]](graph, *condition[1:]) for condition in self.conditions)
+
+class OperationCompactor:
+    '''
+    Rewrites an operation stream into a shorter stream with the same final graph in a single forward pass.
+
+    Every rule combines an operation with the last earlier operation of the same semantic edit that mentions the
+    same name and only applies if no operation in between mentions any of the names involved (any argument counts
+    as a mention). Operations that do not mention a name cannot observe or change the element, with one exception:
+    deleting or joining groups deletes or moves their nodes without naming them, so no group may be deleted or
+    joined in between either. The rules:
+
+      rename a->b, rename b->c             rename a->c (nothing if a == c), for nodes and groups
+      add b, rename b->c                   add c, for nodes and groups
+      rename a->b, delete b                delete a (in place of delete b), for nodes and groups
+      add, delete                          nothing, for groups, edges and properties the node did not have
+      add node, ..., delete node           nothing, also dropping all operations on the node in between if
+                                           they only change its properties and its edges or move it
+      add/change edge, change semantics    add/change edge with the final semantics (nothing if unchanged)
+      change semantics, delete edge        delete the edge under its earlier semantics
+      add/move node, move node             add/move node into the final group
+
+    A rule only applies if the operations it removes would have succeeded, e.g. a node that is added and deleted
+    again must not have existed before. What the earlier operations of the semantic edit did to the names decides
+    this, otherwise it becomes a condition on the graph before the edit. Rules never combine operations of
+    different semantic edits, so every edit still applies or fails as a whole. The compacted plan keeps the
+    original operations and the conditions of every edit it changed (see CompactedEdit), apply_operations applies
+    the original operations if the conditions do not hold. Operations keep their semantic edit and operation
+    index, a rule that combines operations keeps the indexes of the earlier one.
+    '''
+
+    def __init__(self):
+        self.operations: list[CompiledOperation] = []
+        self.alive: list[bool] = []
+        # name -> positions of the operations of the current semantic edit mentioning it, in stream order
+        # (may include dropped operations and operations that no longer mention it)
+        self.mentions: dict[str, list[int]] = {}
+        # positions of the group deletions and joins of the current semantic edit
+        self.group_changes: list[int] = []
+        self.position: int = -1
+        self.edit: CompactedEdit = None
+        self.edit_operations: list[CompiledOperation] = []
+        # the conditions of the rule that is being checked
+        self.conditions: list[tuple] = []
+        self.compacted_edits: dict[int, CompactedEdit] = {}
+        self.rules: dict[str, int] = {}
+
+    def compact(self, plan: OperationPlan) -> OperationPlan:
+        for semantic_edit_index, semantic_edit in itertools.groupby(plan.operations, key=lambda operation: operation.semantic_edit_index):
+            self.mentions = {}
+            self.group_changes = []
+            self.edit = None
+            self.edit_operations = list(semantic_edit)
+            for operation in self.edit_operations:
+                self.position = position = len(self.operations)
+                self.operations.append(operation)
+                self.alive.append(True)
+                self.conditions = []
+                if self.combine(operation, position):
+                    self.alive[position] = False
+                else:
+                    self.register(self.operations[position], position)
+            if self.edit is not None:
+                self.compacted_edits[semantic_edit_index] = self.edit
+        operations = [operation for operation, alive in zip(self.operations, self.alive) if alive]
+        logger.info("Compacted %d operations into %d", len(plan.operations), len(operations))
+        return OperationPlan(operations, plan.semantic_edit_count, self.compacted_edits)
+
+    def register(self, operation: CompiledOperation, position: int):
+        for name in set(operation.arguments):
+            positions = self.mentions.setdefault(name, [])
+            index = bisect.bisect_left(positions, position)
+            if index == len(positions) or positions[index] != position:
+                positions.insert(index, position)
+        if operation.tag == "DeleteGroup" or operation.tag == "JoinGroups":
+            bisect.insort(self.group_changes, position)
+
+    def last(self, name: str) -> int:
+        # position of the last operation mentioning the name, never earlier than the actual one
+        positions = self.mentions.get(name)
+        return positions[-1] if positions else -1
+
+    def untouched(self, position: int, *names: str) -> bool:
+        # no operation after position mentions any of the names
+        return all(self.last(name) <= position for name in names)
+
+    def groups_changed(self, start: int, end: int) -> bool:
+        # a group was deleted or joined between the positions
+        index = bisect.bisect_right(self.group_changes, start)
+        return index < len(self.group_changes) and self.group_changes[index] < end
+
+    def earlier(self, *names: str) -> CompiledOperation:
+        # the last operation mentioning any of the names if it is still part of the stream
+        position = max(self.last(name) for name in names)
+        if position < 0 or not self.alive[position] or self.groups_changed(position, self.position):
+            return None
+        return self.operations[position]
+
+    def sources(self, names: tuple, position: int):
+        # the operations of the stream before position that mention any of the names, latest first
+        positions = set()
+        for name in names:
+            positions.update(self.mentions.get(name, ()))
+        for earlier_position in sorted(positions, reverse=True):
+            if earlier_position < position and self.alive[earlier_position]:
+                operation = self.operations[earlier_position]
+                if any(name in operation.arguments for name in names):
+                    yield earlier_position, operation
+
+    def require(self, kind: str, name: str, position: int) -> bool:
+        '''
+        Whether the name is of the kind (see NAME_KINDS) right before the operation at position provided that the
+        operations before it succeed. If the semantic edit did not name the element so far, this becomes a condition.
+        '''
+        source = -1
+        fact = None
+        for source, operation in self.sources((name,), position):
+            fact = name_kind(operation, name)
+            if fact is not None:
+                break
+        else:
+            source = -1
+        # deleting a group deletes its nodes without naming them
+        if kind in ("node", "element") and self.groups_changed(source, position):
+            return False
+        if fact is None:
+            self.conditions.append((kind, name))
+            return True
+        return fact == kind or kind == "element" and fact in ("node", "group")
+
+    def require_edge(self, start: str, end: str, semantics: str, present: bool, position: int) -> bool:
+        '''
+        Whether the edge exists (or not) right before the operation at position, see require.
+        '''
+        source = -1
+        state = None
+        for source, operation in self.sources((start, end), position):
+            state = edge_state(operation, start, end, semantics)
+            if state is not None:
+                break
+        else:
+            source = -1
+        if state == "unknown" or present and self.groups_changed(source, position):
+            return False
+        if state is None:
+            self.conditions.append(("edge", start, end, semantics, present))
+            return True
+        return state == ("present" if present else "absent")
+
+    def require_lacking_property(self, node_name: str, property_name: str, position: int) -> bool:
+        '''
+        Whether the node exists without the property right before the operation at position, see require.
+        '''
+        source = -1
+        state = None
+        for source, operation in self.sources((node_name,), position):
+            state = property_state(operation, node_name, property_name)
+            if state is not None:
+                break
+        else:
+            source = -1
+        if state == "unknown" or state == "present" or self.groups_changed(source, position):
+            return False
+        if state is None:
+            self.conditions.append(("lacks property", node_name, property_name))
+        return True
+
+    def replace(self, position: int, rule: str, tag: str, arguments: tuple):
+        original = self.operations[position]
+        self.operations[position] = CompiledOperation(original.semantic_edit_index, original.operation_index, tag, arguments)
+        self.register(self.operations[position], position)
+        self.count(rule)
+
+    def drop(self, position: int, rule: str):
+        self.alive[position] = False
+        self.count(rule)
+
+    def count(self, rule: str):
+        self.rules[rule] = self.rules.get(rule, 0) + 1
+        if self.edit is None:
+            self.edit = CompactedEdit(self.edit_operations)
+        self.edit.conditions.update(self.conditions)
+
+    def combine(self, operation: CompiledOperation, position: int) -> bool:
+        '''
+        Folds the operation into an earlier one, returns False if it has to stay in the stream.
+        '''
+        tag = operation.tag
+        arguments = operation.arguments
+        if tag in ("RenameNode", "RenameGroup"):
+            return self.combine_rename(tag, *arguments)
+        if tag == "DeleteNode":
+            return self.combine_delete_node(position, *arguments)
+        if tag == "DeleteGroup":
+            return self.combine_delete_group(position, *arguments)
+        if tag == "DeleteProperty":
+            return self.combine_delete_property(*arguments)
+        if tag == "DeleteDirectedEdge":
+            return self.combine_delete_edge(*arguments)
+        if tag == "ChangeSemanticsDirectedEdge":
+            return self.combine_change_semantics(*arguments)
+        if tag == "MoveNodeToOtherGroup":
+            return self.combine_move(*arguments)
+        return False
+
+    def combine_rename(self, tag: str, old_name: str, new_name: str) -> bool:
+        earlier = self.earlier(old_name)
+        # renaming to the same name fails
+        if earlier is None or old_name == new_name or not self.untouched(self.last(old_name), new_name):
+            return False
+        position = self.last(old_name)
+        kind = "node" if tag == "RenameNode" else "group"
+        creation = "AddNode" if tag == "RenameNode" else "AddGroup"
+        if earlier.tag == tag and earlier.arguments[1] == old_name:
+            first_name = earlier.arguments[0]
+            if not self.untouched(position, first_name) or not self.require("unique", old_name, position):
+                return False
+            if first_name == new_name:
+                if not self.require(kind, first_name, position):
+                    return False
+                self.drop(position, "rename back")
+            else:
+                self.replace(position, "rename chain", tag, (first_name, new_name))
+            return True
+        if earlier.tag == creation and earlier.arguments[0] == old_name:
+            if not self.require("unique", old_name, position):
+                return False
+            self.replace(position, "add and rename", creation, (new_name,) + earlier.arguments[1:])
+            return True
+        return False
+
+    def combine_delete_node(self, position: int, node_name: str, group_name: str) -> bool:
+        earlier = self.earlier(node_name)
+        if earlier is None:
+            return False
+        earlier_position = self.last(node_name)
+        if earlier.tag == "RenameNode" and earlier.arguments[1] == node_name:
+            return self.delete_renamed(earlier_position, position, "DeleteNode", (earlier.arguments[0], group_name))
+        # walk back to the operation that added the node, everything in between has to be local to the node
+        local_positions = []
+        for earlier_position, earlier in self.sources((node_name,), position):
+            if earlier.tag == "AddNode" and earlier.arguments[0] == node_name:
+                break
+            if not self.is_local_to_node(earlier, node_name):
+                return False
+            local_positions.append(earlier_position)
+        else:
+            return False
+        if (self.groups_changed(earlier_position, position) or not self.require("unique", node_name, earlier_position)
+                or not self.require("group", earlier.arguments[1], earlier_position) or not self.require("group", group_name, position)
+                or not self.local_operations_succeed(node_name, earlier.arguments[1], earlier_position, local_positions[::-1], position)):
+            return False
+        for local_position in local_positions:
+            self.drop(local_position, "operation on deleted node")
+        self.drop(earlier_position, "add and delete")
+        return True
+
+    def is_local_to_node(self, operation: CompiledOperation, node_name: str) -> bool:
+        positions = NODE_LOCAL_OPERATIONS.get(operation.tag)
+        if positions is None:
+            return False
+        for index, argument in enumerate(operation.arguments):
+            if argument == node_name and index not in positions:
+                return False
+        return any(operation.arguments[index] == node_name for index in positions)
+
+    def local_operations_succeed(self, node_name: str, group_name: str, add_position: int, local_positions: list[int], position: int) -> bool:
+        '''
+        Whether the operations on the node added at add_position succeed, replaying its properties, edges and group.
+        The other elements they name must not be deleted or renamed before the node is deleted at position.
+        '''
+        properties = set()
+        edges = set()
+        others = {group_name}
+        for local_position in local_positions:
+            tag = self.operations[local_position].tag
+            arguments = self.operations[local_position].arguments
+            if tag == "AddProperty":
+                properties.add(arguments[1])
+            elif tag in ("DeleteProperty", "RenameProperty"):
+                if arguments[1] not in properties:
+                    return False
+                properties.discard(arguments[1])
+                properties.update(arguments[2:])
+            elif tag == "AddDirectedEdge":
+                if arguments in edges:
+                    return False
+                for other in arguments[:2]:
+                    if other != node_name and not self.require("element", other, local_position):
+                        return False
+                    others.add(other)
+                edges.add(arguments)
+            elif tag == "DeleteDirectedEdge":
+                if arguments not in edges:
+                    return False
+                edges.remove(arguments)
+            elif tag == "ChangeSemanticsDirectedEdge":
+                start, end, old_semantics, new_semantics = arguments
+                if (start, end, old_semantics) not in edges or (start, end, new_semantics) in edges:
+                    return False
+                edges.remove((start, end, old_semantics))
+                edges.add((start, end, new_semantics))
+            elif tag == "MoveNodeToOtherGroup":
+                if arguments[1] != group_name or not self.require("group", arguments[2], local_position):
+                    return False
+                group_name = arguments[2]
+                others.add(group_name)
+        others.discard(node_name)
+        local = set(local_positions)
+        for other_position, operation in self.sources(tuple(others), position):
+            if other_position <= add_position:
+                break
+            if other_position not in local and any(name_kind(operation, other) == "unique" for other in others):
+                return False
+        return True
+
+    def combine_delete_group(self, position: int, group_name: str) -> bool:
+        earlier = self.earlier(group_name)
+        if earlier is None:
+            return False
+        earlier_position = self.last(group_name)
+        if earlier.tag == "AddGroup" and earlier.arguments[0] == group_name:
+            if not self.require("unique", group_name, earlier_position):
+                return False
+            self.drop(earlier_position, "add and delete")
+            return True
+        if earlier.tag == "RenameGroup" and earlier.arguments[1] == group_name:
+            return self.delete_renamed(earlier_position, position, "DeleteGroup", (earlier.arguments[0],))
+        return False
+
+    def delete_renamed(self, rename_position: int, position: int, tag: str, arguments: tuple) -> bool:
+        # the element keeps its old name until it is deleted, the deletion itself stays in place: operations
+        # in between may still use the nodes of a group or the edges of a node without naming them
+        if not self.untouched(rename_position, arguments[0]) or not self.require("unique", self.operations[rename_position].arguments[1], rename_position):
+            return False
+        self.drop(rename_position, "rename and delete")
+        original = self.operations[position]
+        self.operations[position] = CompiledOperation(original.semantic_edit_index, original.operation_index, tag, arguments)
+        return False
+
+    def combine_delete_property(self, node_name: str, property_name: str) -> bool:
+        earlier = self.earlier(node_name)
+        if earlier is None or earlier.tag != "AddProperty" or earlier.arguments != (node_name, property_name):
+            return False
+        earlier_position = self.last(node_name)
+        # deleting removes every occurrence of the property, the pair only cancels out if the node did not have it
+        if not self.require_lacking_property(node_name, property_name, earlier_position):
+            return False
+        self.drop(earlier_position, "add and delete")
+        return True
+
+    def combine_delete_edge(self, start: str, end: str, semantics: str) -> bool:
+        earlier = self.earlier(start, end)
+        if earlier is None:
+            return False
+        earlier_position = max(self.last(start), self.last(end))
+        if earlier.tag == "AddDirectedEdge" and earlier.arguments == (start, end, semantics):
+            if (not self.require("element", start, earlier_position) or not self.require("element", end, earlier_position)
+                    or not self.require_edge(start, end, semantics, False, earlier_position)):
+                return False
+            self.drop(earlier_position, "add and delete")
+            return True
+        if earlier.tag == "ChangeSemanticsDirectedEdge" and earlier.arguments[:2] == (start, end) and earlier.arguments[3] == semantics:
+            if earlier.arguments[2] == semantics or not self.require_edge(start, end, semantics, False, earlier_position):
+                return False
+            self.replace(earlier_position, "change and delete", "DeleteDirectedEdge", (start, end, earlier.arguments[2]))
+            return True
+        return False
+
+    def combine_change_semantics(self, start: str, end: str, old_semantics: str, new_semantics: str) -> bool:
+        earlier = self.earlier(start, end)
+        # changing to the same semantics fails
+        if earlier is None or old_semantics == new_semantics:
+            return False
+        earlier_position = max(self.last(start), self.last(end))
+        if earlier.tag == "AddDirectedEdge" and earlier.arguments == (start, end, old_semantics):
+            if not self.require_edge(start, end, old_semantics, False, earlier_position):
+                return False
+            self.replace(earlier_position, "add and change", "AddDirectedEdge", (start, end, new_semantics))
+            return True
+        if earlier.tag == "ChangeSemanticsDirectedEdge" and earlier.arguments[:2] == (start, end) and earlier.arguments[3] == old_semantics:
+            first_semantics = earlier.arguments[2]
+            if first_semantics == old_semantics or not self.require_edge(start, end, old_semantics, False, earlier_position):
+                return False
+            if first_semantics == new_semantics:
+                if not self.require_edge(start, end, first_semantics, True, earlier_position):
+                    return False
+                self.drop(earlier_position, "change back")
+            else:
+                self.replace(earlier_position, "change chain", "ChangeSemanticsDirectedEdge", (start, end, first_semantics, new_semantics))
+            return True
+        return False
+
+    def combine_move(self, node_name: str, old_group_name: str, new_group_name: str) -> bool:
+        earlier = self.earlier(node_name)
+        if earlier is None:
+            return False
+        earlier_position = self.last(node_name)
+        # the node is appended to the new group, no other node may be appended to it in between
+        if not self.untouched(earlier_position, old_group_name, new_group_name):
+            return False
+        if earlier.tag == "MoveNodeToOtherGroup" and earlier.arguments[0] == node_name and earlier.arguments[2] == old_group_name:
+            if not self.require("group", old_group_name, earlier_position):
+                return False
+            self.replace(earlier_position, "move chain", "MoveNodeToOtherGroup", (node_name, earlier.arguments[1], new_group_name))
+            return True
+        if earlier.tag == "AddNode" and earlier.arguments == (node_name, old_group_name):
+            if not self.require("group", old_group_name, earlier_position):
+                return False
+            self.replace(earlier_position, "add and move", "AddNode", (node_name, new_group_name))
+            return True
+        return False
+
+def compact_operations(plan: OperationPlan) -> OperationPlan:
+    '''
+    Returns a shorter plan with the same final graph as the plan (see OperationCompactor).
+    '''
+    return OperationCompactor().compact(plan)
+
+def verify_compaction(graph: Graph, plan: OperationPlan, template_path: str) -> bool:
+    '''
+    Applies the plan and its compacted plan to forks of the graph and checks that both skip the same failed
+    semantic edits and are serialized to the same bytes.
+    '''
+    expected = graph.fork()
+    expected_failures = apply_operations(plan, expected, skip_failed_edits=True)
+    actual = graph.fork()
+    actual_failures = apply_operations(compact_operations(plan), actual, skip_failed_edits=True)
+    return ([str(operation) for operation in expected_failures] == [str(operation) for operation in actual_failures]
+            and serialize_graph_bytes(expected, template_path) == serialize_graph_bytes(actual, template_path))
+
+def verify_data_points(data_root: str, template_path: str) -> int:
+    '''
+    Verifies the compaction of both evolutions of every data point in data_root, returns the number of failures.
+    '''
+    failed = 0
+    for name in sorted(os.listdir(data_root)):
+        data_point_dir = os.path.join(data_root, name)
+        if not os.path.isfile(os.path.join(data_point_dir, "base.xml")):
+            continue
+        graph = load_graph(os.path.join(data_point_dir, "base.xml"))
+        for evolution in EVOLUTIONS:
+            plan = compile_operations(xml_from_file(os.path.join(data_point_dir, "evolution_%s.xml" % evolution)))
+            try:
+                same = verify_compaction(graph, plan, template_path)
+            except Exception as e:
+                logger.warning("%s evolution %s: not verified: %s", name, evolution, e)
+                continue
+            if same:
+                logger.info("%s evolution %s: compaction OK", name, evolution)
+            else:
+                logger.error("%s evolution %s: the compacted operations skip other semantic edits or produce a different graph", name, evolution)
+                failed += 1
+    return failed
+
+def main():
+    parser = argparse.ArgumentParser(description="Compact the operation streams of evolutions into equivalent shorter streams.")
+    parser.add_argument("--log-level", choices=LOG_LEVELS.keys(), default="info", help="(default: info)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    stats_parser = commands.add_parser("stats", help="list the rules that compact an evolution")
+    stats_parser.add_argument("operations_xml", help="the evolution model")
+
+    verify_parser = commands.add_parser("verify", help="check for every data point that the compacted evolutions produce the same graphs")
+    verify_parser.add_argument("data_root", help="the data/ directory")
+    verify_parser.add_argument("template", help="the graph_template.xml")
+
+    args = parser.parse_args()
+    configure_logging(args.log_level)
+
+    if args.command == "verify":
+        return 1 if verify_data_points(args.data_root, args.template) else 0
+
+    compactor = OperationCompactor()
+    compactor.compact(compile_operations(xml_from_file(args.operations_xml)))
+    for rule, count in sorted(compactor.rules.items()):
+        print("%s: %d" % (rule, count))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,348 @@
+'''
+Copyright (C) 2024 Karl Kegel
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+'''
+
+import argparse
+import collections
+import json
+import logging
+import os
+import sys
+
+from evolve import Graph, load_graph, map_data_points, configure_logging, LOG_LEVELS
+
+logger = logging.getLogger(__name__)
+
+# the graphs compared per data point by the batch command: (key in diff.json, old graph, new graph)
+DATA_POINT_PAIRS = [
+    ("base_a", "base.xml", "graph_a.xml"),
+    ("base_b", "base.xml", "graph_b.xml"),
+    ("a_b", "graph_a.xml", "graph_b.xml"),
+]
+DIFF_FILE_NAME = "diff.json"
+
+class GraphDiff:
+    '''
+    The structural delta from an old to a new graph. Renames are reported instead of a removal plus
+    an addition, and edges are compared after applying the renames of their ends, so renaming a node
+    does not show up as changed edges.
+    '''
+
+    def __init__(self):
+        self.added_groups: list[str] = []
+        self.removed_groups: list[str] = []
+        # (old name, new name)
+        self.renamed_groups: list[tuple[str, str]] = []
+        self.added_nodes: list[tuple[str, str]] = []
+        self.removed_nodes: list[tuple[str, str]] = []
+        self.renamed_nodes: list[tuple[str, str]] = []
+        # (node name in the new graph, old group name, new group name), only groups that are not renamed
+        self.moved_nodes: list[tuple[str, str, str]] = []
+        # (node name in the new graph, property name), including the properties of added nodes
+        self.added_properties: list[tuple[str, str]] = []
+        self.removed_properties: list[tuple[str, str]] = []
+        # (node name in the new graph, old property name, new property name)
+        self.renamed_properties: list[tuple[str, str, str]] = []
+        # (start, end, semantics), removed edges with the ends renamed into the new graph
+        self.added_edges: list[tuple[str, str, str]] = []
+        self.removed_edges: list[tuple[str, str, str]] = []
+        # (start, end, old semantics, new semantics)
+        self.changed_edges: list[tuple[str, str, str, str]] = []
+
+    def categories(self) -> dict[str, list]:
+        return {
+            "added_groups": self.added_groups,
+            "removed_groups": self.removed_groups,
+            "renamed_groups": self.renamed_groups,
+            "added_nodes": self.added_nodes,
+            "removed_nodes": self.removed_nodes,
+            "renamed_nodes": self.renamed_nodes,
+            "moved_nodes": self.moved_nodes,
+            "added_properties": self.added_properties,
+            "removed_properties": self.removed_properties,
+            "renamed_properties": self.renamed_properties,
+            "added_edges": self.added_edges,
+            "removed_edges": self.removed_edges,
+            "changed_edges": self.changed_edges,
+        }
+
+    def is_empty(self) -> bool:
+        return not any(self.categories().values())
+
+    def to_dict(self) -> dict:
+        return {category: [list(change) if isinstance(change, tuple) else change for change in changes]
+                for category, changes in self.categories().items()}
+
+    def summary(self) -> str:
+        counts = ["%s: %d" % (category, len(changes)) for category, changes in self.categories().items() if changes]
+        return ", ".join(counts) if counts else "no changes"
+
+    def __str__(self):
+        return "\n".join("%s %s" % (category, change) for category, changes in self.categories().items() for change in changes)
+
+def node_groups(graph: Graph) -> dict[str, str]:
+    return {node.name: group.name for group in graph.groups for node in group.nodes}
+
+def edge_signature(graph: Graph, name: str, names: dict[str, str] = None) -> frozenset:
+    '''
+    The incident edges of an element as (direction, other end, semantics), with the other end translated by names.
+    '''
+    signature = set()
+    for edge in graph.get_incident_edges(name):
+        if edge.start == name:
+            signature.add(("out", names.get(edge.end, edge.end) if names else edge.end, edge.semantics))
+        if edge.end == name:
+            signature.add(("in", names.get(edge.start, edge.start) if names else edge.start, edge.semantics))
+    return frozenset(signature)
+
+def edge_shape(graph: Graph, name: str) -> frozenset:
+    '''
+    The incident edges of an element as (direction, semantics), which survives renaming the other ends.
+    '''
+    return frozenset((("out" if edge.start == name else "in"), edge.semantics) for edge in graph.get_incident_edges(name))
+
+def match_unique(removed: list[str], added: list[str], key_functions: list) -> dict[str, str]:
+    '''
+    Pairs removed with added names: in every pass, names whose key is unique among the still unpaired
+    removed names and among the still unpaired added names are paired. A key of None never matches.
+    Each pass hashes every name once, so matching is linear in the number of names.
+    '''
+    matches = {}
+    removed = list(removed)
+    added = list(added)
+    for removed_key, added_key in key_functions:
+        removed_buckets = {}
+        for name in removed:
+            key = removed_key(name)
+            if key is not None:
+                removed_buckets.setdefault(key, []).append(name)
+        added_buckets = {}
+        for name in added:
+            key = added_key(name)
+            if key is not None:
+                added_buckets.setdefault(key, []).append(name)
+        for key, names in removed_buckets.items():
+            candidates = added_buckets.get(key)
+            if len(names) == 1 and candidates is not None and len(candidates) == 1:
+                matches[names[0]] = candidates[0]
+        matched_added = set(matches.values())
+        removed = [name for name in removed if name not in matches]
+        added = [name for name in added if name not in matched_added]
+    return matches
+
+def match_majority(removed: list[str], added: list[str], old_members, new_members, new_member_groups: dict[str, str]) -> dict[str, str]:
+    '''
+    Pairs a removed with an added group if more than half of the members of each of them are shared.
+    Every member votes once, so matching is linear in the number of members; the majority on both sides
+    makes the pairs unique and keeps e.g. two joined groups from being taken for a rename of one of them.
+    '''
+    added = set(added)
+    matches = {}
+    for name in removed:
+        members = old_members(name)
+        votes = {}
+        for member in members:
+            new_group = new_member_groups.get(member)
+            if new_group in added:
+                votes[new_group] = votes.get(new_group, 0) + 1
+        if not votes:
+            continue
+        candidate, count = max(votes.items(), key=lambda vote: vote[1])
+        if count * 2 > len(members) and count * 2 > len(new_members(candidate)):
+            matches[name] = candidate
+            added.discard(candidate)
+    return matches
+
+def diff_graphs(old: Graph, new: Graph) -> GraphDiff:
+    '''
+    Computes the delta from old to new in time linear in the size of both graphs (plus the degree of the
+    removed and added elements). Elements are identified by name; removed and added elements are paired
+    as renames if their structural signature (group, properties and incident edges of nodes, nodes and
+    incident edges of groups) identifies them uniquely, groups also if they share most of their nodes.
+    '''
+    diff = GraphDiff()
+    old_node_groups = node_groups(old)
+    new_node_groups = node_groups(new)
+
+    # nodes
+    removed_nodes = [name for name in old_node_groups if name not in new_node_groups]
+    added_nodes = [name for name in new_node_groups if name not in old_node_groups]
+    node_renames = {}
+    if removed_nodes and added_nodes:
+        old_properties = lambda name: frozenset(old.get_node(name).properties)
+        new_properties = lambda name: frozenset(new.get_node(name).properties)
+        old_edges = lambda name: edge_signature(old, name)
+        new_edges = lambda name: edge_signature(new, name)
+        node_renames = match_unique(removed_nodes, added_nodes, [
+            (lambda name: (old_node_groups[name], old_properties(name), old_edges(name)),
+             lambda name: (new_node_groups[name], new_properties(name), new_edges(name))),
+            (lambda name: (old_properties(name), old_edges(name)),
+             lambda name: (new_properties(name), new_edges(name))),
+            (lambda name: (old_node_groups[name], old_properties(name)) if old.get_node(name).properties else None,
+             lambda name: (new_node_groups[name], new_properties(name)) if new.get_node(name).properties else None),
+            (lambda name: old_edges(name) or None,
+             lambda name: new_edges(name) or None),
+            (lambda name: (old_node_groups[name], edge_shape(old, name)) if old.get_incident_edges(name) else None,
+             lambda name: (new_node_groups[name], edge_shape(new, name)) if new.get_incident_edges(name) else None),
+        ])
+
+    # groups, identified by their nodes after the node renames
+    old_group_names = set(group.name for group in old.groups)
+    new_group_names = set(group.name for group in new.groups)
+    removed_groups = [group.name for group in old.groups if group.name not in new_group_names]
+    added_groups = [group.name for group in new.groups if group.name not in old_group_names]
+    group_renames = {}
+    if removed_groups and added_groups:
+        group_renames = match_unique(removed_groups, added_groups, [
+            (lambda name: frozenset(node_renames.get(node.name, node.name) for node in old.get_group(name).nodes) or None,
+             lambda name: frozenset(node.name for node in new.get_group(name).nodes) or None),
+            (lambda name: edge_signature(old, name, node_renames) or None,
+             lambda name: edge_signature(new, name) or None),
+        ])
+        renamed_to = set(group_renames.values())
+        group_renames.update(match_majority([name for name in removed_groups if name not in group_renames],
+                                            [name for name in added_groups if name not in renamed_to],
+                                            lambda name: [node_renames.get(node.name, node.name) for node in old.get_group(name).nodes],
+                                            lambda name: new.get_group(name).node_order,
+                                            new_node_groups))
+    renames = dict(node_renames)
+    renames.update(group_renames)
+
+    diff.renamed_nodes = list(node_renames.items())
+    diff.removed_nodes = [(name, old_node_groups[name]) for name in removed_nodes if name not in node_renames]
+    renamed_to = set(node_renames.values())
+    diff.added_nodes = [(name, new_node_groups[name]) for name in added_nodes if name not in renamed_to]
+    diff.renamed_groups = list(group_renames.items())
+    diff.removed_groups = [name for name in removed_groups if name not in group_renames]
+    renamed_to = set(group_renames.values())
+    diff.added_groups = [name for name in added_groups if name not in renamed_to]
+
+    # group membership and properties of the nodes in both graphs
+    for old_name, old_group_name in old_node_groups.items():
+        new_name = renames.get(old_name, old_name)
+        new_group_name = new_node_groups.get(new_name)
+        if new_group_name is None:
+            continue
+        if renames.get(old_group_name, old_group_name) != new_group_name:
+            diff.moved_nodes.append((new_name, old_group_name, new_group_name))
+        old_properties = old.get_node(old_name).properties
+        new_properties = new.get_node(new_name).properties
+        if old_properties == new_properties:
+            continue
+        # a node can have a property more than once, every occurrence counts
+        old_property_counts = collections.Counter(old_properties)
+        new_property_counts = collections.Counter(new_properties)
+        removed_properties = list((old_property_counts - new_property_counts).elements())
+        added_properties = list((new_property_counts - old_property_counts).elements())
+        if len(removed_properties) == 1 and len(added_properties) == 1:
+            diff.renamed_properties.append((new_name, removed_properties[0], added_properties[0]))
+            continue
+        diff.removed_properties += [(new_name, name) for name in removed_properties]
+        diff.added_properties += [(new_name, name) for name in added_properties]
+
+    for name, _ in diff.added_nodes:
+        diff.added_properties += [(name, property_name) for property_name in new.get_node(name).properties]
+
+    # edges, compared after renaming their ends
+    old_edges = {}
+    for edge in old.directed_edges:
+        key = (renames.get(edge.start, edge.start), renames.get(edge.end, edge.end), edge.semantics)
+        old_edges[key] = edge
+    new_edges = {(edge.start, edge.end, edge.semantics): edge for edge in new.directed_edges}
+    removed_edges = [key for key in old_edges if key not in new_edges]
+    added_edges = [key for key in new_edges if key not in old_edges]
+    removed_by_ends = {}
+    for key in removed_edges:
+        removed_by_ends.setdefault(key[:2], []).append(key)
+    added_by_ends = {}
+    for key in added_edges:
+        added_by_ends.setdefault(key[:2], []).append(key)
+    changed = set()
+    for ends, keys in removed_by_ends.items():
+        candidates = added_by_ends.get(ends)
+        if len(keys) == 1 and candidates is not None and len(candidates) == 1:
+            diff.changed_edges.append((ends[0], ends[1], keys[0][2], candidates[0][2]))
+            changed.add(keys[0])
+            changed.add(candidates[0])
+    diff.removed_edges = [key for key in removed_edges if key not in changed]
+    diff.added_edges = [key for key in added_edges if key not in changed]
+    return diff
+
+def diff_files(old_path: str, new_path: str) -> GraphDiff:
+    return diff_graphs(load_graph(old_path), load_graph(new_path))
+
+def diff_data_point(gen_dir: str) -> dict[str, dict]:
+    '''
+    Diffs the graphs of one data point in gen/ (see DATA_POINT_PAIRS) and writes them to gen/<id>/diff.json.
+    '''
+    graphs = {}
+    for _, old_name, new_name in DATA_POINT_PAIRS:
+        for name in (old_name, new_name):
+            if name not in graphs:
+                graphs[name] = load_graph(os.path.join(gen_dir, name))
+    diffs = {key: diff_graphs(graphs[old_name], graphs[new_name]).to_dict() for key, old_name, new_name in DATA_POINT_PAIRS}
+    with open(os.path.join(gen_dir, DIFF_FILE_NAME), "w") as output_file:
+        json.dump(diffs, output_file, indent=1)
+    return diffs
+
+def _diff_data_point_in_worker(gen_dir: str) -> tuple[str, str]:
+    try:
+        diffs = diff_data_point(gen_dir)
+    except Exception as e:
+        return None, "%s: %s" % (type(e).__name__, str(e))
+    return ", ".join("%s: %d changes" % (key, sum(len(changes) for changes in diff.values())) for key, diff in diffs.items()), None
+
+def diff_all(gen_root: str, workers: int = 1) -> int:
+    '''
+    Diffs every data point in gen_root that has all graphs of DATA_POINT_PAIRS, returns the number of failures.
+    '''
+    gen_dirs = sorted(entry.path for entry in os.scandir(gen_root) if entry.is_dir()
+                      and all(os.path.isfile(os.path.join(entry.path, name)) for _, old_name, new_name in DATA_POINT_PAIRS for name in (old_name, new_name)))
+    failed = map_data_points(_diff_data_point_in_worker, gen_dirs, workers)
+    logger.info("%d data points diffed, %d failed", len(gen_dirs), failed)
+    return failed
+
+def main():
+    parser = argparse.ArgumentParser(description="Compute the structural delta between graph models.")
+    parser.add_argument("--log-level", choices=LOG_LEVELS.keys(), default="info", help="(default: info)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    pair_parser = commands.add_parser("pair", help="diff two graph models")
+    pair_parser.add_argument("old_graph_xml", help="the old graph model")
+    pair_parser.add_argument("new_graph_xml", help="the new graph model")
+    pair_parser.add_argument("--output", default=None, help="write the delta as JSON to this file instead of listing it")
+
+    batch_parser = commands.add_parser("batch", help="diff base, graph_a and graph_b of every data point in gen/ into gen/<id>/diff.json")
+    batch_parser.add_argument("gen_root", help="the gen/ directory")
+    batch_parser.add_argument("-j", "--workers", type=int, default=os.cpu_count(), help="number of worker processes (default: number of CPUs)")
+
+    args = parser.parse_args()
+    configure_logging(args.log_level)
+
+    if args.command == "batch":
+        return 1 if diff_all(args.gen_root, args.workers) else 0
+
+    diff = diff_files(args.old_graph_xml, args.new_graph_xml)
+    if args.output is not None:
+        with open(args.output, "w") as output_file:
+            json.dump(diff.to_dict(), output_file, indent=1)
+    elif not diff.is_empty():
+        print(diff)
+    logger.info("%s", diff.summary())
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,708 @@
+'''
+Copyright (C) 2024 Karl Kegel
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+'''
+
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import json
+import logging
+import os
+import sys
+
+from evolve import (Graph, OPERATIONS, CompiledOperation, OperationPlan, xml_from_file, load_validated_graph, compile_operations,
+                    serialize_graph, configure_logging, LOG_LEVELS)
+from validation import Schemas, DEFAULT_VALIDATION_CACHE_DIR, add_validation_arguments, init_worker, worker_schemas
+
+logger = logging.getLogger(__name__)
+
+EVOLUTIONS = ["a", "b"]
+STRATEGIES = ["base", "a", "b"]
+MERGED_GRAPH_FILE_NAME = "graph_merged.xml"
+MERGE_REPORT_FILE_NAME = "merge_report.json"
+
+# Element keys identify groups, nodes, edges and properties independently of their (changing) names:
+# ("element", uid) / ("edge", uid) for elements of the base, ("element", (evolution, uid)) for elements
+# created by an evolution and ("property", node key, base name or (evolution, counter)) for properties.
+# Operations are reduced to effects (key, action, value) with the actions
+#   use     the element must exist (e.g. the group a node is added to)
+#   delete  rename  move  change (edge semantics)  join (groups)
+
+class StreamOperation:
+    '''
+    An operation of one evolution, resolved against the base: the element keys its arguments refer to
+    (None for literal arguments), its effects and the names it claims.
+    '''
+    __slots__ = ("evolution", "operation", "references", "effects", "claims", "created", "valid")
+
+    def __init__(self, evolution: str, operation: CompiledOperation):
+        self.evolution: str = evolution
+        self.operation: CompiledOperation = operation
+        self.references: tuple = ()
+        self.effects: list[tuple] = []
+        # (claimed name or edge, signature), equal claims with equal signatures are duplicates
+        self.claims: list[tuple] = []
+        # key of the element created by the operation
+        self.created: tuple = None
+        # False if the operation could not even be applied within its own evolution
+        self.valid: bool = True
+
+    def to_dict(self) -> dict:
+        return {
+            "evolution": self.evolution,
+            "semantic_edit": self.operation.semantic_edit_index,
+            "operation": self.operation.operation_index,
+            "text": str(self.operation),
+        }
+
+class Conflict:
+    def __init__(self, kind: str, element: str):
+        self.kind: str = kind
+        self.element: str = element
+        self.operations: dict[str, list[StreamOperation]] = {evolution: [] for evolution in EVOLUTIONS}
+        self.members: set[StreamOperation] = set()
+
+    def add(self, stream_operations: list[StreamOperation]):
+        for stream_operation in stream_operations:
+            if stream_operation not in self.members:
+                self.members.add(stream_operation)
+                self.operations[stream_operation.evolution].append(stream_operation)
+
+    def to_dict(self) -> dict:
+        res = {"kind": self.kind, "element": self.element}
+        for evolution, operations in self.operations.items():
+            res[evolution] = [operation.to_dict() for operation in operations]
+        return res
+
+    def __str__(self):
+        return "%s conflict on %s: %s" % (self.kind, self.element, " vs. ".join(
+            ", ".join(str(operation.operation) for operation in self.operations[evolution]) for evolution in EVOLUTIONS))
+
+class MergeResult:
+    def __init__(self, graph: Graph, strategy: str):
+        self.graph: Graph = graph
+        self.strategy: str = strategy
+        self.conflicts: list[Conflict] = []
+        # (operation of a, operation of b doing the same), the operation of b is not applied again
+        self.duplicates: list[tuple[StreamOperation, StreamOperation]] = []
+        # operations left out because of a conflict
+        self.skipped: list[StreamOperation] = []
+        # (operation, reason) for operations that could not be applied to the merged graph
+        self.failed: list[tuple[StreamOperation, str]] = []
+        self.invalid: list[StreamOperation] = []
+        # deletions of elements the merged graph no longer contains (e.g. implicitly deleted with their node)
+        self.obsolete: list[StreamOperation] = []
+        self.applied: dict[str, int] = {evolution: 0 for evolution in EVOLUTIONS}
+
+    def to_dict(self) -> dict:
+        return {
+            "strategy": self.strategy,
+            "applied": self.applied,
+            "conflicts": [conflict.to_dict() for conflict in self.conflicts],
+            "duplicates": [{"a": a.to_dict(), "b": b.to_dict()} for a, b in self.duplicates],
+            "skipped": [operation.to_dict() for operation in self.skipped],
+            "failed": [dict(operation.to_dict(), reason=reason) for operation, reason in self.failed],
+            "invalid": [operation.to_dict() for operation in self.invalid],
+            "obsolete": [operation.to_dict() for operation in self.obsolete],
+        }
+
+    def summary(self) -> str:
+        return "applied a: %d, applied b: %d, conflicts: %d, duplicates: %d, skipped: %d, failed: %d, invalid: %d, obsolete: %d" % (
+            self.applied["a"], self.applied["b"], len(self.conflicts), len(self.duplicates), len(self.skipped), len(self.failed),
+            len(self.invalid), len(self.obsolete))
+
+# RESOLVING THE OPERATIONS OF ONE EVOLUTION
+
+class StreamResolver:
+    '''
+    Applies the operations of one evolution to a fork of the base and resolves every operation to element keys
+    right before applying it. uids survive renames, joins keep the edges, so the keys are stable across the evolution.
+    '''
+
+    def __init__(self, base: Graph, base_names: dict, evolution: str, labels: dict, counterpart_claims: dict = None):
+        self.graph: Graph = base.fork()
+        # key -> name in the base, see MergedNames
+        self.base_names: dict = base_names
+        self.evolution: str = evolution
+        # key -> readable description for the conflict report (with the base name if there is one), shared by both evolutions
+        self.labels: dict = labels
+        # (node key, current property name) -> property key, for renamed, deleted and added properties
+        self.properties: dict[tuple, tuple] = {}
+        self.property_counter: int = 0
+        # claims of the other (already resolved) evolution: elements created the same way in both evolutions
+        # get the key of the other evolution, so later operations on them compare as the same element
+        self.counterpart_claims: dict = counterpart_claims or {}
+        self.canonical: dict[tuple, tuple] = {}
+        self.handlers = {
+            "DeleteNode": self.delete_node,
+            "DeleteDirectedEdge": self.delete_directed_edge,
+            "DeleteGroup": self.delete_group,
+            "DeleteProperty": self.delete_property,
+            "AddNode": self.add_node,
+            "AddDirectedEdge": self.add_directed_edge,
+            "AddGroup": self.add_group,
+            "RenameProperty": self.rename_property,
+            "AddProperty": self.add_property,
+            "RenameGroup": self.rename_group,
+            "RenameNode": self.rename_node,
+            "ChangeSemanticsDirectedEdge": self.change_semantics_directed_edge,
+            "MoveNodeToOtherGroup": self.move_node_to_other_group,
+            "JoinGroups": self.join_groups,
+        }
+
+    def resolve(self, plan: OperationPlan) -> list[StreamOperation]:
+        stream_operations = []
+        for operation in plan.operations:
+            stream_operation = StreamOperation(self.evolution, operation)
+            try:
+                after = self.handlers[operation.tag](stream_operation, *operation.arguments)
+            except KeyError:
+                # an argument refers to an element that does not exist (anymore)
+                after = None
+                stream_operation.valid = False
+            if stream_operation.valid:
+                stream_operation.valid = OPERATIONS[operation.tag][0](self.graph, *operation.arguments)
+            if stream_operation.valid and after is not None:
+                after()
+                self.canonicalize(stream_operation)
+            stream_operations.append(stream_operation)
+        return stream_operations
+
+    def canonicalize(self, stream_operation: StreamOperation):
+        for claim, signature in stream_operation.claims:
+            for counterpart, counterpart_signature in self.counterpart_claims.get(claim, ()):
+                if counterpart_signature == signature and counterpart.created is not None:
+                    self.canonical[stream_operation.created] = counterpart.created
+                    stream_operation.created = counterpart.created
+                    return
+
+    def key(self, kind: str, uid: int) -> tuple:
+        if (kind, uid) in self.base_names:
+            return (kind, uid)
+        key = (kind, (self.evolution, uid))
+        return self.canonical.get(key, key)
+
+    def element_key(self, name: str) -> tuple:
+        element = self.graph.get_node(name)
+        kind = "node"
+        if element is None:
+            element = self.graph.get_group(name)
+            kind = "group"
+        if element is None:
+            raise KeyError(name)
+        key = self.key("element", element.uid)
+        self.labels.setdefault(key, "%s %s" % (kind, self.base_names.get(key, name)))
+        return key
+
+    def edge_key(self, start: str, end: str, semantics: str) -> tuple:
+        edge = self.graph.get_directed_edge(start, end, semantics)
+        if edge is None:
+            raise KeyError((start, end, semantics))
+        key = self.key("edge", edge.uid)
+        self.labels.setdefault(key, "edge %s -> %s: %s" % (start, end, semantics))
+        return key
+
+    def incident_edge_keys(self, name: str) -> list[tuple]:
+        return [self.edge_key(edge.start, edge.end, edge.semantics) for edge in self.graph.get_incident_edges(name)]
+
+    def property_key(self, node_key: tuple, node_name: str, property_name: str) -> tuple:
+        key = self.properties.get((node_key, property_name))
+        if key is None:
+            # never touched by this evolution, so it still has its base name
+            key = ("property", node_key, property_name)
+            self.labels.setdefault(key, "property %s of %s" % (property_name, node_name))
+        return self.canonical.get(key, key)
+
+    def node_deletion_effects(self, node_name: str) -> list[tuple]:
+        '''
+        Deleting a node implicitly deletes its properties and incident edges.
+        '''
+        node_key = self.element_key(node_name)
+        effects = [(node_key, "delete", None)]
+        effects += [(self.property_key(node_key, node_name, property_name), "delete", None)
+                    for property_name in self.graph.get_node(node_name).properties]
+        effects += [(key, "delete", None) for key in self.incident_edge_keys(node_name)]
+        return effects
+
+    def new_property_key(self, node_key: tuple, property_name: str) -> tuple:
+        self.property_counter += 1
+        key = ("property", node_key, (self.evolution, self.property_counter))
+        self.properties[(node_key, property_name)] = key
+        return key
+
+    def delete_node(self, stream_operation: StreamOperation, node_name: str, group_name: str):
+        stream_operation.references = (self.element_key(node_name), self.element_key(group_name))
+        stream_operation.effects = self.node_deletion_effects(node_name)
+
+    def delete_directed_edge(self, stream_operation: StreamOperation, start: str, end: str, semantics: str):
+        edge_key = self.edge_key(start, end, semantics)
+        stream_operation.references = (self.element_key(start), self.element_key(end), edge_key)
+        stream_operation.effects = [(edge_key, "delete", None)]
+
+    def delete_group(self, stream_operation: StreamOperation, group_name: str):
+        group_key = self.element_key(group_name)
+        stream_operation.references = (group_key,)
+        stream_operation.effects = [(group_key, "delete", None)] + [(key, "delete", None) for key in self.incident_edge_keys(group_name)]
+        for node in self.graph.get_group(group_name).nodes:
+            stream_operation.effects += self.node_deletion_effects(node.name)
+
+    def delete_property(self, stream_operation: StreamOperation, node_name: str, property_name: str):
+        node_key = self.element_key(node_name)
+        property_key = self.property_key(node_key, node_name, property_name)
+        stream_operation.references = (node_key, property_key)
+        stream_operation.effects = [(property_key, "delete", None)]
+
+        def after():
+            self.properties[(node_key, property_name)] = ("property", node_key, "deleted")
+        return after
+
+    def add_node(self, stream_operation: StreamOperation, node_name: str, group_name: str):
+        group_key = self.element_key(group_name)
+        stream_operation.references = (None, group_key)
+        stream_operation.effects = [(group_key, "use", None)]
+        stream_operation.claims = [(("name", node_name), ("AddNode", group_key))]
+
+        def after():
+            stream_operation.created = self.element_key(node_name)
+        return after
+
+    def add_directed_edge(self, stream_operation: StreamOperation, start: str, end: str, semantics: str):
+        start_key = self.element_key(start)
+        end_key = self.element_key(end)
+        stream_operation.references = (start_key, end_key, None)
+        stream_operation.effects = [(start_key, "use", None), (end_key, "use", None)]
+        stream_operation.claims = [(("edge", start_key, end_key, semantics), ("AddDirectedEdge",))]
+
+        def after():
+            stream_operation.created = self.edge_key(start, end, semantics)
+        return after
+
+    def add_group(self, stream_operation: StreamOperation, group_name: str):
+        stream_operation.references = (None,)
+        stream_operation.claims = [(("name", group_name), ("AddGroup",))]
+
+        def after():
+            stream_operation.created = self.element_key(group_name)
+        return after
+
+    def rename_property(self, stream_operation: StreamOperation, node_name: str, old_property_name: str, new_property_name: str):
+        node_key = self.element_key(node_name)
+        property_key = self.property_key(node_key, node_name, old_property_name)
+        stream_operation.references = (node_key, property_key, None)
+        stream_operation.effects = [(property_key, "rename", new_property_name)]
+
+        def after():
+            self.properties[(node_key, old_property_name)] = ("property", node_key, "renamed")
+            self.properties[(node_key, new_property_name)] = property_key
+        return after
+
+    def add_property(self, stream_operation: StreamOperation, node_name: str, property_name: str):
+        node_key = self.element_key(node_name)
+        stream_operation.references = (node_key, None)
+        stream_operation.effects = [(node_key, "use", None)]
+        stream_operation.claims = [(("property", node_key, property_name), ("AddProperty",))]
+
+        def after():
+            stream_operation.created = self.new_property_key(node_key, property_name)
+        return after
+
+    def rename_group(self, stream_operation: StreamOperation, old_group_name: str, new_group_name: str):
+        self.rename_element(stream_operation, old_group_name, new_group_name)
+
+    def rename_node(self, stream_operation: StreamOperation, old_node_name: str, new_node_name: str):
+        self.rename_element(stream_operation, old_node_name, new_node_name)
+
+    def rename_element(self, stream_operation: StreamOperation, old_name: str, new_name: str):
+        key = self.element_key(old_name)
+        stream_operation.references = (key, None)
+        stream_operation.effects = [(key, "rename", new_name)]
+        stream_operation.claims = [(("name", new_name), ("rename", key))]
+
+    def change_semantics_directed_edge(self, stream_operation: StreamOperation, start: str, end: str, old_semantics: str, new_semantics: str):
+        start_key = self.element_key(start)
+        end_key = self.element_key(end)
+        edge_key = self.edge_key(start, end, old_semantics)
+        stream_operation.references = (start_key, end_key, edge_key, None)
+        stream_operation.effects = [(edge_key, "change", new_semantics)]
+        stream_operation.claims = [(("edge", start_key, end_key, new_semantics), ("change", edge_key))]
+
+    def move_node_to_other_group(self, stream_operation: StreamOperation, node_name: str, old_group_name: str, new_group_name: str):
+        node_key = self.element_key(node_name)
+        new_group_key = self.element_key(new_group_name)
+        stream_operation.references = (node_key, self.element_key(old_group_name), new_group_key)
+        stream_operation.effects = [(node_key, "move", new_group_key), (new_group_key, "use", None)]
+
+    def join_groups(self, stream_operation: StreamOperation, group1_name: str, group2_name: str, new_group_name: str):
+        group1_key = self.element_key(group1_name)
+        group2_key = self.element_key(group2_name)
+        stream_operation.references = (group1_key, group2_key, None)
+        joined = (frozenset((group1_key, group2_key)), new_group_name)
+        stream_operation.effects = [(group1_key, "join", joined), (group2_key, "join", joined)]
+        stream_operation.claims = [(("name", new_group_name), ("JoinGroups", joined))]
+
+        def after():
+            stream_operation.created = self.element_key(new_group_name)
+        return after
+
+# CONFLICT DETECTION
+
+# changes of an element that replace each other within one evolution, only the last value counts
+CHANGES = ["rename", "move", "change", "join"]
+
+def index_effects(stream_operations: list[StreamOperation]) -> dict[tuple, dict[str, tuple]]:
+    '''
+    Per element key and action, the value the evolution finally gives it and the operations involved:
+    key -> action -> (value, [operations]).
+    '''
+    index = {}
+    for stream_operation in stream_operations:
+        if not stream_operation.valid:
+            continue
+        for key, action, value in stream_operation.effects:
+            actions = index.setdefault(key, {})
+            operations = actions[action][1] if action in actions else []
+            operations.append(stream_operation)
+            actions[action] = (value, operations)
+    return index
+
+def compare_element(actions_a: dict[str, tuple], actions_b: dict[str, tuple]) -> tuple[list[tuple], list[str]]:
+    '''
+    Compares what a and b do to one element. Returns the conflicts as (action of a, action of b) and the
+    actions both evolutions did the same way.
+    '''
+    if "delete" in actions_a and "delete" in actions_b:
+        return [], ["delete"]
+    if "delete" in actions_a:
+        return [("delete", action) for action in actions_b], []
+    if "delete" in actions_b:
+        return [(action, "delete") for action in actions_a], []
+    conflicts = []
+    duplicates = []
+    for action in CHANGES:
+        if action in actions_a and action in actions_b:
+            if actions_a[action][0] == actions_b[action][0]:
+                duplicates.append(action)
+            else:
+                conflicts.append((action, action))
+    # the name of joined groups is given by the join
+    if "join" in actions_a and "join" not in actions_b and "rename" in actions_b:
+        conflicts.append(("join", "rename"))
+    if "join" in actions_b and "join" not in actions_a and "rename" in actions_a:
+        conflicts.append(("rename", "join"))
+    # renamed, moved or changed elements are still there to be used, joined groups live on in the new group
+    return conflicts, duplicates
+
+def index_claims(stream_operations: list[StreamOperation]) -> dict[tuple, list[tuple]]:
+    index = {}
+    for stream_operation in stream_operations:
+        if not stream_operation.valid:
+            continue
+        for claim, signature in stream_operation.claims:
+            index.setdefault(claim, []).append((stream_operation, signature))
+    return index
+
+def detect_conflicts(operations_a: list[StreamOperation], operations_b: list[StreamOperation], labels: dict) -> tuple[list[Conflict], list[tuple]]:
+    '''
+    Compares the two evolutions element by element: only the operations indexed under the same element key
+    (or the same claimed name) are compared, never all pairs of operations.
+    Returns the conflicts and the (a, b) pairs of duplicate operations.
+    '''
+    conflicts = {}
+    duplicates = {}
+
+    def conflict(kind: str, element: str, stream_operations_a: list[StreamOperation], stream_operations_b: list[StreamOperation]):
+        key = (kind, element)
+        if key not in conflicts:
+            conflicts[key] = Conflict(kind, element)
+        conflicts[key].add(stream_operations_a)
+        conflicts[key].add(stream_operations_b)
+
+    effects_a = index_effects(operations_a)
+    effects_b = index_effects(operations_b)
+    if len(effects_b) < len(effects_a):
+        shared_keys = [key for key in effects_b if key in effects_a]
+    else:
+        shared_keys = [key for key in effects_a if key in effects_b]
+    for key in shared_keys:
+        actions_a = effects_a[key]
+        actions_b = effects_b[key]
+        conflicting_actions, duplicate_actions = compare_element(actions_a, actions_b)
+        for action_a, action_b in conflicting_actions:
+            conflict("%s/%s" % (action_a, action_b), labels.get(key, str(key)), actions_a[action_a][1], actions_b[action_b][1])
+        for action in duplicate_actions:
+            # an operation of b is a duplicate if a did the same to the element of its main effect,
+            # deletions are also duplicated by implicit deletions of a (e.g. of the edges of a deleted node)
+            # and make whatever else b did to the element before deleting it obsolete
+            for action_b in (actions_b if action == "delete" else [action]):
+                for stream_operation_b in actions_b[action_b][1]:
+                    if stream_operation_b.effects[0][0] == key:
+                        duplicates.setdefault(stream_operation_b, []).extend(actions_a[action][1])
+
+    claims_a = index_claims(operations_a)
+    claims_b = index_claims(operations_b)
+    for claim, entries_b in claims_b.items():
+        entries_a = claims_a.get(claim)
+        if entries_a is None:
+            continue
+        for stream_operation_a, signature_a in entries_a:
+            for stream_operation_b, signature_b in entries_b:
+                if signature_a == signature_b:
+                    duplicates.setdefault(stream_operation_b, []).append(stream_operation_a)
+                elif claim[0] == "name":
+                    conflict("name clash", "name %s" % claim[1], [stream_operation_a], [stream_operation_b])
+                elif claim[0] == "edge":
+                    conflict("edge clash", "edge %s -> %s: %s" % (labels.get(claim[1]), labels.get(claim[2]), claim[3]),
+                             [stream_operation_a], [stream_operation_b])
+
+    conflicting = set(operation for conflict_ in conflicts.values() for operation in conflict_.members)
+    duplicate_pairs = []
+    for b, candidates in duplicates.items():
+        # a duplicate is only left out if a applies the same change (e.g. the same implicit deletion) without conflict
+        a = next((a for a in candidates if a not in conflicting), None)
+        if a is not None and b not in conflicting:
+            duplicate_pairs.append((a, b))
+    return list(conflicts.values()), duplicate_pairs
+
+# MERGING
+
+class MergedNames:
+    '''
+    The current names of element keys in the merged graph (edges: their semantics, properties: their names).
+    '''
+
+    def __init__(self, base: Graph):
+        self.names: dict[tuple, str] = {}
+        # keys of joined groups -> the key of the new group
+        self.aliases: dict[tuple, tuple] = {}
+        for group in base.groups:
+            self.names[("element", group.uid)] = group.name
+            for node in group.nodes:
+                self.names[("element", node.uid)] = node.name
+        for edge in base.directed_edges:
+            self.names[("edge", edge.uid)] = edge.semantics
+
+    def resolve(self, key: tuple) -> tuple:
+        while key in self.aliases:
+            key = self.aliases[key]
+        return key
+
+    def name(self, key: tuple) -> str:
+        key = self.resolve(key)
+        name = self.names.get(key)
+        if name is None and key[0] == "property" and isinstance(key[2], str):
+            # a base property nobody renamed
+            return key[2]
+        if name is None:
+            raise KeyError(key)
+        return name
+
+    def set(self, key: tuple, name: str):
+        self.names[self.resolve(key)] = name
+
+# operations naming the current group of a node, which is taken from the merged graph instead
+# (it differs if the other evolution moved the node or the group was never created): tag -> argument index
+CURRENT_GROUP_ARGUMENTS = {"DeleteNode": 1, "MoveNodeToOtherGroup": 1}
+
+def translate_arguments(stream_operation: StreamOperation, names: MergedNames, graph: Graph) -> tuple:
+    arguments = []
+    current_group_index = CURRENT_GROUP_ARGUMENTS.get(stream_operation.operation.tag)
+    for index, (argument, reference) in enumerate(zip(stream_operation.operation.arguments, stream_operation.references)):
+        if index == current_group_index:
+            group = graph.get_group_of_node(arguments[0])
+            if group is None:
+                raise KeyError(arguments[0])
+            arguments.append(group.name)
+        else:
+            arguments.append(argument if reference is None else names.name(reference))
+    return tuple(arguments)
+
+def update_names(stream_operation: StreamOperation, arguments: tuple, names: MergedNames):
+    tag = stream_operation.operation.tag
+    if tag in ("RenameNode", "RenameGroup"):
+        names.set(stream_operation.references[0], arguments[1])
+    elif tag == "RenameProperty":
+        names.set(stream_operation.references[1], arguments[2])
+    elif tag == "ChangeSemanticsDirectedEdge":
+        names.set(stream_operation.references[2], arguments[3])
+    elif tag in ("AddNode", "AddGroup", "AddProperty"):
+        names.set(stream_operation.created, arguments[-1] if tag != "AddNode" else arguments[0])
+    elif tag == "AddDirectedEdge":
+        names.set(stream_operation.created, arguments[2])
+    elif tag == "JoinGroups":
+        names.set(stream_operation.created, arguments[2])
+        names.aliases[stream_operation.references[0]] = stream_operation.created
+        names.aliases[stream_operation.references[1]] = stream_operation.created
+
+def is_deleted(graph: Graph, tag: str, arguments: tuple) -> bool:
+    '''
+    True if the element a delete operation with these arguments would delete does not exist.
+    '''
+    if tag == "DeleteNode":
+        return graph.get_node(arguments[0]) is None
+    if tag == "DeleteGroup":
+        return graph.get_group(arguments[0]) is None
+    if tag == "DeleteDirectedEdge":
+        return graph.get_directed_edge(*arguments) is None
+    if tag == "DeleteProperty":
+        node = graph.get_node(arguments[0])
+        return node is None or arguments[1] not in node.properties
+    return False
+
+def merge_graphs(base: Graph, plan_a: OperationPlan, plan_b: OperationPlan, strategy: str = "base") -> MergeResult:
+    '''
+    Three-way merge of two evolutions of base. Both evolutions are resolved against the base, conflicting
+    operations are detected per element and left out (strategy base: on both sides, a / b: on the other side),
+    duplicates of b are applied once. The remaining operations of a and then of b are applied to a fork of
+    base, with their arguments translated to the names the elements have in the merged graph.
+    '''
+    if strategy not in STRATEGIES:
+        raise Exception("Unknown merge strategy: %s" % strategy)
+    names = MergedNames(base)
+    labels = {}
+    streams = {"a": StreamResolver(base, names.names, "a", labels).resolve(plan_a)}
+    streams["b"] = StreamResolver(base, names.names, "b", labels, index_claims(streams["a"])).resolve(plan_b)
+    result = MergeResult(base.fork(), strategy)
+    result.conflicts, result.duplicates = detect_conflicts(streams["a"], streams["b"], labels)
+
+    excluded = set()
+    for conflict in result.conflicts:
+        for evolution in EVOLUTIONS:
+            if strategy == evolution:
+                continue
+            excluded.update(conflict.operations[evolution])
+    duplicates_of_b = set(b for _, b in result.duplicates)
+    # keys of elements whose creating operation was not applied
+    not_created = set()
+
+    for evolution in EVOLUTIONS:
+        for stream_operation in streams[evolution]:
+            if not stream_operation.valid:
+                result.invalid.append(stream_operation)
+                continue
+            if stream_operation in excluded:
+                result.skipped.append(stream_operation)
+                not_created.add(stream_operation.created)
+                continue
+            if stream_operation in duplicates_of_b:
+                continue
+            try:
+                arguments = translate_arguments(stream_operation, names, result.graph)
+            except KeyError:
+                if any(reference in not_created for reference in stream_operation.references):
+                    reason = "depends on an element created by an operation that was not applied"
+                else:
+                    reason = "an element it refers to does not exist in the merged graph"
+                result.failed.append((stream_operation, reason))
+                not_created.add(stream_operation.created)
+                continue
+            if not OPERATIONS[stream_operation.operation.tag][0](result.graph, *arguments):
+                if is_deleted(result.graph, stream_operation.operation.tag, arguments):
+                    result.obsolete.append(stream_operation)
+                    continue
+                result.failed.append((stream_operation, "not applicable to the merged graph as %s%s" % (stream_operation.operation.tag, arguments)))
+                not_created.add(stream_operation.created)
+                continue
+            update_names(stream_operation, arguments, names)
+            result.applied[evolution] += 1
+    for conflict in result.conflicts:
+        logger.debug("%s", conflict)
+    logger.info("Merged: %s", result.summary())
+    return result
+
+def merge_data_point(data_point_dir: str, output_dir: str, schemas: Schemas, strategy: str = "base") -> MergeResult:
+    '''
+    Merges evolution_a and evolution_b of a data point into output_dir/graph_merged.xml and writes the
+    conflict report to output_dir/merge_report.json.
+    '''
+    base = load_validated_graph(os.path.join(data_point_dir, "base.xml"), schemas.graph_xsd_path, schemas.validator)
+    plans = []
+    for evolution in EVOLUTIONS:
+        operations_path = os.path.join(data_point_dir, "evolution_%s.xml" % evolution)
+        operations_xml = xml_from_file(operations_path)
+        if not schemas.validator.validate(operations_path, schemas.operations_xsd_path, operations_xml):
+            raise Exception("Invalid evolution_%s" % evolution)
+        plans.append(compile_operations(operations_xml))
+    result = merge_graphs(base, plans[0], plans[1], strategy)
+    os.makedirs(output_dir, exist_ok=True)
+    serialize_graph(result.graph, os.path.join(output_dir, MERGED_GRAPH_FILE_NAME), schemas.template_path)
+    with open(os.path.join(output_dir, MERGE_REPORT_FILE_NAME), "w") as report_file:
+        json.dump(result.to_dict(), report_file, indent=1)
+    return result
+
+def _merge_data_point(data_point_dir: str, output_dir: str, schemas: Schemas, strategy: str) -> tuple[str, str]:
+    try:
+        return merge_data_point(data_point_dir, output_dir, schemas, strategy).summary(), None
+    except Exception as e:
+        return None, "%s: %s" % (type(e).__name__, str(e))
+
+def _merge_data_point_in_worker(data_point_dir: str, output_dir: str, strategy: str) -> tuple[str, str]:
+    return _merge_data_point(data_point_dir, output_dir, worker_schemas(), strategy)
+
+def merge_all(data_root: str, gen_root: str, meta_dir: str, strategy: str = "base", workers: int = 1,
+              validation_cache_dir: str = DEFAULT_VALIDATION_CACHE_DIR) -> int:
+    '''
+    Merges every data point in data_root into gen_root/<id>/, returns the number of failures.
+    The schemas are compiled once per process and models validated unchanged before are not validated again.
+    '''
+    names = sorted(entry.name for entry in os.scandir(data_root) if entry.is_dir())
+    arguments = [(os.path.join(data_root, name), os.path.join(gen_root, name), strategy) for name in names]
+    if workers <= 1:
+        schemas = Schemas(meta_dir, validation_cache_dir)
+        outcomes = [_merge_data_point(data_point_dir, output_dir, schemas, strategy) for data_point_dir, output_dir, _ in arguments]
+    else:
+        log_level = logging.getLogger().getEffectiveLevel()
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(meta_dir, validation_cache_dir, log_level)) as executor:
+            outcomes = list(executor.map(_merge_data_point_in_worker, *zip(*arguments)))
+    failed = 0
+    for name, (summary, error) in zip(names, outcomes):
+        if error is None:
+            logger.info("%s: %s", name, summary)
+        else:
+            logger.error("%s: FAILED %s", name, error)
+            failed += 1
+    logger.info("%d data points merged, %d failed", len(names), failed)
+    return failed
+
+def main():
+    parser = argparse.ArgumentParser(description="Three-way merge of the two evolutions of data points with conflict detection.")
+    parser.add_argument("--log-level", choices=LOG_LEVELS.keys(), default="info",
+                        help="quiet only reports problems, debug also lists every conflict (default: info)")
+    parser.add_argument("--strategy", choices=STRATEGIES, default="base",
+                        help="which side of a conflict is kept: base leaves out the operations of both sides (default: base)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    data_point_parser = commands.add_parser("data-point", help="merge one data point")
+    data_point_parser.add_argument("data_point_dir", help="the data point containing base.xml, evolution_a.xml and evolution_b.xml")
+    data_point_parser.add_argument("output_dir", help="the directory to write graph_merged.xml and merge_report.json to")
+    data_point_parser.add_argument("meta_dir", help="the directory containing graph.xsd, operations.xsd and graph_template.xml")
+
+    batch_parser = commands.add_parser("batch", help="merge every data point in data/ into gen/")
+    batch_parser.add_argument("data_root", help="the data/ directory")
+    batch_parser.add_argument("gen_root", help="the gen/ directory")
+    batch_parser.add_argument("meta_dir", help="the directory containing graph.xsd, operations.xsd and graph_template.xml")
+    batch_parser.add_argument("-j", "--workers", type=int, default=os.cpu_count(), help="number of worker processes (default: number of CPUs)")
+    add_validation_arguments(parser)
+
+    args = parser.parse_args()
+    configure_logging(args.log_level)
+
+    validation_cache_dir = None if args.no_validation_cache else args.validation_cache
+    if args.command == "batch":
+        return 1 if merge_all(args.data_root, args.gen_root, args.meta_dir, args.strategy, args.workers, validation_cache_dir) else 0
+    merge_data_point(args.data_point_dir, args.output_dir, Schemas(args.meta_dir, validation_cache_dir), args.strategy)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,86 @@
+'''
+Copyright (C) 2024 Karl Kegel
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+'''
+
+from collections import OrderedDict
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_SIZE = 32
+
+def file_version(path: str) -> tuple[int, int]:
+    stat = os.stat(path)
+    return (stat.st_mtime_ns, stat.st_size)
+
+class FileCache:
+    '''
+    Least recently used cache of the models loaded from files, holding at most max_entries of them.
+    An entry is only used while its file is unchanged (same modification time and size).
+    '''
+
+    def __init__(self, max_entries: int = DEFAULT_CACHE_SIZE):
+        self.max_entries: int = max_entries
+        # absolute path -> (file version, model), the least recently used entry first
+        self.entries: OrderedDict[str, tuple] = OrderedDict()
+        self.hits: int = 0
+        self.misses: int = 0
+
+    def load(self, path: str, loader, *args):
+        '''
+        Returns the model of the file in path, loaded by loader(path, *args) unless it is cached.
+        '''
+        key = os.path.abspath(path)
+        # the version is taken before loading, a file changed while it is loaded is loaded again next time
+        version = file_version(path)
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] == version:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            logger.debug("Cache hit: %s", path)
+            return entry[1]
+        self.misses += 1
+        self.entries.pop(key, None)
+        model = loader(path, *args)
+        if self.max_entries > 0:
+            self.entries[key] = (version, model)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return model
+
+    def clear(self):
+        self.entries.clear()
+
+    def __str__(self):
+        return "%d entries, %d hits, %d misses" % (len(self.entries), self.hits, self.misses)
+
+class ModelCache:
+    '''
+    The parsed and validated base graphs and the compiled operation plans of the data points, kept in memory
+    across runs of the pipeline. Cached graphs are never modified, every evolution works on a fork.
+    '''
+
+    def __init__(self, max_entries: int = DEFAULT_CACHE_SIZE):
+        self.graphs: FileCache = FileCache(max_entries)
+        self.plans: FileCache = FileCache(max_entries)
+
+    def clear(self):
+        self.graphs.clear()
+        self.plans.clear()
+
+    def __str__(self):
+        return "graphs: %s, plans: %s" % (self.graphs, self.plans)
@@ -0,0 +1,107 @@
+'''
+Copyright (C) 2024 Karl Kegel
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+'''
+
+import contextlib
+import csv
+import json
+import os
+import time
+
+PROFILE_FORMATS = ["json", "csv"]
+CSV_COLUMNS = ["section", "key", "count", "total_seconds", "max_seconds", "mean_seconds"]
+
+class TimingStatistics:
+    __slots__ = ("count", "total", "max")
+
+    def __init__(self):
+        self.count: int = 0
+        self.total: float = 0.0
+        self.max: float = 0.0
+
+    def add(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "total_seconds": self.total,
+            "max_seconds": self.max,
+            "mean_seconds": self.total / self.count if self.count else 0.0,
+        }
+
+class EvolutionProfile:
+    '''
+    Opt-in timings of one evolution: the duration of the pipeline stages and count, total and maximum time
+    of the applied operations per operation tag and per semantic edit.
+    '''
+
+    def __init__(self):
+        self.stages: dict[str, float] = {}
+        self.tags: dict[str, TimingStatistics] = {}
+        self.semantic_edits: dict[int, TimingStatistics] = {}
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - start
+
+    def record(self, tag: str, semantic_edit_index: int, seconds: float):
+        statistics = self.tags.get(tag)
+        if statistics is None:
+            statistics = self.tags[tag] = TimingStatistics()
+        statistics.add(seconds)
+        statistics = self.semantic_edits.get(semantic_edit_index)
+        if statistics is None:
+            statistics = self.semantic_edits[semantic_edit_index] = TimingStatistics()
+        statistics.add(seconds)
+
+    def to_dict(self) -> dict:
+        return {
+            "stages": {name: {"seconds": seconds} for name, seconds in self.stages.items()},
+            "operation_tags": {tag: statistics.to_dict() for tag, statistics in sorted(self.tags.items())},
+            "semantic_edits": {str(index): statistics.to_dict() for index, statistics in sorted(self.semantic_edits.items())},
+        }
+
+    def rows(self) -> list[list]:
+        rows = [["stage", name, 1, seconds, seconds, seconds] for name, seconds in self.stages.items()]
+        for section, table in (("operation_tag", self.tags), ("semantic_edit", self.semantic_edits)):
+            for key, statistics in sorted(table.items()):
+                values = statistics.to_dict()
+                rows.append([section, key] + [values[column] for column in CSV_COLUMNS[2:]])
+        return rows
+
+    def write(self, path: str, profile_format: str = "json"):
+        if profile_format == "csv":
+            with open(path, "w", newline="") as output_file:
+                writer = csv.writer(output_file)
+                writer.writerow(CSV_COLUMNS)
+                writer.writerows(self.rows())
+        else:
+            with open(path, "w") as output_file:
+                json.dump(self.to_dict(), output_file, indent=1)
+
+def profile_path(output_path: str, profile_format: str = "json") -> str:
+    '''
+    The report of the evolution writing output_path: gen/<id>/graph_a.xml -> gen/<id>/graph_a_profile.json
+    '''
+    return os.path.splitext(output_path)[0] + "_profile." + profile_format
@@ -0,0 +1,148 @@
+'''
+Copyright (C) 2024 Karl Kegel
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+'''
+
+import collections
+import os
+
+from lxml import etree
+import pytest
+
+# the adjacency arrays and analytics.py need NumPy (see requirements-analytics.txt)
+numpy = pytest.importorskip("numpy")
+
+from adjacency import Adjacency, NAMESPACE, load_adjacency
+from analytics import analyze, in_degrees, out_degrees, reachable, semantics_counts
+from evolve import Graph, Group, Node, DirectedEdge, serialize_graph
+
+TEMPLATE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "meta", "XSL", "graph_template.xml")
+
+GROUPS = [("g1", ["a", "b", "c"]), ("g2", ["d", "e"]), ("g3", []), ("g4", ["f"])]
+# a cycle a -> b -> c -> a, edges from and to groups, a self loop and parallel edges with other semantics
+EDGES = [("a", "b", "s"), ("b", "c", "s"), ("c", "a", "t"), ("d", "a", "s"), ("g2", "d", "u"), ("d", "g3", "s"),
+         ("e", "e", "t"), ("a", "b", "t"), ("f", "g1", "u"), ("b", "g2", "s")]
+
+@pytest.fixture
+def graph() -> Graph:
+    graph = Graph()
+    for group_name, node_names in GROUPS:
+        assert graph.add_group(Group(group_name))
+        for node_name in node_names:
+            assert graph.add_node(Node(node_name), group_name)
+    for start, end, semantics in EDGES:
+        assert graph.add_directed_edge(DirectedEdge(start, end, semantics))
+    return graph
+
+def expected_names() -> list[str]:
+    return [node for _, nodes in GROUPS for node in nodes] + [group for group, _ in GROUPS]
+
+def edges_of(adjacency: Adjacency) -> dict[str, list[tuple[str, str]]]:
+    '''
+    The (end, semantics) of the edges leaving every element, read from the CSR arrays.
+    '''
+    return {name: [(adjacency.names[adjacency.targets[edge]], adjacency.semantics[adjacency.labels[edge]])
+                   for edge in range(adjacency.offsets[element], adjacency.offsets[element + 1])]
+            for element, name in enumerate(adjacency.names)}
+
+def expected_edges(edges: list[tuple[str, str, str]]) -> dict[str, list[tuple[str, str]]]:
+    result = {name: [] for name in expected_names()}
+    for start, end, semantics in edges:
+        result[start].append((end, semantics))
+    return result
+
+def reachable_names(edges: list[tuple[str, str, str]], sources: list[str]) -> set[str]:
+    seen = set(sources)
+    stack = list(sources)
+    while stack:
+        name = stack.pop()
+        for start, end, _ in edges:
+            if start == name and end not in seen:
+                seen.add(end)
+                stack.append(end)
+    return seen
+
+def check_adjacency(adjacency: Adjacency, edges: list[tuple[str, str, str]]):
+    names = expected_names()
+    assert adjacency.names == names
+    assert adjacency.node_count == 6
+    assert adjacency.group_count == 4
+    assert adjacency.edge_count == len(edges)
+    group_of = {node: group for group, nodes in GROUPS for node in nodes}
+    assert [names[group] for group in adjacency.node_groups] == [group_of[node] for node in names[:6]]
+    assert edges_of(adjacency) == expected_edges(edges)
+    # the edges keep their position in the document
+    assert [EDGES[index][:2] for index in adjacency.edge_indexes] == [
+        (adjacency.names[start], adjacency.names[end]) for start in range(adjacency.element_count)
+        for end in adjacency.targets[adjacency.offsets[start]:adjacency.offsets[start + 1]]]
+    assert all(adjacency.id(name) == index for index, name in enumerate(names))
+    assert adjacency.id("missing") is None
+
+def test_to_adjacency(graph):
+    adjacency = graph.to_adjacency()
+    check_adjacency(adjacency, EDGES)
+    assert adjacency.dangling_edges == []
+
+def test_load_adjacency(graph, tmp_path):
+    path = str(tmp_path / "graph.xml")
+    serialize_graph(graph, path, TEMPLATE_PATH)
+    # load_graph rejects edges between missing elements, load_adjacency reports them
+    document = etree.parse(path)
+    etree.SubElement(document.getroot(), NAMESPACE + "DirectedEdge", start="a", end="missing", semantics="s")
+    document.write(path)
+    adjacency = load_adjacency(path)
+    check_adjacency(adjacency, EDGES)
+    assert adjacency.dangling_edges == [("a", "missing", "s")]
+
+def test_degrees(graph):
+    adjacency = graph.to_adjacency()
+    out_degree = collections.Counter(start for start, _, _ in EDGES)
+    in_degree = collections.Counter(end for _, end, _ in EDGES)
+    assert out_degrees(adjacency).tolist() == [out_degree[name] for name in adjacency.names]
+    assert in_degrees(adjacency).tolist() == [in_degree[name] for name in adjacency.names]
+    assert semantics_counts(adjacency) == collections.Counter(semantics for _, _, semantics in EDGES)
+
+@pytest.mark.parametrize("sources", [["a"], ["e"], ["f"], ["g3"], ["g2", "e"], []])
+def test_reachable(graph, sources):
+    adjacency = graph.to_adjacency()
+    visited = reachable(adjacency, [adjacency.id(name) for name in sources])
+    assert {adjacency.names[element] for element in numpy.flatnonzero(visited)} == reachable_names(EDGES, sources)
+
+def test_analyze(graph):
+    adjacency = graph.to_adjacency()
+    names = expected_names()
+    out_degree = collections.Counter(start for start, _, _ in EDGES)
+    in_degree = collections.Counter(end for _, end, _ in EDGES)
+    roots = [name for name in names if in_degree[name] == 0]
+    report = analyze(adjacency)
+    assert report["nodes"] == 6
+    assert report["groups"] == 4
+    assert report["directed_edges"] == len(EDGES)
+    assert report["out_degree"]["max"] == max(out_degree.values())
+    assert out_degree[report["out_degree"]["max_element"]] == max(out_degree.values())
+    assert report["out_degree"]["mean"] == pytest.approx(len(EDGES) / len(names))
+    assert report["in_degree"]["max"] == max(in_degree.values())
+    assert in_degree[report["in_degree"]["max_element"]] == max(in_degree.values())
+    assert report["roots"] == len(roots)
+    assert report["isolated"] == sum(1 for name in names if in_degree[name] == 0 and out_degree[name] == 0)
+    assert report["reachable_from_roots"] == len(reachable_names(EDGES, roots))
+    assert report["semantics"] == collections.Counter(semantics for _, _, semantics in EDGES)
+    assert report["dangling_edges"] == []
+
+def test_empty_graph():
+    report = analyze(Graph().to_adjacency())
+    assert report["directed_edges"] == 0
+    assert report["out_degree"] == {"max": 0, "max_element": None, "mean": 0.0}
+    assert report["reachable_from_roots"] == 0
@@ -0,0 +1,172 @@
+'''
+Copyright (C) 2024 Karl Kegel
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+'''
+
+import os
+import random
+
+import pytest
+
+from binary_graph import BinaryGraph, HEADER, write_graph_binary, load_graph_binary, verify_round_trip
+from evolve import Graph, Group, Node, DirectedEdge, serialize_graph
+
+TEMPLATE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "meta", "XSL", "graph_template.xml")
+
+# names that need escaping in XML or are not ASCII
+SPECIAL_NAMES = ["<a & b>", "\"quoted\" 'name'", "größe", "节点", "emoji 😀", "tab\tname", "a]]>b", ""]
+
+def make_graph(groups: list[tuple[str, list[tuple[str, list[str]]]]], edges: list[tuple[str, str, str]]) -> Graph:
+    '''
+    Builds a graph from (group name, [(node name, properties)]) and (start, end, semantics).
+    '''
+    graph = Graph()
+    for group_name, nodes in groups:
+        assert graph.add_group(Group(group_name))
+        for node_name, properties in nodes:
+            node = Node(node_name)
+            node.properties = list(properties)
+            assert graph.add_node(node, group_name)
+    for start, end, semantics in edges:
+        assert graph.add_directed_edge(DirectedEdge(start, end, semantics))
+    return graph
+
+def contents(graph: Graph) -> tuple:
+    groups = [(group.name, [(node.name, list(node.properties)) for node in group.nodes]) for group in graph.groups]
+    return groups, [(edge.start, edge.end, edge.semantics) for edge in graph.directed_edges]
+
+def random_graph(rnd: random.Random) -> Graph:
+    names = ["n%d" % index for index in range(rnd.randrange(0, 40))] + rnd.sample(SPECIAL_NAMES, 3)
+    rnd.shuffle(names)
+    group_count = rnd.randrange(1, 6)
+    groups = [(names[index], []) for index in range(group_count)]
+    for name in names[group_count:]:
+        # properties repeat, reuse names and may occur twice on a node
+        properties = [rnd.choice(["p", "q", name, "ü<&>"]) for _ in range(rnd.randrange(0, 4))]
+        rnd.choice(groups)[1].append((name, properties))
+    edges = []
+    if rnd.random() < .8:
+        edges = sorted({(rnd.choice(names), rnd.choice(names), rnd.choice(["s", "t", "ß"])) for _ in range(rnd.randrange(0, 60))})
+        rnd.shuffle(edges)
+    return make_graph(groups, edges)
+
+EDGE_CASES = {
+    "empty graph": ([], []),
+    "empty groups": ([("g1", []), ("g2", [("a", ["p"])]), ("g3", [])], [("a", "g1", "s")]),
+    "nodes without properties": ([("g", [("a", []), ("b", []), ("c", ["p"]), ("d", [])])], [("a", "b", "s"), ("d", "c", "s")]),
+    "duplicate properties": ([("g", [("a", ["p", "p", "a"]), ("b", ["g", "p"])])], [("b", "a", "p")]),
+    "special names": ([(SPECIAL_NAMES[0], [(name, [name, "<p>"]) for name in SPECIAL_NAMES[1:]])],
+                      [(SPECIAL_NAMES[index], SPECIAL_NAMES[-index], "s & <t>") for index in range(1, len(SPECIAL_NAMES))]),
+    "no edges": ([("g1", [("a", ["p"]), ("b", [])]), ("g2", [("c", ["q"])])], []),
+}
+
+def round_trip(graph: Graph, tmp_path) -> Graph:
+    path = str(tmp_path / "graph.mbg")
+    write_graph_binary(graph, path)
+    return load_graph_binary(path)
+
+@pytest.mark.parametrize("case", EDGE_CASES)
+def test_edge_case_round_trip(case, tmp_path):
+    graph = make_graph(*EDGE_CASES[case])
+    assert contents(round_trip(graph, tmp_path)) == contents(graph)
+
+@pytest.mark.parametrize("seed", range(50))
+def test_random_round_trip(seed, tmp_path):
+    graph = random_graph(random.Random(seed))
+    assert contents(round_trip(graph, tmp_path)) == contents(graph)
+
+@pytest.mark.parametrize("case", ["empty groups", "nodes without properties", "special names", "no edges"])
+def test_xml_round_trip(case, tmp_path):
+    # the serialized XML of the graph is the same after the round trip through the binary format
+    xml_path = str(tmp_path / "graph.xml")
+    serialize_graph(make_graph(*EDGE_CASES[case]), xml_path, TEMPLATE_PATH)
+    assert verify_round_trip(xml_path, TEMPLATE_PATH)
+
+def test_lazy_access(tmp_path):
+    graph = random_graph(random.Random(7))
+    path = str(tmp_path / "graph.mbg")
+    write_graph_binary(graph, path)
+    groups, edges = contents(graph)
+    with BinaryGraph(path) as binary_graph:
+        assert binary_graph.group_count == len(groups)
+        assert [binary_graph.edge(edge) for edge in range(binary_graph.edge_count)] == edges
+        for group_name, nodes in groups:
+            group = binary_graph.find_group(group_name)
+            assert binary_graph.group_name(group) == group_name
+            assert [binary_graph.node_name(node) for node in binary_graph.group_nodes(group)] == [name for name, _ in nodes]
+            assert binary_graph.find_node(group_name) is None
+            for node_name, properties in nodes:
+                node = binary_graph.find_node(node_name)
+                assert binary_graph.node_name(node) == node_name
+                assert binary_graph.node_properties(node) == properties
+                assert binary_graph.find_group(node_name) is None
+        # properties and semantics are strings of the file but no elements
+        assert binary_graph.find_node("p") is None
+        assert binary_graph.find_group("missing") is None
+
+def test_close_releases_map(tmp_path):
+    path = str(tmp_path / "graph.mbg")
+    write_graph_binary(make_graph(*EDGE_CASES["special names"]), path)
+    binary_graph = BinaryGraph(path)
+    tables = [binary_graph.string_offsets, binary_graph.group_table, binary_graph.node_table, binary_graph.property_table,
+              binary_graph.edge_table]
+    binary_graph.close()
+    assert binary_graph.map.closed
+    for table in tables:
+        if isinstance(table, memoryview):
+            with pytest.raises(ValueError):
+                table[0]
+    # the file is not held open any more and can be replaced
+    os.replace(path, str(tmp_path / "moved.mbg"))
+
+def test_invalid_file(tmp_path):
+    path = str(tmp_path / "graph.mbg")
+    write_graph_binary(make_graph(*EDGE_CASES["no edges"]), path)
+    with open(path, "rb") as input_file:
+        data = input_file.read()
+    with open(path, "wb") as output_file:
+        output_file.write(data[:40])
+    with pytest.raises(Exception, match="Truncated"):
+        BinaryGraph(path)
+    # the map of the rejected file is closed, so it can be replaced
+    os.replace(path, str(tmp_path / "truncated.mbg"))
+    path = str(tmp_path / "truncated.mbg")
+    with open(path, "wb") as output_file:
+        output_file.write(b"NOTGRAPH" + data[8:])
+    with pytest.raises(Exception, match="Not a binary graph"):
+        BinaryGraph(path)
+
+@pytest.mark.parametrize("length", [0, 1, 8, HEADER.size - 1])
+def test_short_file(tmp_path, length):
+    path = str(tmp_path / "graph.mbg")
+    write_graph_binary(make_graph(*EDGE_CASES["no edges"]), path)
+    with open(path, "rb") as input_file:
+        data = input_file.read()
+    with open(path, "wb") as output_file:
+        output_file.write(data[:length])
+    with pytest.raises(Exception, match="Not a binary graph"):
+        BinaryGraph(path)
+
+def test_truncated_string_data(tmp_path):
+    path = str(tmp_path / "graph.mbg")
+    write_graph_binary(make_graph(*EDGE_CASES["no edges"]), path)
+    with open(path, "rb") as input_file:
+        data = input_file.read()
+    # the tables are complete, the last string is cut off
+    with open(path, "wb") as output_file:
+        output_file.write(data[:-1])
+    with pytest.raises(Exception, match="Truncated"):
+        BinaryGraph(path)
+    os.replace(path, str(tmp_path / "truncated.mbg"))
@@ -0,0 +1,303 @@
+'''
+Copyright (C) 2024 Karl Kegel
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+'''
+
+import collections
+import os
+import random
+
+import pytest
+
+from compaction import OperationCompactor
+from evolve import Graph, CompiledOperation, OperationPlan, OPERATIONS, apply_operations, serialize_graph_bytes
+
+TEMPLATE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "meta", "XSL", "graph_template.xml")
+
+# every rule of the OperationCompactor rule table
+RULES = ["rename chain", "rename back", "add and rename", "rename and delete", "add and delete", "operation on deleted node",
+         "add and change", "change back", "change chain", "change and delete", "move chain", "add and move"]
+
+def make_edits(*edits: list[tuple]) -> OperationPlan:
+    # one semantic edit per list of (tag, *arguments)
+    return OperationPlan([CompiledOperation(semantic_edit_index, operation_index, operation[0], tuple(operation[1:]))
+                          for semantic_edit_index, operations in enumerate(edits) for operation_index, operation in enumerate(operations)],
+                         len(edits))
+
+def make_plan(*operations: tuple) -> OperationPlan:
+    # a single semantic edit
+    return make_edits(list(operations))
+
+def build_graph(operations: list[tuple]) -> Graph:
+    graph = Graph()
+    for operation in operations:
+        assert OPERATIONS[operation[0]][0](graph, *operation[1:]), operation
+    return graph
+
+def base_graph() -> Graph:
+    return build_graph([
+        ("AddGroup", "g1"), ("AddGroup", "g2"), ("AddGroup", "g3"),
+        ("AddNode", "a", "g1"), ("AddNode", "b", "g1"), ("AddNode", "c", "g2"), ("AddNode", "d", "g3"),
+        ("AddProperty", "a", "p"),
+        ("AddDirectedEdge", "a", "b", "s"), ("AddDirectedEdge", "b", "c", "s"), ("AddDirectedEdge", "c", "a", "t"),
+        ("AddDirectedEdge", "a", "g2", "s"),
+    ])
+
+def random_base_graph(rnd: random.Random) -> Graph:
+    operations = [("AddGroup", "g%d" % group) for group in range(4)]
+    operations += [("AddNode", "n%d" % node, "g%d" % rnd.randrange(4)) for node in range(12)]
+    operations += [("AddProperty", "n%d" % rnd.randrange(12), rnd.choice("pq")) for _ in range(6)]
+    names = ["g%d" % group for group in range(4)] + ["n%d" % node for node in range(12)]
+    edges = {(rnd.choice(names), rnd.choice(names), rnd.choice("st")) for _ in range(20)}
+    operations += [("AddDirectedEdge",) + edge for edge in sorted(edges)]
+    return build_graph(operations)
+
+def apply_both(graph: Graph, plan: OperationPlan) -> OperationCompactor:
+    '''
+    Applies the plan and its compacted plan to forks of the graph and checks that both apply with the same
+    failed operations and serialize to the same bytes, returns the compactor.
+    '''
+    compactor = OperationCompactor()
+    compacted = compactor.compact(plan)
+    expected = graph.fork()
+    expected_failures = apply_operations(plan, expected, skip_failed_edits=True)
+    actual = graph.fork()
+    actual_failures = apply_operations(compacted, actual, skip_failed_edits=True)
+    assert [str(operation) for operation in actual_failures] == [str(operation) for operation in expected_failures]
+    assert serialize_graph_bytes(actual, TEMPLATE_PATH) == serialize_graph_bytes(expected, TEMPLATE_PATH)
+    return compactor
+
+def compacted(*operations: tuple) -> list[tuple]:
+    return [(operation.tag,) + operation.arguments for operation in OperationCompactor().compact(make_plan(*operations)).operations]
+
+@pytest.mark.parametrize("operations, expected, rule", [
+    # rename a->b, rename b->c
+    ([("RenameNode", "a", "x"), ("RenameNode", "x", "y")], [("RenameNode", "a", "y")], "rename chain"),
+    ([("RenameGroup", "g1", "x"), ("RenameGroup", "x", "y")], [("RenameGroup", "g1", "y")], "rename chain"),
+    ([("RenameNode", "a", "x"), ("RenameNode", "x", "a")], [], "rename back"),
+    ([("RenameGroup", "g1", "x"), ("RenameGroup", "x", "g1")], [], "rename back"),
+    # add b, rename b->c
+    ([("AddNode", "x", "g1"), ("RenameNode", "x", "y")], [("AddNode", "y", "g1")], "add and rename"),
+    ([("AddGroup", "x"), ("RenameGroup", "x", "y")], [("AddGroup", "y")], "add and rename"),
+    # rename a->b, delete b
+    ([("RenameNode", "a", "x"), ("DeleteNode", "x", "g1")], [("DeleteNode", "a", "g1")], "rename and delete"),
+    ([("RenameGroup", "g1", "x"), ("DeleteGroup", "x")], [("DeleteGroup", "g1")], "rename and delete"),
+    # add, delete
+    ([("AddGroup", "x"), ("DeleteGroup", "x")], [], "add and delete"),
+    ([("AddDirectedEdge", "a", "d", "s"), ("DeleteDirectedEdge", "a", "d", "s")], [], "add and delete"),
+    ([("AddProperty", "b", "q"), ("DeleteProperty", "b", "q")], [], "add and delete"),
+    ([("AddNode", "x", "g1"), ("DeleteNode", "x", "g1")], [], "add and delete"),
+    # add node, ..., delete node
+    ([("AddNode", "x", "g1"), ("AddProperty", "x", "q"), ("AddDirectedEdge", "x", "a", "s"), ("MoveNodeToOtherGroup", "x", "g1", "g2"),
+      ("DeleteNode", "x", "g2")], [], "operation on deleted node"),
+    # add/change edge, change semantics
+    ([("AddDirectedEdge", "a", "d", "s"), ("ChangeSemanticsDirectedEdge", "a", "d", "s", "t")], [("AddDirectedEdge", "a", "d", "t")],
+     "add and change"),
+    ([("ChangeSemanticsDirectedEdge", "a", "b", "s", "t"), ("ChangeSemanticsDirectedEdge", "a", "b", "t", "s")], [], "change back"),
+    ([("ChangeSemanticsDirectedEdge", "a", "b", "s", "t"), ("ChangeSemanticsDirectedEdge", "a", "b", "t", "u")],
+     [("ChangeSemanticsDirectedEdge", "a", "b", "s", "u")], "change chain"),
+    # change semantics, delete edge
+    ([("ChangeSemanticsDirectedEdge", "a", "b", "s", "t"), ("DeleteDirectedEdge", "a", "b", "t")], [("DeleteDirectedEdge", "a", "b", "s")],
+     "change and delete"),
+    # add/move node, move node
+    ([("MoveNodeToOtherGroup", "a", "g1", "g2"), ("MoveNodeToOtherGroup", "a", "g2", "g3")], [("MoveNodeToOtherGroup", "a", "g1", "g3")],
+     "move chain"),
+    ([("AddNode", "x", "g1"), ("MoveNodeToOtherGroup", "x", "g1", "g2")], [("AddNode", "x", "g2")], "add and move"),
+])
+def test_rule(operations, expected, rule):
+    assert compacted(*operations) == expected
+    assert apply_both(base_graph(), make_plan(*operations)).rules.get(rule, 0) > 0
+
+@pytest.mark.parametrize("operations", [
+    # the intermediate name is used in between
+    [("RenameNode", "a", "x"), ("AddDirectedEdge", "x", "b", "t"), ("RenameNode", "x", "y")],
+    # the final name was in use in between
+    [("RenameNode", "a", "x"), ("DeleteNode", "d", "g3"), ("RenameNode", "x", "d")],
+    # deleting a group frees the names of its nodes without naming them
+    [("RenameNode", "a", "x"), ("DeleteGroup", "g3"), ("RenameNode", "x", "d")],
+    # the node was renamed, its properties are not known
+    [("RenameNode", "a", "x"), ("AddProperty", "x", "q"), ("DeleteProperty", "x", "q")],
+    # a group is deleted in between, it may delete the node
+    [("AddProperty", "b", "q"), ("DeleteGroup", "g3"), ("DeleteProperty", "b", "q")],
+    # the rename back fails, renaming to the same name fails
+    [("RenameNode", "a", "x"), ("RenameNode", "x", "x")],
+    # the earlier semantic change fails
+    [("ChangeSemanticsDirectedEdge", "a", "b", "s", "s"), ("ChangeSemanticsDirectedEdge", "a", "b", "s", "t")],
+    # the deleted node was not added by the stream, the operations on it stay
+    [("AddProperty", "b", "q"), ("AddDirectedEdge", "b", "d", "s"), ("DeleteNode", "b", "g1")],
+    # another node is appended to the target group in between
+    [("MoveNodeToOtherGroup", "a", "g1", "g2"), ("AddNode", "x", "g3"), ("MoveNodeToOtherGroup", "a", "g2", "g3")],
+])
+def test_blocked(operations):
+    apply_both(base_graph(), make_plan(*operations))
+    assert compacted(*operations) == operations
+
+def test_semantic_edits_stay_apart():
+    # renaming back in the next semantic edit, which fails, must not undo the first edit as well
+    plan = make_edits([("RenameNode", "a", "y")], [("RenameNode", "y", "a"), ("DeleteNode", "missing", "g1")])
+    compactor = apply_both(base_graph(), plan)
+    assert not compactor.rules
+    graph = base_graph()
+    apply_operations(compactor.compact(plan), graph, skip_failed_edits=True)
+    assert graph.is_node("y") and not graph.is_node("a")
+
+@pytest.mark.parametrize("operations", [
+    # the node already exists, adding it fails
+    [("AddNode", "a", "g1"), ("DeleteNode", "a", "g1")],
+    [("AddGroup", "g1"), ("DeleteGroup", "g1")],
+    [("AddNode", "x", "missing"), ("AddProperty", "x", "p"), ("DeleteNode", "x", "g1")],
+    [("AddNode", "x", "g1"), ("AddDirectedEdge", "x", "missing", "s"), ("DeleteNode", "x", "g1")],
+    # the intermediate name is taken
+    [("RenameNode", "a", "b"), ("RenameNode", "b", "x")],
+    [("AddNode", "c", "g1"), ("RenameNode", "c", "x")],
+    [("RenameGroup", "g1", "g2"), ("DeleteGroup", "g2")],
+    [("AddProperty", "missing", "p"), ("DeleteProperty", "missing", "p")],
+    # the edge already exists or has no end
+    [("AddDirectedEdge", "a", "b", "s"), ("DeleteDirectedEdge", "a", "b", "s")],
+    [("AddDirectedEdge", "a", "missing", "s"), ("DeleteDirectedEdge", "a", "missing", "s")],
+    [("ChangeSemanticsDirectedEdge", "a", "b", "t", "s"), ("ChangeSemanticsDirectedEdge", "a", "b", "s", "t")],
+    [("AddDirectedEdge", "a", "b", "s"), ("ChangeSemanticsDirectedEdge", "a", "b", "s", "t")],
+    # the group in between does not exist
+    [("MoveNodeToOtherGroup", "a", "g1", "missing"), ("MoveNodeToOtherGroup", "a", "missing", "g3")],
+])
+def test_failing_edit(operations):
+    # the compacted operations would apply, the original ones fail: the conditions of the edit do not hold
+    graph = base_graph()
+    plan = make_plan(*operations)
+    compacted_plan = OperationCompactor().compact(plan)
+    assert len(compacted_plan.operations) < len(operations)
+    assert not compacted_plan.compacted_edits[0].conditions_hold(graph)
+    apply_both(graph, plan)
+    for applied_plan in (plan, compacted_plan):
+        with pytest.raises(Exception, match="Operation failed"):
+            apply_operations(applied_plan, graph.fork())
+
+def test_original_operations_applied():
+    # the node had the property before, deleting removes it: the conditions do not hold, the original operations apply
+    graph = base_graph()
+    plan = make_plan(("AddProperty", "a", "p"), ("DeleteProperty", "a", "p"))
+    assert OperationCompactor().compact(plan).operations == []
+    apply_both(graph, plan)
+    apply_operations(OperationCompactor().compact(plan), graph)
+    assert graph.get_node("a").properties == []
+
+def test_failing_edits_stay_whole():
+    # an edit whose operations are all compacted away still fails as a whole
+    plan = make_edits([("AddNode", "x", "g1")], [("AddNode", "a", "g1"), ("DeleteNode", "a", "g1")], [("DeleteNode", "x", "g1")])
+    compacted_plan = OperationCompactor().compact(plan)
+    assert [operation.semantic_edit_index for operation in compacted_plan.operations] == [0, 2]
+    assert [index for index, _ in compacted_plan.semantic_edits()] == [0, 1, 2]
+    failures = apply_operations(compacted_plan, base_graph(), skip_failed_edits=True)
+    assert [str(operation) for operation in failures] == ["AddNode(nodeName='a', groupName='g1')"]
+
+def random_operation(graph: Graph, rnd: random.Random, step: int, recent: list[str]) -> tuple:
+    '''
+    A random operation on the graph that prefers recently used names, so that the rules get a chance to apply.
+    '''
+    nodes = [node.name for group in graph.groups for node in group.nodes]
+    groups = [group.name for group in graph.groups]
+    edges = [(edge.start, edge.end, edge.semantics) for edge in graph.directed_edges]
+    names = nodes + groups
+    def pick(choices):
+        recent_choices = [name for name in recent if name in choices]
+        return rnd.choice(recent_choices) if recent_choices and rnd.random() < .8 else rnd.choice(choices)
+    def pick_edge():
+        recent_edges = [edge for edge in edges if edge[0] in recent or edge[1] in recent]
+        return rnd.choice(recent_edges) if recent_edges and rnd.random() < .8 else rnd.choice(edges)
+    fresh = "x%d" % step
+    # names that were used and are free again
+    free = [name for name in recent if name not in names] or [fresh]
+    def new_name():
+        # now and then a name that is taken, the operation fails
+        return pick(names) if names and rnd.random() < .1 else rnd.choice([fresh] + free)
+    choice = rnd.randrange(14)
+    if choice == 0 and names:
+        return ("AddDirectedEdge", pick(names), pick(names), rnd.choice("st"))
+    if choice == 1 and groups:
+        return ("AddNode", new_name(), pick(groups))
+    if choice == 2:
+        return ("AddGroup", new_name())
+    if choice == 3 and nodes:
+        node = pick(nodes)
+        return ("DeleteNode", node, graph.get_group_of_node(node).name)
+    if choice == 4 and edges:
+        return ("DeleteDirectedEdge",) + pick_edge()
+    if choice == 5 and groups:
+        return ("DeleteGroup", pick(groups))
+    if choice == 6 and nodes:
+        return ("AddProperty", pick(nodes), rnd.choice("pqr"))
+    if choice == 7 and nodes:
+        node = pick(nodes)
+        return ("DeleteProperty", node, rnd.choice(graph.get_node(node).properties + ["p"]))
+    if choice == 8 and nodes:
+        node = pick(nodes)
+        return ("RenameProperty", node, rnd.choice(graph.get_node(node).properties + ["p"]), rnd.choice("pqrs"))
+    if choice == 9 and groups:
+        return ("RenameGroup", pick(groups), new_name())
+    if choice == 10 and nodes:
+        return ("RenameNode", pick(nodes), new_name())
+    if choice == 11 and edges:
+        return ("ChangeSemanticsDirectedEdge",) + pick_edge() + (rnd.choice("stu"),)
+    if choice == 12 and nodes:
+        node = pick(nodes)
+        return ("MoveNodeToOtherGroup", node, graph.get_group_of_node(node).name, pick(groups))
+    if choice == 13 and len(groups) > 1:
+        group1, group2 = rnd.sample(groups, 2)
+        return ("JoinGroups", group1, group2, rnd.choice([group1, group2, fresh]))
+    return ("AddGroup", fresh)
+
+def random_plan(graph: Graph, rnd: random.Random) -> OperationPlan:
+    '''
+    A random operation stream in random semantic edits, about one in eight edits contains an operation that fails.
+    '''
+    graph = graph.fork()
+    operations = []
+    recent = []
+    step = 0
+    semantic_edit_count = rnd.randrange(5, 40)
+    for semantic_edit_index in range(semantic_edit_count):
+        graph.begin_transaction()
+        failed = False
+        for operation_index in range(rnd.randrange(1, 10)):
+            step += 1
+            operation = random_operation(graph, rnd, step, recent[-6:])
+            if OPERATIONS[operation[0]][0](graph, *operation[1:]):
+                operations.append(CompiledOperation(semantic_edit_index, operation_index, operation[0], operation[1:]))
+                recent.extend(operation[1:])
+            elif not failed and rnd.random() < .03:
+                # the following operations are only generated to be combined with the earlier ones
+                operations.append(CompiledOperation(semantic_edit_index, operation_index, operation[0], operation[1:]))
+                failed = True
+        if failed:
+            graph.rollback_transaction()
+        else:
+            graph.commit_transaction()
+    return OperationPlan(operations, semantic_edit_count)
+
+def test_random_streams():
+    rules = collections.Counter()
+    operation_count = 0
+    compacted_count = 0
+    for seed in range(300):
+        rnd = random.Random(seed)
+        graph = random_base_graph(rnd)
+        plan = random_plan(graph, rnd)
+        compactor = apply_both(graph, plan)
+        rules.update(compactor.rules)
+        operation_count += len(plan.operations)
+        compacted_count += sum(compactor.alive)
+    # the streams exercise every rule and actually get shorter
+    assert set(RULES) <= set(rules), set(RULES) - set(rules)
+    assert compacted_count < operation_count
@@ -0,0 +1,182 @@
+'''
+Copyright (C) 2024 Karl Kegel
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+'''
+
+import collections
+import random
+
+import pytest
+
+from diff import GraphDiff, diff_graphs
+from evolve import Graph, OPERATIONS
+
+def build_graph(operations: list[tuple]) -> Graph:
+    graph = Graph()
+    for operation in operations:
+        assert OPERATIONS[operation[0]][0](graph, *operation[1:]), operation
+    return graph
+
+def contents(graph: Graph) -> dict:
+    '''
+    The graph without the order of its elements: groups, the group and the properties (with repetitions) of every node and the edges.
+    '''
+    return {
+        "groups": {group.name for group in graph.groups},
+        "nodes": {node.name: group.name for group in graph.groups for node in group.nodes},
+        "properties": {node.name: collections.Counter(node.properties) for group in graph.groups for node in group.nodes},
+        "edges": {(edge.start, edge.end, edge.semantics) for edge in graph.directed_edges},
+    }
+
+def replay(graph: Graph, diff: GraphDiff) -> dict:
+    '''
+    Applies the delta to the contents of the graph, every change has to apply to the state it describes.
+    '''
+    state = contents(graph)
+    renames = dict(diff.renamed_nodes + diff.renamed_groups)
+    rename = lambda name: renames.get(name, name)
+    for name, group_name in diff.removed_nodes:
+        assert state["nodes"].pop(name) == group_name
+        del state["properties"][name]
+    for name in diff.removed_groups:
+        state["groups"].remove(name)
+    for old_name, new_name in diff.renamed_nodes:
+        assert old_name in state["nodes"]
+    for old_name, new_name in diff.renamed_groups:
+        assert old_name in state["groups"]
+    state["groups"] = {rename(name) for name in state["groups"]}
+    state["nodes"] = {rename(name): rename(group_name) for name, group_name in state["nodes"].items()}
+    state["properties"] = {rename(name): properties for name, properties in state["properties"].items()}
+    # edges of removed nodes keep the old names of their ends
+    state["edges"] = {(rename(start), rename(end), semantics) for start, end, semantics in state["edges"]}
+    for key in diff.removed_edges:
+        state["edges"].remove(key)
+    for start, end, old_semantics, new_semantics in diff.changed_edges:
+        state["edges"].remove((start, end, old_semantics))
+        assert (start, end, new_semantics) not in state["edges"]
+        state["edges"].add((start, end, new_semantics))
+    for key in diff.added_edges:
+        assert key not in state["edges"]
+        state["edges"].add(key)
+    for name in diff.added_groups:
+        assert name not in state["groups"]
+        state["groups"].add(name)
+    for name, group_name in diff.added_nodes:
+        assert name not in state["nodes"]
+        state["nodes"][name] = group_name
+        state["properties"][name] = collections.Counter()
+    for name, old_group_name, new_group_name in diff.moved_nodes:
+        assert state["nodes"][name] == rename(old_group_name)
+        state["nodes"][name] = new_group_name
+    for name, property_name in diff.removed_properties:
+        assert state["properties"][name][property_name] > 0
+        state["properties"][name][property_name] -= 1
+    for name, old_property_name, new_property_name in diff.renamed_properties:
+        assert state["properties"][name][old_property_name] > 0
+        state["properties"][name][old_property_name] -= 1
+        state["properties"][name][new_property_name] += 1
+    for name, property_name in diff.added_properties:
+        state["properties"][name][property_name] += 1
+    state["properties"] = {name: +properties for name, properties in state["properties"].items()}
+    return state
+
+def check_replay(old: Graph, new: Graph) -> GraphDiff:
+    diff = diff_graphs(old, new)
+    expected = contents(new)
+    expected["properties"] = {name: +properties for name, properties in expected["properties"].items()}
+    assert replay(old, diff) == expected
+    return diff
+
+def random_base_graph(rnd: random.Random) -> Graph:
+    operations = [("AddGroup", "g%d" % group) for group in range(4)]
+    operations += [("AddNode", "n%d" % node, "g%d" % rnd.randrange(4)) for node in range(12)]
+    # properties repeat on the same node
+    operations += [("AddProperty", "n%d" % rnd.randrange(12), rnd.choice("pq")) for _ in range(10)]
+    names = ["g%d" % group for group in range(4)] + ["n%d" % node for node in range(12)]
+    edges = {(rnd.choice(names), rnd.choice(names), rnd.choice("st")) for _ in range(20)}
+    operations += [("AddDirectedEdge",) + edge for edge in sorted(edges)]
+    return build_graph(operations)
+
+def random_operation(graph: Graph, rnd: random.Random, step: int) -> tuple:
+    nodes = [node.name for group in graph.groups for node in group.nodes]
+    groups = [group.name for group in graph.groups]
+    edges = [(edge.start, edge.end, edge.semantics) for edge in graph.directed_edges]
+    names = nodes + groups
+    fresh = "x%d" % step
+    choice = rnd.randrange(13)
+    if choice == 0 and names:
+        return ("AddDirectedEdge", rnd.choice(names), rnd.choice(names), rnd.choice("stu"))
+    if choice == 1 and groups:
+        return ("AddNode", fresh, rnd.choice(groups))
+    if choice == 2:
+        return ("AddGroup", fresh)
+    if choice == 3 and nodes:
+        node = rnd.choice(nodes)
+        return ("DeleteNode", node, graph.get_group_of_node(node).name)
+    if choice == 4 and edges:
+        return ("DeleteDirectedEdge",) + rnd.choice(edges)
+    if choice == 5 and len(groups) > 1:
+        return ("DeleteGroup", rnd.choice(groups))
+    if choice in (6, 7) and nodes:
+        return ("AddProperty", rnd.choice(nodes), rnd.choice("pqr"))
+    if choice == 8 and nodes:
+        node = rnd.choice(nodes)
+        return ("DeleteProperty", node, rnd.choice(graph.get_node(node).properties + ["p"]))
+    if choice == 9 and nodes:
+        node = rnd.choice(nodes)
+        return ("RenameProperty", node, rnd.choice(graph.get_node(node).properties + ["p"]), rnd.choice("pqrs"))
+    if choice == 10 and names:
+        name = rnd.choice(names)
+        return ("RenameNode" if name in nodes else "RenameGroup", name, fresh)
+    if choice == 11 and edges:
+        return ("ChangeSemanticsDirectedEdge",) + rnd.choice(edges) + (rnd.choice("stu"),)
+    if choice == 12 and nodes:
+        node = rnd.choice(nodes)
+        return ("MoveNodeToOtherGroup", node, graph.get_group_of_node(node).name, rnd.choice(groups))
+    return ("AddGroup", fresh)
+
+def evolve_randomly(graph: Graph, rnd: random.Random, count: int) -> Graph:
+    graph = graph.fork()
+    for step in range(count):
+        operation = random_operation(graph, rnd, step)
+        OPERATIONS[operation[0]][0](graph, *operation[1:])
+    return graph
+
+@pytest.mark.parametrize("seed", range(200))
+def test_random_evolution(seed):
+    rnd = random.Random(seed)
+    old = random_base_graph(rnd)
+    check_replay(old, evolve_randomly(old, rnd, rnd.randrange(1, 40)))
+
+def test_identical_graphs():
+    graph = random_base_graph(random.Random(1))
+    assert diff_graphs(graph, graph.fork()).is_empty()
+
+@pytest.mark.parametrize("old_properties, new_properties, removed, added", [
+    (["p", "p"], ["p"], ["p"], []),
+    (["p"], ["p", "p", "q"], [], ["p", "q"]),
+    (["p", "p", "q"], ["q"], ["p", "p"], []),
+])
+def test_duplicate_properties(old_properties, new_properties, removed, added):
+    old = build_graph([("AddGroup", "g"), ("AddNode", "a", "g"), ("AddNode", "b", "g")] + [("AddProperty", "a", name) for name in old_properties])
+    new = build_graph([("AddGroup", "g"), ("AddNode", "a", "g"), ("AddNode", "b", "g")] + [("AddProperty", "a", name) for name in new_properties])
+    diff = check_replay(old, new)
+    assert diff.removed_properties == [("a", name) for name in removed]
+    assert diff.added_properties == [("a", name) for name in added]
+
+def test_renamed_duplicate_property():
+    old = build_graph([("AddGroup", "g"), ("AddNode", "a", "g"), ("AddProperty", "a", "p"), ("AddProperty", "a", "p")])
+    new = build_graph([("AddGroup", "g"), ("AddNode", "a", "g"), ("AddProperty", "a", "p"), ("AddProperty", "a", "q")])
+    assert check_replay(old, new).renamed_properties == [("a", "p", "q")]
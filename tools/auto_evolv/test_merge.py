@@ -0,0 +1,154 @@
+'''
+Copyright (C) 2024 Karl Kegel
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+'''
+
+import json
+import os
+from xml.sax.saxutils import quoteattr
+
+import pytest
+
+from evolve import Graph, CompiledOperation, OperationPlan, OPERATIONS, load_graph, serialize_graph
+from merge import MergeResult, merge_graphs, merge_data_point, MERGED_GRAPH_FILE_NAME, MERGE_REPORT_FILE_NAME, STRATEGIES
+from validation import Schemas
+
+META_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "meta", "XSL")
+
+def make_plan(*operations: tuple) -> OperationPlan:
+    # one semantic edit per (tag, *arguments)
+    return OperationPlan([CompiledOperation(index, 0, operation[0], tuple(operation[1:])) for index, operation in enumerate(operations)],
+                         len(operations))
+
+def base_graph() -> Graph:
+    graph = Graph()
+    for operation in [("AddGroup", "g1"), ("AddGroup", "g2"), ("AddGroup", "g3"),
+                      ("AddNode", "a", "g1"), ("AddNode", "b", "g1"), ("AddNode", "c", "g2"),
+                      ("AddProperty", "a", "p"),
+                      ("AddDirectedEdge", "a", "b", "s"), ("AddDirectedEdge", "b", "c", "s")]:
+        assert OPERATIONS[operation[0]][0](graph, *operation[1:]), operation
+    return graph
+
+def nodes(graph: Graph) -> dict[str, str]:
+    return {node.name: group.name for group in graph.groups for node in group.nodes}
+
+def merge(operations_a: list[tuple], operations_b: list[tuple], strategy: str = "base") -> MergeResult:
+    return merge_graphs(base_graph(), make_plan(*operations_a), make_plan(*operations_b), strategy)
+
+def conflict_kinds(result: MergeResult) -> list[tuple[str, str]]:
+    return [(conflict.kind, conflict.element) for conflict in result.conflicts]
+
+# (operations of a, operations of b, the conflict, the nodes of the merged graph per strategy)
+CONFLICTS = {
+    "rename/delete": (
+        [("RenameNode", "a", "x")], [("DeleteNode", "a", "g1")], ("rename/delete", "node a"),
+        {"base": {"a": "g1", "b": "g1", "c": "g2"}, "a": {"x": "g1", "b": "g1", "c": "g2"}, "b": {"b": "g1", "c": "g2"}}),
+    "move/move": (
+        [("MoveNodeToOtherGroup", "a", "g1", "g2")], [("MoveNodeToOtherGroup", "a", "g1", "g3")], ("move/move", "node a"),
+        {"base": {"a": "g1", "b": "g1", "c": "g2"}, "a": {"a": "g2", "b": "g1", "c": "g2"}, "b": {"a": "g3", "b": "g1", "c": "g2"}}),
+    "name clash": (
+        [("AddNode", "n", "g1")], [("AddNode", "n", "g2")], ("name clash", "name n"),
+        {"base": {"a": "g1", "b": "g1", "c": "g2"}, "a": {"a": "g1", "b": "g1", "c": "g2", "n": "g1"},
+         "b": {"a": "g1", "b": "g1", "c": "g2", "n": "g2"}}),
+    "delete/use": (
+        [("DeleteGroup", "g2")], [("AddNode", "d", "g2")], ("delete/use", "group g2"),
+        {"base": {"a": "g1", "b": "g1", "c": "g2"}, "a": {"a": "g1", "b": "g1"}, "b": {"a": "g1", "b": "g1", "c": "g2", "d": "g2"}}),
+}
+
+@pytest.mark.parametrize("strategy", STRATEGIES)
+@pytest.mark.parametrize("name", CONFLICTS)
+def test_conflict(name, strategy):
+    operations_a, operations_b, conflict, expected_nodes = CONFLICTS[name]
+    result = merge(operations_a, operations_b, strategy)
+    assert conflict_kinds(result) == [conflict]
+    assert result.duplicates == []
+    assert result.failed == [] and result.invalid == []
+    # base leaves out both sides of the conflict, a and b the other side
+    skipped = {"base": ["a", "b"], "a": ["b"], "b": ["a"]}[strategy]
+    assert sorted(operation.evolution for operation in result.skipped) == skipped
+    assert result.applied == {evolution: int(evolution == strategy) for evolution in ("a", "b")}
+    assert nodes(result.graph) == expected_nodes[strategy]
+
+def test_rename_delete_keeps_the_edges():
+    # the deletion of a would also delete its property and edge, they stay with the rename of a
+    result = merge([("RenameNode", "a", "x")], [("DeleteNode", "a", "g1")], "a")
+    assert result.graph.get_node("x").properties == ["p"]
+    assert result.graph.get_directed_edge("x", "b", "s") is not None
+
+def test_identical_moves_are_duplicates():
+    move = ("MoveNodeToOtherGroup", "a", "g1", "g2")
+    result = merge([move], [move])
+    assert result.conflicts == []
+    assert [(a.operation.tag, b.operation.tag) for a, b in result.duplicates] == [("MoveNodeToOtherGroup", "MoveNodeToOtherGroup")]
+    assert result.applied == {"a": 1, "b": 0}
+    assert nodes(result.graph)["a"] == "g2"
+
+def test_identical_additions_are_duplicates():
+    # the same node added by both evolutions is one element, later operations of both on it compare as such
+    result = merge([("AddNode", "n", "g1"), ("RenameNode", "n", "m")], [("AddNode", "n", "g1"), ("RenameNode", "n", "m")])
+    assert result.conflicts == []
+    assert len(result.duplicates) == 2
+    assert nodes(result.graph)["m"] == "g1"
+
+def test_independent_changes():
+    # renames on one side are followed by the operations of the other side
+    result = merge([("RenameNode", "a", "x"), ("RenameGroup", "g1", "h")], [("AddProperty", "a", "q"), ("MoveNodeToOtherGroup", "b", "g1", "g3")])
+    assert result.conflicts == [] and result.skipped == [] and result.failed == []
+    assert result.applied == {"a": 2, "b": 2}
+    assert nodes(result.graph) == {"x": "h", "b": "g3", "c": "g2"}
+    assert result.graph.get_node("x").properties == ["p", "q"]
+
+def test_dependent_operation_fails():
+    # b adds an edge to the node it added, which is left out because of the name clash
+    result = merge([("AddGroup", "n")], [("AddNode", "n", "g1"), ("AddDirectedEdge", "a", "n", "s")])
+    assert conflict_kinds(result) == [("name clash", "name n")]
+    assert [(operation.operation.tag, reason) for operation, reason in result.failed] == [
+        ("AddDirectedEdge", "depends on an element created by an operation that was not applied")]
+
+def test_invalid_operation():
+    result = merge([("DeleteNode", "missing", "g1")], [])
+    assert [operation.operation.tag for operation in result.invalid] == ["DeleteNode"]
+    assert nodes(result.graph) == nodes(base_graph())
+
+def test_unknown_strategy():
+    with pytest.raises(Exception, match="Unknown merge strategy"):
+        merge([], [], "c")
+
+def write_evolution(path: str, operations: list[tuple]):
+    edits = []
+    for index, (tag, *arguments) in enumerate(operations):
+        attributes = " ".join("%s=%s" % (attribute, quoteattr(argument)) for attribute, argument in zip(OPERATIONS[tag][1], arguments))
+        edits.append('<SemanticEdit index="%d"><Semantic><Category>REPURPOSE</Category><Description>test</Description></Semantic>'
+                     '<Operation index="0"><%s %s/></Operation></SemanticEdit>' % (index, tag, attributes))
+    with open(path, "w") as evolution_file:
+        evolution_file.write('<?xml version="1.0"?>\n<Evolution xmlns="http://mergebench.org/ns">%s</Evolution>\n' % "".join(edits))
+
+@pytest.mark.parametrize("strategy", STRATEGIES)
+def test_merge_data_point(tmp_path, strategy):
+    data_point_dir = str(tmp_path / "data")
+    output_dir = str(tmp_path / "gen")
+    os.makedirs(data_point_dir)
+    schemas = Schemas(META_DIR, None)
+    serialize_graph(base_graph(), os.path.join(data_point_dir, "base.xml"), schemas.template_path)
+    operations_a, operations_b, _, expected_nodes = CONFLICTS["move/move"]
+    write_evolution(os.path.join(data_point_dir, "evolution_a.xml"), operations_a)
+    write_evolution(os.path.join(data_point_dir, "evolution_b.xml"), operations_b)
+    merge_data_point(data_point_dir, output_dir, schemas, strategy)
+    assert nodes(load_graph(os.path.join(output_dir, MERGED_GRAPH_FILE_NAME))) == expected_nodes[strategy]
+    with open(os.path.join(output_dir, MERGE_REPORT_FILE_NAME)) as report_file:
+        report = json.load(report_file)
+    assert report["strategy"] == strategy
+    assert [conflict["kind"] for conflict in report["conflicts"]] == ["move/move"]
+    assert len(report["skipped"]) == (2 if strategy == "base" else 1)
@@ -0,0 +1,66 @@
+'''
+Copyright (C) 2024 Karl Kegel
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+'''
+
+import os
+import shutil
+
+import pytest
+
+from watch import Watcher, META_FILES
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..")
+
+@pytest.fixture
+def watcher(tmp_path) -> Watcher:
+    shutil.copytree(os.path.join(ROOT, "data", "EXAMPLE"), str(tmp_path / "data" / "EXAMPLE"))
+    os.makedirs(str(tmp_path / "meta"))
+    watcher = Watcher(str(tmp_path / "data"), str(tmp_path / "gen"), str(tmp_path / "meta"), validation_cache_dir=None)
+    yield watcher
+    watcher.close()
+
+def copy_meta_files(meta_dir: str):
+    for name in META_FILES:
+        shutil.copy(os.path.join(ROOT, "meta", "XSL", name), os.path.join(meta_dir, name))
+
+def test_missing_meta_files(watcher):
+    assert watcher.poll() == []
+    copy_meta_files(watcher.meta_dir)
+    assert [result.name for result in watcher.poll()] == ["EXAMPLE"]
+
+def test_malformed_schema(watcher):
+    copy_meta_files(watcher.meta_dir)
+    graph_xsd_path = os.path.join(watcher.meta_dir, "graph.xsd")
+    with open(graph_xsd_path) as xsd_file:
+        graph_xsd = xsd_file.read()
+    with open(graph_xsd_path, "w") as xsd_file:
+        xsd_file.write(graph_xsd[:len(graph_xsd) // 2])
+    # no schemas yet, nothing is processed until they load
+    assert watcher.poll() == []
+    assert watcher.poll() == []
+    with open(graph_xsd_path, "w") as xsd_file:
+        xsd_file.write(graph_xsd)
+    results = watcher.poll()
+    assert [(result.name, result.is_ok()) for result in results] == [("EXAMPLE", True)]
+    schemas = watcher.schemas
+
+    # a schema broken later keeps the previous schemas in use
+    with open(graph_xsd_path, "w") as xsd_file:
+        xsd_file.write(graph_xsd[:len(graph_xsd) // 2])
+    assert watcher.poll() == []
+    assert watcher.schemas is schemas
+    os.utime(os.path.join(watcher.data_root, "EXAMPLE", "evolution_a.xml"), ns=(1, 1))
+    assert [(result.name, result.is_ok()) for result in watcher.poll()] == [("EXAMPLE", True)]
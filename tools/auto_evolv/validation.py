@@ -0,0 +1,172 @@
+'''
+Copyright (C) 2024 Karl Kegel
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+'''
+
+from lxml import etree
+import argparse
+import hashlib
+import logging
+import os
+import sys
+
+logger = logging.getLogger(__name__)
+
+# one empty marker file per validated (schema content, document content) pair, named by the hash of both
+DEFAULT_VALIDATION_CACHE_DIR = os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"),
+                                            "mergebench", "validated")
+
+# compiled schemas by the hash of their content, shared by all Validators of the process
+_compiled_schemas: dict[str, etree.XMLSchema] = {}
+
+def file_hash(path: str) -> str:
+    sha = hashlib.sha256()
+    with open(path, "rb") as input_file:
+        for chunk in iter(lambda: input_file.read(1 << 20), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+class Validator:
+    '''
+    Validates XML documents against XSD schemas. Every schema is compiled once per process, and documents
+    that were already validated against a schema (same content of both, from any earlier run) are not
+    validated again. The validated content hashes are recorded in cache_dir, None disables this on-disk cache.
+    '''
+
+    def __init__(self, cache_dir: str = DEFAULT_VALIDATION_CACHE_DIR):
+        self.cache_dir: str = cache_dir
+        # schema path -> content hash, every schema file is read once
+        self.schema_hashes: dict[str, str] = {}
+        # document path -> ((mtime, size), content hash), a document is hashed once while it is unchanged
+        self.document_hashes: dict[str, tuple] = {}
+        self.validated: int = 0
+        self.skipped: int = 0
+
+    def schema_hash(self, xsd_path: str) -> str:
+        # the schemas of the benchmark are self-contained, includes and imports are not part of the hash
+        path = os.path.abspath(xsd_path)
+        if path not in self.schema_hashes:
+            self.schema_hashes[path] = file_hash(path)
+        return self.schema_hashes[path]
+
+    def schema(self, xsd_path: str) -> etree.XMLSchema:
+        schema_hash = self.schema_hash(xsd_path)
+        schema = _compiled_schemas.get(schema_hash)
+        if schema is None:
+            schema = _compiled_schemas[schema_hash] = etree.XMLSchema(etree.parse(xsd_path))
+        return schema
+
+    def document_hash(self, xml_path: str) -> str:
+        stat = os.stat(xml_path)
+        version = (stat.st_mtime_ns, stat.st_size)
+        known = self.document_hashes.get(xml_path)
+        if known is not None and known[0] == version:
+            return known[1]
+        document_hash = file_hash(xml_path)
+        self.document_hashes[xml_path] = (version, document_hash)
+        return document_hash
+
+    def marker_path(self, xml_path: str, xsd_path: str) -> str:
+        key = hashlib.sha256((self.schema_hash(xsd_path) + self.document_hash(xml_path)).encode()).hexdigest()
+        return os.path.join(self.cache_dir, key[:2], key[2:])
+
+    def is_validated(self, xml_path: str, xsd_path: str) -> bool:
+        '''
+        True if the current content of xml_path was already validated against the current content of xsd_path.
+        '''
+        if self.cache_dir is None:
+            return False
+        if os.path.exists(self.marker_path(xml_path, xsd_path)):
+            self.skipped += 1
+            logger.debug("Validation skipped, unchanged since it was validated: %s", xml_path)
+            return True
+        return False
+
+    def record(self, xml_path: str, xsd_path: str):
+        '''
+        Records that the current content of xml_path is valid against xsd_path.
+        '''
+        self.validated += 1
+        if self.cache_dir is None:
+            return
+        marker_path = self.marker_path(xml_path, xsd_path)
+        try:
+            os.makedirs(os.path.dirname(marker_path), exist_ok=True)
+            open(marker_path, "a").close()
+        except OSError as e:
+            # the cache only saves time, a read-only cache must not fail the run
+            logger.warning("Could not record validation in %s: %s", self.cache_dir, e)
+
+    def validate(self, xml_path: str, xsd_path: str, xml_root=None) -> bool:
+        '''
+        Validates the document in xml_path (already parsed into xml_root, if given) unless it is known to be valid.
+        Logs every schema violation of an invalid document.
+        '''
+        if self.is_validated(xml_path, xsd_path):
+            return True
+        if xml_root is None:
+            xml_root = etree.parse(xml_path)
+        schema = self.schema(xsd_path)
+        if not schema.validate(xml_root):
+            for error in schema.error_log:
+                logger.error("%s:%d: %s", xml_path, error.line, error.message)
+            return False
+        self.record(xml_path, xsd_path)
+        return True
+
+def hash_files(paths: list[str]) -> str:
+    sha = hashlib.sha256()
+    for path in paths:
+        with open(path, "rb") as input_file:
+            sha.update(hashlib.sha256(input_file.read()).digest())
+    return sha.hexdigest()
+
+class Schemas:
+    '''
+    The graph and operations schemas (compiled once per process by the validator) and the graph template of meta_dir.
+    '''
+
+    def __init__(self, meta_dir: str, validation_cache_dir: str = DEFAULT_VALIDATION_CACHE_DIR):
+        self.graph_xsd_path: str = os.path.join(meta_dir, "graph.xsd")
+        self.operations_xsd_path: str = os.path.join(meta_dir, "operations.xsd")
+        self.template_path: str = os.path.join(meta_dir, "graph_template.xml")
+        self.validator: Validator = Validator(validation_cache_dir)
+        self.validator.schema(self.graph_xsd_path)
+        self.validator.schema(self.operations_xsd_path)
+        # hash of the schemas and the template, the outputs of a data point depend on them besides its own models
+        self.fingerprint: str = hash_files([self.graph_xsd_path, self.operations_xsd_path, self.template_path])
+
+# every worker process of a pool compiles the schemas once in its initializer
+_worker_schemas: Schemas = None
+
+def init_worker(meta_dir: str, validation_cache_dir: str, log_level: int):
+    '''
+    Initializer of worker processes that need the Schemas of meta_dir, see worker_schemas.
+    '''
+    global _worker_schemas
+    logging.basicConfig(level=log_level, format="%(message)s", stream=sys.stdout, force=True)
+    _worker_schemas = Schemas(meta_dir, validation_cache_dir)
+
+def worker_schemas() -> Schemas:
+    return _worker_schemas
+
+def add_validation_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--validation-cache", default=DEFAULT_VALIDATION_CACHE_DIR, metavar="DIR",
+                        help="directory recording which documents were already validated (default: %(default)s)")
+    parser.add_argument("--no-validation-cache", action="store_true",
+                        help="validate every document, even if it was validated unchanged before")
+
+def validator_from_args(args) -> Validator:
+    return Validator(None if args.no_validation_cache else args.validation_cache)
@@ -0,0 +1,201 @@
+'''
+Copyright (C) 2024 Karl Kegel
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+'''
+
+import argparse
+import logging
+import os
+import sys
+import time
+
+from batch import DataPointResult, process_data_point, report_data_point, report_render_failures
+from evolve import configure_logging, LOG_LEVELS
+from model_cache import ModelCache, DEFAULT_CACHE_SIZE
+from profiling import PROFILE_FORMATS
+from validation import Schemas, DEFAULT_VALIDATION_CACHE_DIR, add_validation_arguments
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "graph_to_puml"))
+from convert import SPLIT_MODES
+from render import PlantUMLRenderer
+
+logger = logging.getLogger(__name__)
+
+META_FILES = ["graph.xsd", "operations.xsd", "graph_template.xml"]
+
+def directory_versions(directory: str, names: list[str] = None) -> tuple:
+    '''
+    The (name, modification time, size) of the XML files in directory (or of the given files), in name order.
+    '''
+    versions = []
+    try:
+        if names is None:
+            entries = [entry for entry in os.scandir(directory) if entry.is_file() and entry.name.endswith(".xml")]
+            versions = [(entry.name, entry.stat().st_mtime_ns, entry.stat().st_size) for entry in entries]
+        else:
+            for name in names:
+                stat = os.stat(os.path.join(directory, name))
+                versions.append((name, stat.st_mtime_ns, stat.st_size))
+    except FileNotFoundError:
+        # the directory or a file is just being replaced, it is compared again at the next poll
+        return None
+    return tuple(sorted(versions))
+
+class Watcher:
+    '''
+    Keeps the pipeline of batch.py running: data_root is polled for changed models and only the affected
+    data points are processed again, where the build cache of each data point limits the work to the
+    targets whose inputs changed. The compiled schemas, the parsed base graphs and the compiled operation
+    plans (see ModelCache) and a PlantUML process stay in memory between the runs.
+    A change of the schemas or the graph template invalidates everything.
+    '''
+
+    def __init__(self, data_root: str, gen_root: str, meta_dir: str, plantuml_jar: str = None, split_threshold: int = None,
+                 split_mode: str = "group", validation_cache_dir: str = DEFAULT_VALIDATION_CACHE_DIR, profile_format: str = None,
+                 compact: bool = False, cache_size: int = DEFAULT_CACHE_SIZE):
+        self.data_root: str = data_root
+        self.gen_root: str = gen_root
+        self.meta_dir: str = meta_dir
+        self.plantuml_jar: str = plantuml_jar
+        self.split_threshold: int = split_threshold
+        self.split_mode: str = split_mode
+        self.validation_cache_dir: str = validation_cache_dir
+        self.profile_format: str = profile_format
+        self.compact: bool = compact
+        self.models: ModelCache = ModelCache(cache_size)
+        self.schemas: Schemas = None
+        self.meta_versions: tuple = None
+        # versions of the meta files that failed to load, reported once
+        self.failed_meta_versions: tuple = None
+        # data point name -> versions of its models when it was last processed
+        self.versions: dict[str, tuple] = {}
+        self.results: dict[str, DataPointResult] = {}
+        self.renderer: PlantUMLRenderer = PlantUMLRenderer(plantuml_jar) if plantuml_jar is not None else None
+        self.reported_failures: int = 0
+
+    def poll(self) -> list[DataPointResult]:
+        '''
+        Processes every data point that changed since the last poll, returns their results.
+        '''
+        meta_versions = directory_versions(self.meta_dir, META_FILES)
+        if meta_versions is not None and meta_versions != self.meta_versions:
+            try:
+                schemas = Schemas(self.meta_dir, self.validation_cache_dir)
+            except Exception as e:
+                # e.g. a schema saved halfway, the previous schemas stay in use and loading is tried again at the next poll
+                if meta_versions != self.failed_meta_versions:
+                    logger.error("Cannot load the schemas in %s: %s: %s", self.meta_dir, type(e).__name__, str(e))
+                self.failed_meta_versions = meta_versions
+            else:
+                if self.schemas is not None:
+                    logger.info("Schemas or template changed, rebuilding all data points")
+                self.schemas = schemas
+                self.meta_versions = meta_versions
+                self.failed_meta_versions = None
+                self.models.clear()
+                self.versions = {}
+        if self.schemas is None:
+            # nothing can be processed until the meta files exist and load
+            return []
+
+        results = []
+        names = set()
+        for entry in sorted(os.scandir(self.data_root), key=lambda entry: entry.name):
+            if not entry.is_dir():
+                continue
+            names.add(entry.name)
+            versions = directory_versions(entry.path)
+            if versions is None or versions == self.versions.get(entry.name):
+                continue
+            start = time.perf_counter()
+            result = process_data_point(entry.path, os.path.join(self.gen_root, entry.name), self.schemas, self.plantuml_jar,
+                                        split_threshold=self.split_threshold, split_mode=self.split_mode,
+                                        profile_format=self.profile_format, compact=self.compact, models=self.models)
+            # the versions from before processing: a model saved meanwhile is processed again at the next poll
+            self.versions[entry.name] = versions
+            self.results[entry.name] = result
+            report_data_point(result)
+            if result.rebuilt_targets:
+                logger.log(logging.INFO if result.is_ok() else logging.ERROR, "%s in %.1f ms", result, 1000 * (time.perf_counter() - start))
+            if self.renderer is not None:
+                for puml_path in result.diagrams:
+                    self.renderer.submit(puml_path, key=result.name)
+            results.append(result)
+
+        for name in set(self.versions) - names:
+            logger.info("%s: removed from %s, its outputs are left in %s", name, self.data_root, self.gen_root)
+            del self.versions[name]
+            self.results.pop(name, None)
+
+        if self.renderer is not None:
+            self.report_render_failures()
+        return results
+
+    def report_render_failures(self):
+        failures = self.renderer.failures[self.reported_failures:]
+        self.reported_failures += len(failures)
+        report_render_failures(list(self.results.values()), [failure for failure in failures if failure.job.key in self.results])
+
+    def run(self, interval: float):
+        logger.info("Watching %s (every %.2f s, stop with Ctrl+C)", self.data_root, interval)
+        try:
+            while True:
+                self.poll()
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            logger.info("Stopped watching %s (%s)", self.data_root, self.models)
+        finally:
+            self.close()
+
+    def close(self):
+        if self.renderer is not None:
+            self.renderer.close()
+            self.report_render_failures()
+            self.renderer = None
+
+def main():
+    parser = argparse.ArgumentParser(description="Keep gen/ up to date: regenerate the outputs of every data point whose models change.")
+    parser.add_argument("data_root", help="the data/ directory containing one folder per data point")
+    parser.add_argument("gen_root", help="the gen/ output directory")
+    parser.add_argument("meta_dir", help="the directory containing graph.xsd, operations.xsd and graph_template.xml")
+    parser.add_argument("--interval", type=float, default=0.2, metavar="SECONDS",
+                        help="how often data/ is checked for changes (default: %(default)s)")
+    parser.add_argument("--cache-size", type=int, default=DEFAULT_CACHE_SIZE, metavar="N",
+                        help="number of base graphs and of operation plans kept in memory (default: %(default)s)")
+    parser.add_argument("--plantuml", metavar="JAR", default=None,
+                        help="render the generated .puml files into PNGs with this PlantUML jar")
+    parser.add_argument("--split-threshold", type=int, default=None, metavar="N",
+                        help="split diagrams with more than N nodes and edges into parts and an index diagram of the groups")
+    parser.add_argument("--split-mode", choices=SPLIT_MODES, default="group",
+                        help="split per group or per connected component (default: group)")
+    parser.add_argument("--compact", action="store_true",
+                        help="remove redundant operations from the evolutions before applying them")
+    parser.add_argument("--profile", action="store_true",
+                        help="profile every rebuilt evolution into gen/<id>/graph_<evolution>_profile.<format>")
+    parser.add_argument("--profile-format", choices=PROFILE_FORMATS, default="json", help="format of the profile reports (default: json)")
+    parser.add_argument("--log-level", choices=LOG_LEVELS.keys(), default="info",
+                        help="quiet only reports problems, debug also dumps graphs and operations (default: info)")
+    add_validation_arguments(parser)
+    args = parser.parse_args()
+    configure_logging(args.log_level)
+
+    watcher = Watcher(args.data_root, args.gen_root, args.meta_dir, args.plantuml, args.split_threshold, args.split_mode,
+                      None if args.no_validation_cache else args.validation_cache, args.profile_format if args.profile else None,
+                      args.compact, args.cache_size)
+    watcher.run(args.interval)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
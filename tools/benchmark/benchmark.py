@@ -0,0 +1,478 @@
+'''
+Copyright (C) 2024 Karl Kegel
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+'''
+
+import argparse
+import datetime
+import json
+import logging
+import os
+import platform
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from lxml import etree
+
+TOOLS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.append(os.path.join(TOOLS_DIR, "auto_evolv"))
+sys.path.append(os.path.join(TOOLS_DIR, "graph_to_puml"))
+from evolve import (Graph, Group, Node, DirectedEdge, OPERATIONS, xml_from_file, xsd_from_file, load_graph, parse_graph,
+                    parse_and_apply_operations, serialize_graph, escape_attribute, configure_logging, LOG_LEVELS)
+from convert import puml_to_file
+from binary_graph import write_graph_binary, load_graph_binary
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_META_DIR = os.path.join(TOOLS_DIR, "..", "meta", "XSL")
+
+# DeleteGroup and JoinGroups both remove a group, so groups are added twice as often to keep the size stable
+OPERATION_WEIGHTS = {"AddGroup": 2}
+
+CATEGORIES = ["ADAPT", "REFINE", "EXTEND", "SIMPLYFY", "REDUCE", "REPURPOSE", "REFACTOR RESTRUCTURE", "REFACTOR RENAME"]
+
+# SYNTHETIC DATA GENERATION
+
+class NamePool:
+    '''
+    Names with O(1) insertion, removal, renaming and uniform random choice.
+    '''
+
+    def __init__(self, names=()):
+        self.names: list[str] = []
+        self.index: dict[str, int] = {}
+        for name in names:
+            self.add(name)
+
+    def __len__(self):
+        return len(self.names)
+
+    def add(self, name: str):
+        self.index[name] = len(self.names)
+        self.names.append(name)
+
+    def remove(self, name: str):
+        index = self.index.pop(name)
+        last = self.names.pop()
+        if last != name:
+            self.names[index] = last
+            self.index[last] = index
+
+    def rename(self, old_name: str, new_name: str):
+        index = self.index.pop(old_name)
+        self.names[index] = new_name
+        self.index[new_name] = index
+
+    def choice(self, rng: random.Random) -> str:
+        return self.names[rng.randrange(len(self.names))]
+
+def generate_base_graph(groups: int, nodes: int, properties: int, edges: int, semantics: int, rng: random.Random) -> Graph:
+    '''
+    Creates a graph with the given number of groups, nodes (spread evenly over the groups), properties per node
+    and directed edges. Edge ends are nodes (90%) or groups (10%), labels are drawn from semantics different labels.
+    '''
+    graph = Graph()
+    for group_index in range(groups):
+        graph.add_group(Group("group%d" % group_index))
+    for node_index in range(nodes):
+        node = Node("node%d" % node_index)
+        graph.add_node(node, "group%d" % (node_index % groups))
+        for property_index in range(properties):
+            graph.add_property(node.name, "property%d" % property_index)
+
+    def random_element() -> str:
+        if nodes == 0 or rng.random() < 0.1:
+            return "group%d" % rng.randrange(groups)
+        return "node%d" % rng.randrange(nodes)
+
+    added = 0
+    attempts = 0
+    while added < edges and attempts < edges * 10:
+        attempts += 1
+        if graph.add_directed_edge(DirectedEdge(random_element(), random_element(), "semantics%d" % rng.randrange(semantics))):
+            added += 1
+    return graph
+
+class EvolutionGenerator:
+    '''
+    Generates operations that are applicable in sequence to a graph. Every operation is applied to a fork of
+    the graph right away, so the next one is generated against the evolved state.
+    '''
+
+    def __init__(self, graph: Graph, rng: random.Random, prefix: str, semantics: int):
+        self.graph: Graph = graph.fork()
+        self.rng: random.Random = rng
+        self.prefix: str = prefix
+        self.semantics: int = semantics
+        self.counter: int = 0
+        self.groups: NamePool = NamePool(group.name for group in self.graph.groups)
+        self.nodes: NamePool = NamePool(node.name for group in self.graph.groups for node in group.nodes)
+        self.generators = {
+            "DeleteNode": self.delete_node,
+            "DeleteDirectedEdge": self.delete_directed_edge,
+            "DeleteGroup": self.delete_group,
+            "DeleteProperty": self.delete_property,
+            "AddNode": self.add_node,
+            "AddDirectedEdge": self.add_directed_edge,
+            "AddGroup": self.add_group,
+            "RenameProperty": self.rename_property,
+            "AddProperty": self.add_property,
+            "RenameGroup": self.rename_group,
+            "RenameNode": self.rename_node,
+            "ChangeSemanticsDirectedEdge": self.change_semantics_directed_edge,
+            "MoveNodeToOtherGroup": self.move_node_to_other_group,
+            "JoinGroups": self.join_groups,
+        }
+
+    def generate(self, count: int) -> list[tuple[str, tuple]]:
+        '''
+        Returns count operations as (tag, arguments), cycling through all operation types (see OPERATION_WEIGHTS)
+        in random order. Operation types that are not applicable to the current graph are skipped for one round.
+        '''
+        tags = [tag for tag in self.generators for _ in range(OPERATION_WEIGHTS.get(tag, 1))]
+        operations = []
+        while len(operations) < count:
+            self.rng.shuffle(tags)
+            generated = False
+            for tag in tags:
+                if len(operations) >= count:
+                    break
+                arguments = self.generators[tag]()
+                if arguments is None:
+                    continue
+                if not OPERATIONS[tag][0](self.graph, *arguments):
+                    raise Exception("Generated operation is not applicable: %s %s" % (tag, arguments))
+                operations.append((tag, arguments))
+                generated = True
+            if not generated:
+                raise Exception("No operation is applicable to the graph anymore")
+        return operations
+
+    def fresh_name(self, kind: str) -> str:
+        self.counter += 1
+        return "%s_%s%d" % (kind, self.prefix, self.counter)
+
+    def random_semantics(self) -> str:
+        return "semantics%d" % self.rng.randrange(self.semantics)
+
+    def random_node_with_properties(self) -> Node:
+        for _ in range(20):
+            if not self.nodes:
+                return None
+            node = self.graph.get_node(self.nodes.choice(self.rng))
+            if node.properties:
+                return node
+        return None
+
+    def random_edge(self) -> DirectedEdge:
+        for _ in range(20):
+            pool = self.nodes if self.nodes and self.rng.random() < 0.9 else self.groups
+            edges = self.graph.get_incident_edges(pool.choice(self.rng))
+            if edges:
+                return self.rng.choice(edges)
+        return None
+
+    def delete_node(self):
+        if not self.nodes:
+            return None
+        node_name = self.nodes.choice(self.rng)
+        self.nodes.remove(node_name)
+        return (node_name, self.graph.get_group_of_node(node_name).name)
+
+    def delete_directed_edge(self):
+        edge = self.random_edge()
+        if edge is None:
+            return None
+        return (edge.start, edge.end, edge.semantics)
+
+    def delete_group(self):
+        if len(self.groups) < 2:
+            return None
+        # prefer small groups so that deletions do not wipe out large parts of the graph
+        group = min((self.graph.get_group(self.groups.choice(self.rng)) for _ in range(20)), key=lambda group: len(group.nodes))
+        for node in group.nodes:
+            self.nodes.remove(node.name)
+        self.groups.remove(group.name)
+        return (group.name,)
+
+    def delete_property(self):
+        node = self.random_node_with_properties()
+        if node is None:
+            return None
+        return (node.name, self.rng.choice(node.properties))
+
+    def add_node(self):
+        node_name = self.fresh_name("node")
+        self.nodes.add(node_name)
+        return (node_name, self.groups.choice(self.rng))
+
+    def add_directed_edge(self):
+        for _ in range(20):
+            start = self.nodes.choice(self.rng) if self.nodes and self.rng.random() < 0.9 else self.groups.choice(self.rng)
+            end = self.nodes.choice(self.rng) if self.nodes and self.rng.random() < 0.9 else self.groups.choice(self.rng)
+            semantics = self.random_semantics()
+            if not self.graph.is_double_edge(start, end, semantics):
+                return (start, end, semantics)
+        return None
+
+    def add_group(self):
+        group_name = self.fresh_name("group")
+        self.groups.add(group_name)
+        return (group_name,)
+
+    def rename_property(self):
+        node = self.random_node_with_properties()
+        if node is None:
+            return None
+        return (node.name, self.rng.choice(node.properties), self.fresh_name("property"))
+
+    def add_property(self):
+        if not self.nodes:
+            return None
+        return (self.nodes.choice(self.rng), self.fresh_name("property"))
+
+    def rename_group(self):
+        old_name = self.groups.choice(self.rng)
+        new_name = self.fresh_name("group")
+        self.groups.rename(old_name, new_name)
+        return (old_name, new_name)
+
+    def rename_node(self):
+        if not self.nodes:
+            return None
+        old_name = self.nodes.choice(self.rng)
+        new_name = self.fresh_name("node")
+        self.nodes.rename(old_name, new_name)
+        return (old_name, new_name)
+
+    def change_semantics_directed_edge(self):
+        edge = self.random_edge()
+        if edge is None:
+            return None
+        new_semantics = self.random_semantics()
+        if self.graph.is_double_edge(edge.start, edge.end, new_semantics):
+            new_semantics = self.fresh_name("semantics")
+        return (edge.start, edge.end, edge.semantics, new_semantics)
+
+    def move_node_to_other_group(self):
+        if not self.nodes or len(self.groups) < 2:
+            return None
+        node_name = self.nodes.choice(self.rng)
+        old_group_name = self.graph.get_group_of_node(node_name).name
+        new_group_name = self.groups.choice(self.rng)
+        while new_group_name == old_group_name:
+            new_group_name = self.groups.choice(self.rng)
+        return (node_name, old_group_name, new_group_name)
+
+    def join_groups(self):
+        if len(self.groups) < 3:
+            return None
+        group1_name = self.groups.choice(self.rng)
+        group2_name = self.groups.choice(self.rng)
+        while group2_name == group1_name:
+            group2_name = self.groups.choice(self.rng)
+        new_group_name = self.fresh_name("group")
+        self.groups.remove(group1_name)
+        self.groups.remove(group2_name)
+        self.groups.add(new_group_name)
+        return (group1_name, group2_name, new_group_name)
+
+def write_evolution_xml(operations: list[tuple[str, tuple]], output_path: str, operations_per_edit: int, rng: random.Random):
+    with open(output_path, "w", encoding="utf-8") as output_file:
+        write = output_file.write
+        write('<?xml version="1.0"?>\n')
+        write('<Evolution xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"\n'
+              '          xmlns="http://mergebench.org/ns"\n'
+              '          xsi:schemaLocation="http://mergebench.org/ns operations.xsd">\n')
+        for edit_index, first in enumerate(range(0, len(operations), operations_per_edit)):
+            write('    <SemanticEdit index="%d">\n' % edit_index)
+            write('        <Semantic>\n')
+            write('            <Category>%s</Category>\n' % rng.choice(CATEGORIES))
+            write('            <Description>Synthetic edit %d</Description>\n' % edit_index)
+            write('        </Semantic>\n')
+            for operation_index, (tag, arguments) in enumerate(operations[first:first + operations_per_edit]):
+                attributes = " ".join('%s="%s"' % (attribute, escape_attribute(value))
+                                      for attribute, value in zip(OPERATIONS[tag][1], arguments))
+                write('        <Operation index="%d">\n' % operation_index)
+                write('            <%s %s/>\n' % (tag, attributes))
+                write('        </Operation>\n')
+            write('    </SemanticEdit>\n')
+        write('</Evolution>\n')
+
+def generate_data_point(output_dir: str, meta_dir: str, groups: int, nodes: int, properties: int, edges: int,
+                        operations: int, semantics: int = 8, operations_per_edit: int = 10, seed: int = 0) -> dict:
+    '''
+    Writes a schema-valid synthetic data point (base.xml, evolution_a.xml, evolution_b.xml) into output_dir
+    and returns the number of generated operations per operation type.
+    '''
+    rng = random.Random(seed)
+    os.makedirs(output_dir, exist_ok=True)
+    graph = generate_base_graph(groups, nodes, properties, edges, semantics, rng)
+    serialize_graph(graph, os.path.join(output_dir, "base.xml"), os.path.join(meta_dir, "graph_template.xml"))
+    coverage = {tag: 0 for tag in OPERATIONS}
+    for evolution in ["a", "b"]:
+        generated = EvolutionGenerator(graph, rng, evolution, semantics).generate(operations)
+        write_evolution_xml(generated, os.path.join(output_dir, "evolution_%s.xml" % evolution), operations_per_edit, rng)
+        for tag, _ in generated:
+            coverage[tag] += 1
+    return coverage
+
+# BENCHMARK
+
+def measure(function, repeat: int) -> dict:
+    '''
+    Runs function (which prepares its inputs and returns the callable to measure) repeat times for timing
+    and once more under tracemalloc for the peak Python heap of the stage (python_peak_bytes), the per-stage
+    memory figure. tracemalloc does not see memory allocated by libxml2. process_peak_rss_bytes is the
+    high-water mark of the whole process so far, which includes the earlier stages: it never decreases from
+    one stage to the next and only shows that a stage raised it.
+    '''
+    seconds = []
+    for _ in range(repeat):
+        stage = function()
+        start = time.perf_counter()
+        stage()
+        seconds.append(time.perf_counter() - start)
+    stage = function()
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    stage()
+    python_peak_bytes = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        "seconds": seconds,
+        "min_seconds": min(seconds),
+        "median_seconds": statistics.median(seconds),
+        "python_peak_bytes": python_peak_bytes,
+        "process_peak_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+    }
+
+def run_benchmark(data_dir: str, meta_dir: str, repeat: int = 3) -> dict:
+    '''
+    Times and memory-profiles every pipeline stage on the data point in data_dir, using evolution_a.
+    '''
+    graph_xsd = xsd_from_file(os.path.join(meta_dir, "graph.xsd"))
+    template_path = os.path.join(meta_dir, "graph_template.xml")
+    base_path = os.path.join(data_dir, "base.xml")
+    evolution_path = os.path.join(data_dir, "evolution_a.xml")
+    base_graph = load_graph(base_path)
+    evolution_xml = xml_from_file(evolution_path)
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        output_path = os.path.join(work_dir, "graph_a.xml")
+        puml_path = os.path.join(work_dir, "graph_a.puml")
+        binary_path = os.path.join(work_dir, "base.mbg")
+        write_graph_binary(base_graph, binary_path)
+        evolved_graph = base_graph.fork()
+        parse_and_apply_operations(evolution_xml, evolved_graph)
+        serialize_graph(evolved_graph, output_path, template_path)
+        evolved_xml = xml_from_file(output_path)
+
+        stages = {
+            "parse_graph": lambda: lambda: parse_graph(xml_from_file(base_path)),
+            "load_graph": lambda: lambda: load_graph(base_path, graph_xsd),
+            "parse_and_apply_operations": lambda: (lambda graph: lambda: parse_and_apply_operations(evolution_xml, graph))(base_graph.fork()),
+            "serialize_graph": lambda: lambda: serialize_graph(evolved_graph, output_path, template_path),
+            "write_graph_binary": lambda: lambda: write_graph_binary(evolved_graph, os.path.join(work_dir, "graph_a.mbg")),
+            "load_graph_binary": lambda: lambda: load_graph_binary(binary_path),
+            "xml_to_puml": lambda: lambda: puml_to_file(evolved_xml, puml_path),
+            "graph_to_puml": lambda: lambda: puml_to_file(evolved_graph, puml_path),
+        }
+        results = {}
+        for name, function in stages.items():
+            logger.info("Stage: %s", name)
+            results[name] = measure(function, repeat)
+            logger.info("%s: %.4f s (min of %d), python peak %.1f MB", name, results[name]["min_seconds"], repeat,
+                        results[name]["python_peak_bytes"] / 2**20)
+    return results
+
+def git_commit() -> str:
+    try:
+        completed = subprocess.run(["git", "rev-parse", "HEAD"], cwd=TOOLS_DIR, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    except OSError:
+        return None
+    return completed.stdout.strip() if completed.returncode == 0 else None
+
+def add_size_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--groups", type=int, default=100, help="number of groups (default: 100)")
+    parser.add_argument("--nodes", type=int, default=10000, help="number of nodes (default: 10000)")
+    parser.add_argument("--properties", type=int, default=3, help="number of properties per node (default: 3)")
+    parser.add_argument("--edges", type=int, default=20000, help="number of directed edges (default: 20000)")
+    parser.add_argument("--operations", type=int, default=2000, help="number of operations per evolution (default: 2000)")
+    parser.add_argument("--semantics", type=int, default=8, help="number of distinct edge semantics (default: 8)")
+    parser.add_argument("--operations-per-edit", type=int, default=10, help="number of operations per semantic edit (default: 10)")
+    parser.add_argument("--seed", type=int, default=0, help="random seed (default: 0)")
+
+def generate_from_args(args, output_dir: str) -> dict:
+    return generate_data_point(output_dir, args.meta_dir, args.groups, args.nodes, args.properties, args.edges,
+                               args.operations, args.semantics, args.operations_per_edit, args.seed)
+
+def main():
+    parser = argparse.ArgumentParser(description="Synthetic data generation and benchmarks for the evolution and conversion tools.")
+    parser.add_argument("--meta-dir", default=DEFAULT_META_DIR, help="the directory containing the schemas and graph template")
+    parser.add_argument("--log-level", choices=LOG_LEVELS.keys(), default="info", help="(default: info)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    generate_parser = commands.add_parser("generate", help="write a synthetic data point")
+    generate_parser.add_argument("output_dir", help="the data point directory to write")
+    add_size_arguments(generate_parser)
+
+    run_parser = commands.add_parser("run", help="benchmark all pipeline stages and write the results as JSON")
+    run_parser.add_argument("--data-dir", default=None, help="benchmark this data point instead of a synthetic one")
+    run_parser.add_argument("--repeat", type=int, default=3, help="timed repetitions per stage (default: 3)")
+    run_parser.add_argument("--output", default="benchmark_results.json", help="the results file (default: benchmark_results.json)")
+    add_size_arguments(run_parser)
+
+    args = parser.parse_args()
+    configure_logging(args.log_level)
+
+    if args.command == "generate":
+        coverage = generate_from_args(args, args.output_dir)
+        logger.info("Generated operations: %s", coverage)
+        return 0
+
+    with tempfile.TemporaryDirectory() as synthetic_dir:
+        parameters = {"data_dir": args.data_dir, "repeat": args.repeat}
+        data_dir = args.data_dir
+        if data_dir is None:
+            data_dir = synthetic_dir
+            for name in ["groups", "nodes", "properties", "edges", "operations", "semantics", "operations_per_edit", "seed"]:
+                parameters[name] = getattr(args, name)
+            parameters["coverage"] = generate_from_args(args, data_dir)
+        parameters["input_bytes"] = {name: os.path.getsize(os.path.join(data_dir, name))
+                                     for name in ["base.xml", "evolution_a.xml", "evolution_b.xml"]}
+        stages = run_benchmark(data_dir, args.meta_dir, args.repeat)
+
+    results = {
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "lxml": ".".join(str(part) for part in etree.LXML_VERSION),
+        "parameters": parameters,
+        "stages": stages,
+    }
+    with open(args.output, "w") as output_file:
+        json.dump(results, output_file, indent=1)
+    logger.info("Results written to %s", args.output)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -16,8 +16,24 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 '''
 
 from lxml import etree
+import argparse
+import io
+import logging
+import os
 import sys
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "auto_evolv"))
+from validation import add_validation_arguments, validator_from_args
+
+logger = logging.getLogger(__name__)
+
+# verbosity of the tool: quiet only reports problems, debug additionally dumps the generated PlantUML
+LOG_LEVELS = {
+    "quiet": logging.WARNING,
+    "info": logging.INFO,
+    "debug": logging.DEBUG,
+}
+
 def xml_from_file(file_path):
     input_root = etree.parse(file_path)
     return input_root
@@ -30,51 +46,357 @@ def xsd_from_file(file_path):
 def validate_xml_xsd(xml_root, xsd):
     return xsd.validate(xml_root)
 
-def xml_to_puml(input_root):
-    puml = ""
-    context = etree.iterwalk(input_root, events=("start", "end"))
-    for action, elem in context:
+def write_xml_puml(input_root, write):
+    for action, elem in etree.iterwalk(input_root, events=("start", "end")):
         tag = elem.tag.removeprefix("{http://mergebench.org/ns}")
         
         if action == "start":
             if tag == "Graph":
-                puml += "@startuml\n"
-            if tag == "Group":
-                puml += "package %s {\n" % elem.get("name")
-            if tag == "Node":
-                puml += "object %s {\n" % elem.get("name")
-            if tag == "Property":
-                puml += elem.get("name") + "\n"
-            if tag == "DirectedEdge":
-                puml += "%s --> %s : %s\n" % (elem.get("start"), elem.get("end"), elem.get("semantics"))
+                write("@startuml\n")
+            elif tag == "Group":
+                write("package %s {\n" % elem.get("name"))
+            elif tag == "Node":
+                write("object %s {\n" % elem.get("name"))
+            elif tag == "Property":
+                write(elem.get("name") + "\n")
+            elif tag == "DirectedEdge":
+                write("%s --> %s : %s\n" % (elem.get("start"), elem.get("end"), elem.get("semantics")))
             
-        if action == "end":
+        else:
             if tag == "Graph":
-                puml += "@enduml\n"
-            if tag == "Group":
-                puml += "}\n"
-            if tag == "Node":
-                puml += "}\n"
-        
-    print("generated puml:\n %s" % puml)
-    return puml
+                write("@enduml\n")
+            elif tag == "Group" or tag == "Node":
+                write("}\n")
+
+def write_graph_puml(graph, write):
+    write("@startuml\n")
+    for group in graph.groups:
+        write("package %s {\n" % group.name)
+        for node in group.nodes:
+            write("object %s {\n" % node.name)
+            for property_name in node.properties:
+                write(property_name + "\n")
+            write("}\n")
+        write("}\n")
+    for edge in graph.directed_edges:
+        write("%s --> %s : %s\n" % (edge.start, edge.end, edge.semantics))
+    write("@enduml\n")
+
+def is_graph(source) -> bool:
+    return hasattr(source, "directed_edges")
+
+def stream_with(write_puml, output_file):
+    if logger.isEnabledFor(logging.DEBUG):
+        buffer = io.StringIO()
+        write_puml(buffer.write)
+        puml = buffer.getvalue()
+        logger.debug("generated puml:\n%s", puml)
+        output_file.write(puml)
+    else:
+        write_puml(output_file.write)
+
+def stream_puml(source, output_file):
+    '''
+    Writes the PlantUML diagram of source line by line into output_file. source is either a parsed
+    graph model (tree or element) or an in-memory Graph of auto_evolv/evolve.py, which produce the same diagram.
+    '''
+    if is_graph(source):
+        stream_with(lambda write: write_graph_puml(source, write), output_file)
+    else:
+        stream_with(lambda write: write_xml_puml(source, write), output_file)
+
+def puml_to_file(source, output_path):
+    with open(output_path, "w") as output_file:
+        stream_puml(source, output_file)
+
+# PARTITIONING OF LARGE DIAGRAMS
+
+SPLIT_MODES = ["group", "component"]
+
+class Outline:
+    '''
+    The groups, nodes and edges of a graph model or Graph in document order, as needed to partition its diagram.
+    '''
+
+    def __init__(self):
+        # group name -> list of (node name, property names)
+        self.groups: dict[str, list[tuple[str, list[str]]]] = {}
+        # node name -> group name
+        self.node_groups: dict[str, str] = {}
+        self.edges: list[tuple[str, str, str]] = []
+
+    def size(self) -> int:
+        return len(self.node_groups) + len(self.edges)
+
+    def group_of(self, name: str) -> str:
+        '''
+        Returns the group an edge end belongs to: the group itself or the group of the node, None if unknown.
+        '''
+        if name in self.groups:
+            return name
+        return self.node_groups.get(name)
+
+def outline_from_graph(graph) -> Outline:
+    outline = Outline()
+    for group in graph.groups:
+        nodes = [(node.name, list(node.properties)) for node in group.nodes]
+        outline.groups[group.name] = nodes
+        for node_name, _ in nodes:
+            outline.node_groups[node_name] = group.name
+    outline.edges = [(edge.start, edge.end, edge.semantics) for edge in graph.directed_edges]
+    return outline
+
+def outline_from_xml(input_root) -> Outline:
+    outline = Outline()
+    group_name = None
+    for _, elem in etree.iterwalk(input_root, events=("start",)):
+        tag = elem.tag.removeprefix("{http://mergebench.org/ns}")
+        if tag == "Group":
+            group_name = elem.get("name")
+            outline.groups[group_name] = []
+        elif tag == "Node":
+            properties = [child.get("name") for child in elem if child.tag.removeprefix("{http://mergebench.org/ns}") == "Property"]
+            outline.groups[group_name].append((elem.get("name"), properties))
+            outline.node_groups[elem.get("name")] = group_name
+        elif tag == "DirectedEdge":
+            outline.edges.append((elem.get("start"), elem.get("end"), elem.get("semantics")))
+    return outline
+
+class DiagramPart:
+    '''
+    A subset of the diagram: the groups and nodes drawn in it and the edges between them.
+    '''
+
+    def __init__(self):
+        self.groups: set[str] = set()
+        self.nodes: set[str] = set()
+        self.edges: list[tuple[str, str, str]] = []
+
+    def size(self) -> int:
+        return len(self.nodes) + len(self.edges)
+
+    def extend(self, other):
+        self.groups |= other.groups
+        self.nodes |= other.nodes
+        self.edges += other.edges
+
+def group_units(outline: Outline, part: DiagramPart = None) -> list[DiagramPart]:
+    '''
+    One unit per group of part (default: the whole diagram) with its nodes in part and the edges of part within the group.
+    Edges between groups only appear in the index.
+    '''
+    units = {}
+    for group_name, nodes in outline.groups.items():
+        if part is not None and group_name not in part.groups:
+            continue
+        unit = DiagramPart()
+        unit.groups.add(group_name)
+        unit.nodes.update(node_name for node_name, _ in nodes if part is None or node_name in part.nodes)
+        units[group_name] = unit
+    for edge in outline.edges if part is None else part.edges:
+        start_group = outline.group_of(edge[0])
+        if start_group is not None and start_group == outline.group_of(edge[1]):
+            units[start_group].edges.append(edge)
+    return list(units.values())
+
+def component_units(outline: Outline, threshold: int) -> list[DiagramPart]:
+    '''
+    One unit per weakly connected component of the edges, in the order of their first element.
+    Packages are drawn in every unit that contains one of their nodes or the group itself.
+    Components with more than threshold nodes and edges are split further per group.
+    '''
+    parents = {}
+
+    def find(name: str) -> str:
+        root = name
+        while parents[root] != root:
+            root = parents[root]
+        while parents[name] != root:
+            parents[name], name = root, parents[name]
+        return root
+
+    for group_name, nodes in outline.groups.items():
+        parents[group_name] = group_name
+        for node_name, _ in nodes:
+            parents[node_name] = node_name
+    for start, end, _ in outline.edges:
+        parents.setdefault(start, start)
+        parents.setdefault(end, end)
+        start_root = find(start)
+        end_root = find(end)
+        if start_root != end_root:
+            parents[end_root] = start_root
+
+    units = {}
+
+    def unit_of(name: str) -> DiagramPart:
+        root = find(name)
+        if root not in units:
+            units[root] = DiagramPart()
+        return units[root]
+
+    for group_name, nodes in outline.groups.items():
+        for node_name, _ in nodes:
+            unit = unit_of(node_name)
+            unit.nodes.add(node_name)
+            unit.groups.add(group_name)
+    for edge in outline.edges:
+        unit = unit_of(edge[0])
+        unit.edges.append(edge)
+        for edge_end in edge[:2]:
+            if edge_end in outline.groups:
+                unit.groups.add(edge_end)
+    for group_name, nodes in outline.groups.items():
+        if not nodes:
+            unit_of(group_name).groups.add(group_name)
+    split_units = []
+    for unit in units.values():
+        split_units += group_units(outline, unit) if unit.size() > threshold else [unit]
+    return split_units
+
+def pack_units(units: list[DiagramPart], threshold: int) -> list[DiagramPart]:
+    '''
+    Packs consecutive units into parts of at most threshold nodes and edges.
+    A unit that is larger on its own becomes a part of its own.
+    '''
+    parts = []
+    part = None
+    for unit in units:
+        if part is not None and part.size() + unit.size() <= threshold:
+            part.extend(unit)
+            continue
+        part = DiagramPart()
+        part.extend(unit)
+        parts.append(part)
+    oversized = [part.size() for part in parts if part.size() > threshold]
+    if oversized:
+        logger.warning("%d of %d diagram parts exceed the split threshold of %d nodes and edges (largest: %d)",
+                       len(oversized), len(parts), threshold, max(oversized))
+    return parts
+
+def write_part_puml(outline: Outline, part: DiagramPart, write):
+    write("@startuml\n")
+    for group_name, nodes in outline.groups.items():
+        if group_name not in part.groups:
+            continue
+        write("package %s {\n" % group_name)
+        for node_name, properties in nodes:
+            if node_name not in part.nodes:
+                continue
+            write("object %s {\n" % node_name)
+            for property_name in properties:
+                write(property_name + "\n")
+            write("}\n")
+        write("}\n")
+    for edge in part.edges:
+        write("%s --> %s : %s\n" % edge)
+    write("@enduml\n")
+
+def write_index_puml(outline: Outline, parts: list[DiagramPart], part_names: list[str], write):
+    '''
+    The overview of a split diagram: every group as an object listing its number of nodes and the parts it is
+    drawn in, and one edge per pair of groups connected by edges, labeled with their number.
+    '''
+    group_parts = {}
+    for part, part_name in zip(parts, part_names):
+        for group_name in part.groups:
+            group_parts.setdefault(group_name, []).append(part_name)
+    group_edges = {}
+    for start, end, _ in outline.edges:
+        start_group = outline.group_of(start)
+        end_group = outline.group_of(end)
+        if start_group is not None and end_group is not None and start_group != end_group:
+            group_edges[(start_group, end_group)] = group_edges.get((start_group, end_group), 0) + 1
+    write("@startuml\n")
+    for group_name, nodes in outline.groups.items():
+        write("object %s {\n" % group_name)
+        write("%d nodes\n" % len(nodes))
+        for part_name in group_parts.get(group_name, []):
+            write(part_name + "\n")
+        write("}\n")
+    for (start_group, end_group), count in group_edges.items():
+        write("%s --> %s : %d edges\n" % (start_group, end_group, count))
+    write("@enduml\n")
+
+def part_paths(output_path: str, count: int) -> list[str]:
+    root, extension = os.path.splitext(output_path)
+    return ["%s.part%d%s" % (root, index + 1, extension) for index in range(count)]
+
+def remove_part_files(output_path: str):
+    '''
+    Removes the parts (and their renderings) of an earlier split of the diagram at output_path.
+    '''
+    root, _ = os.path.splitext(output_path)
+    directory = os.path.dirname(output_path) or "."
+    prefix = os.path.basename(root) + ".part"
+    for entry in os.scandir(directory):
+        name_root, extension = os.path.splitext(entry.name)
+        if name_root.startswith(prefix) and name_root[len(prefix):].isdigit() and extension in (".puml", ".png"):
+            os.remove(entry.path)
+
+def split_puml_to_files(source, output_path: str, threshold: int = None, mode: str = "group") -> list[str]:
+    '''
+    Writes the diagram of source to output_path like puml_to_file, unless it has more than threshold nodes and edges.
+    Then it is split into parts of about threshold nodes and edges each, per group or per connected component (mode),
+    written to <name>.part<N>.puml, and output_path gets an index diagram of the groups only.
+    Returns the paths of all written files, the diagram at output_path first.
+    '''
+    if mode not in SPLIT_MODES:
+        raise Exception("Unknown split mode: %s" % mode)
+    remove_part_files(output_path)
+    if threshold is None:
+        puml_to_file(source, output_path)
+        return [output_path]
+    outline = outline_from_graph(source) if is_graph(source) else outline_from_xml(source)
+    if outline.size() <= threshold:
+        puml_to_file(source, output_path)
+        return [output_path]
+
+    units = group_units(outline) if mode == "group" else component_units(outline, threshold)
+    parts = pack_units(units, threshold)
+    paths = part_paths(output_path, len(parts))
+    part_names = [os.path.basename(path) for path in paths]
+    for part, path in zip(parts, paths):
+        with open(path, "w") as output_file:
+            stream_with(lambda write: write_part_puml(outline, part, write), output_file)
+    with open(output_path, "w") as output_file:
+        stream_with(lambda write: write_index_puml(outline, parts, part_names, write), output_file)
+    logger.info("Split diagram of %d nodes and edges into %d parts by %s", outline.size(), len(parts), mode)
+    return [output_path] + paths
+
+def xml_to_puml(input_root):
+    buffer = io.StringIO()
+    stream_puml(input_root, buffer)
+    return buffer.getvalue()
+
+def configure_logging(level: str):
+    logging.basicConfig(level=LOG_LEVELS[level], format="%(message)s", stream=sys.stdout, force=True)
 
 def main():
-    first_arg_xml = sys.argv[1]
-    second_arg_xsd = sys.argv[2]
-    third_arg_output = sys.argv[3]
-    
-    xml = xml_from_file(first_arg_xml)
-    xsd = xsd_from_file(second_arg_xsd)
+    parser = argparse.ArgumentParser(description="Convert a graph model into a PlantUML diagram.")
+    parser.add_argument("graph_xml", help="the graph model")
+    parser.add_argument("graph_xsd", help="the graph metamodel (graph.xsd)")
+    parser.add_argument("output_path", help="the PlantUML file to write")
+    parser.add_argument("--log-level", choices=LOG_LEVELS.keys(), default="info",
+                        help="quiet only reports problems, debug also dumps the generated PlantUML (default: info)")
+    parser.add_argument("--split-threshold", type=int, default=None, metavar="N",
+                        help="split diagrams with more than N nodes and edges into parts and an index diagram of the groups")
+    parser.add_argument("--split-mode", choices=SPLIT_MODES, default="group",
+                        help="split per group or per connected component (default: group)")
+    add_validation_arguments(parser)
+    args = parser.parse_args()
+    configure_logging(args.log_level)
     
-    is_valid = validate_xml_xsd(xml, xsd)
-    print("Valid input:" + str(is_valid))
+    xml = xml_from_file(args.graph_xml)
     
-    puml_string = xml_to_puml(xml)
+    # an invalid model stops the run, no diagram is written
+    if not validator_from_args(args).validate(args.graph_xml, args.graph_xsd, xml):
+        logger.error("Valid input: False")
+        return 1
+    logger.info("Valid input: True")
     
-    output_file = open(third_arg_output, "w")
-    output_file.write(puml_string)
-    output_file.close()
+    split_puml_to_files(xml, args.output_path, args.split_threshold, args.split_mode)
+    return 0
     
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
\ No newline at end of file
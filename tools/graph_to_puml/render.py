@@ -0,0 +1,205 @@
+'''
+Copyright (C) 2024 Karl Kegel
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+'''
+
+from collections import deque
+import argparse
+import logging
+import os
+import queue
+import subprocess
+import sys
+import threading
+
+from convert import LOG_LEVELS, configure_logging
+
+logger = logging.getLogger(__name__)
+
+# PlantUML prints this line after every diagram it read from stdin in pipe mode
+PIPE_DELIMITER = b"___MERGEBENCH_PLANTUML_DIAGRAM___"
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+class RenderJob:
+    def __init__(self, puml_path: str, png_path: str, key: str = None):
+        self.puml_path: str = puml_path
+        self.png_path: str = png_path
+        # identifies the owner of the job (e.g. the data point) in the failures
+        self.key: str = key
+
+class RenderFailure:
+    def __init__(self, job: RenderJob, message: str):
+        self.job: RenderJob = job
+        self.message: str = message
+
+    def __str__(self):
+        return "%s: %s" % (self.job.puml_path, self.message)
+
+class PlantUMLProcess:
+    '''
+    A long-lived PlantUML JVM in pipe mode: diagrams are written to its stdin one after another,
+    each one is answered with the PNG followed by PIPE_DELIMITER on stdout.
+    '''
+
+    def __init__(self, plantuml_jar: str, java: str = "java"):
+        self.process = subprocess.Popen([java, "-Djava.awt.headless=true", "-jar", plantuml_jar,
+                                         "-pipe", "-tpng", "-charset", "UTF-8", "-pipeNoStderr",
+                                         "-pipedelimitor", PIPE_DELIMITER.decode()],
+                                        stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        self.pending: bytes = b""
+        # the last lines PlantUML or the JVM wrote to stderr, reported if the process dies
+        self.stderr_lines: deque = deque(maxlen=20)
+        self.stderr_thread = threading.Thread(target=self.drain_stderr, daemon=True)
+        self.stderr_thread.start()
+
+    def drain_stderr(self):
+        for line in self.process.stderr:
+            line = line.decode("utf-8", errors="replace").rstrip()
+            logger.debug("plantuml: %s", line)
+            self.stderr_lines.append(line)
+
+    def render(self, source: bytes) -> bytes:
+        try:
+            self.process.stdin.write(source)
+            if not source.endswith(b"\n"):
+                self.process.stdin.write(b"\n")
+            self.process.stdin.flush()
+        except OSError:
+            self.raise_exited()
+        output = self.read_until_delimiter()
+        if not output.startswith(PNG_SIGNATURE):
+            raise Exception(output.decode("utf-8", errors="replace").strip() or "PlantUML returned no image")
+        return output
+
+    def read_until_delimiter(self) -> bytes:
+        buffer = self.pending
+        searched = 0
+        while True:
+            index = buffer.find(PIPE_DELIMITER, searched)
+            if index >= 0:
+                rest = buffer[index + len(PIPE_DELIMITER):]
+                self.pending = rest[2:] if rest.startswith(b"\r\n") else rest[1:] if rest.startswith(b"\n") else rest
+                return buffer[:index]
+            searched = max(0, len(buffer) - len(PIPE_DELIMITER))
+            chunk = self.process.stdout.read1(65536)
+            if not chunk:
+                self.raise_exited()
+            buffer += chunk
+
+    def raise_exited(self):
+        status = self.process.wait()
+        self.stderr_thread.join(timeout=1)
+        message = "PlantUML exited with status %d" % status
+        if self.stderr_lines:
+            message += ": " + " / ".join(self.stderr_lines)
+        raise Exception(message)
+
+    def close(self):
+        try:
+            self.process.stdin.close()
+        except OSError:
+            pass
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+
+class PlantUMLRenderer:
+    '''
+    Renders .puml files into PNGs asynchronously: submit() only queues the file, a background thread
+    feeds the queue into a single PlantUML process, so the JVM is started (and warmed up) once per run
+    and rendering overlaps with whatever the caller does next. If PlantUML dies it is restarted for the
+    next job. close() waits for all queued jobs and returns the failed ones.
+    '''
+
+    def __init__(self, plantuml_jar: str, java: str = "java"):
+        self.plantuml_jar: str = plantuml_jar
+        self.java: str = java
+        self.process: PlantUMLProcess = None
+        self.jobs: queue.Queue = queue.Queue()
+        self.failures: list[RenderFailure] = []
+        self.rendered: int = 0
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def submit(self, puml_path: str, png_path: str = None, key: str = None):
+        if png_path is None:
+            png_path = os.path.splitext(puml_path)[0] + ".png"
+        self.jobs.put(RenderJob(puml_path, png_path, key))
+
+    def close(self) -> list[RenderFailure]:
+        self.jobs.put(None)
+        self.thread.join()
+        return self.failures
+
+    def run(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                break
+            try:
+                self.render(job)
+                self.rendered += 1
+            except Exception as e:
+                # reported by the owner after close(), logging here would interleave with its output
+                self.failures.append(RenderFailure(job, str(e)))
+        if self.process is not None:
+            self.process.close()
+            self.process = None
+
+    def render(self, job: RenderJob):
+        with open(job.puml_path, "rb") as puml_file:
+            source = puml_file.read()
+        if self.process is None:
+            self.process = PlantUMLProcess(self.plantuml_jar, self.java)
+        try:
+            png = self.process.render(source)
+        except Exception:
+            # the stream position of a failed diagram is unknown, start over with a fresh process
+            self.process.close()
+            self.process = None
+            raise
+        # write to a temporary file first so that an interrupted run never leaves a truncated PNG behind
+        temporary_path = job.png_path + ".tmp"
+        with open(temporary_path, "wb") as png_file:
+            png_file.write(png)
+        os.replace(temporary_path, job.png_path)
+
+def main():
+    parser = argparse.ArgumentParser(description="Render PlantUML files into PNGs with a single PlantUML process.")
+    parser.add_argument("plantuml_jar", help="the PlantUML jar")
+    parser.add_argument("puml_paths", nargs="+", help="the PlantUML files, each one is rendered next to itself")
+    parser.add_argument("--log-level", choices=LOG_LEVELS.keys(), default="info",
+                        help="quiet only reports problems, debug also shows the PlantUML output (default: info)")
+    args = parser.parse_args()
+    configure_logging(args.log_level)
+
+    with PlantUMLRenderer(args.plantuml_jar) as renderer:
+        for puml_path in args.puml_paths:
+            renderer.submit(puml_path)
+    for failure in renderer.failures:
+        logger.error("Rendering failed: %s", failure)
+    logger.info("Rendered %d of %d diagrams", renderer.rendered, len(args.puml_paths))
+    return 1 if renderer.failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())